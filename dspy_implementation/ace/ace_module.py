@@ -16,7 +16,7 @@ from typing import Optional
 # Project imports
 _project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(_project_root))
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever  # type: ignore
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever  # type: ignore
 from MMESGBench.src.eval.eval_score import eval_score  # type: ignore
 
 from .playbook import Playbook
@@ -89,7 +89,7 @@ class ACERAGModule:
             api_key: API key (for OpenAI client, defaults to OPENAI_API_KEY env var)
             base_url: Base URL (for OpenAI client, defaults to OPENAI_API_BASE env var)
         """
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         self.playbook = Playbook()
         
         # Initialize LLM client
@@ -17,7 +17,7 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
 from dspy_implementation.baseline.baseline_prompts import GENERATOR_PROMPT
 from src.evaluation_utils import eval_score
 
@@ -81,7 +81,7 @@ def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1',
     
     # Initialize retriever
     print("\n  Initializing retriever...")
-    retriever = DSPyPostgresRetriever()
+    retriever = get_shared_retriever()
     
     # Prepare output file path
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -22,7 +22,7 @@ sys.path.insert(0, str(project_root))
 sys.path.insert(0, str(project_root / "dc_repo"))
 
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
 from dspy_implementation.dc.prompt_manager import get_prompts
 from dynamic_cheatsheet.utils.extractor import extract_answer, extract_cheatsheet
 from dynamic_cheatsheet.utils.execute_code import extract_and_run_python_code
@@ -623,7 +623,7 @@ def evaluate_dc(
     
     # Initialize retriever
     print("\n  Initializing retriever...")
-    retriever = DSPyPostgresRetriever()
+    retriever = get_shared_retriever()
     
     # Prepare output file path
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
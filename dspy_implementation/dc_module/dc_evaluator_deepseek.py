@@ -18,7 +18,7 @@ sys.path.insert(0, str(project_root))
 sys.path.insert(0, str(project_root / 'dc_repo'))
 
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
 from src.evaluation_utils import eval_score
 from dynamic_cheatsheet.language_model import LanguageModel
 
@@ -39,7 +39,7 @@ class DCEvaluatorDeepSeek:
         # Note: We need to use the dashscope/ prefix for DashScope models
         self.model_name = model_name
         self.lm = LanguageModel(f"dashscope/{model_name}")
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         
         print(f"✅ DC-CU initialized with DeepSeek")
         print(f"   Model: {model_name}")
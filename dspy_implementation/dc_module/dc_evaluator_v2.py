@@ -28,7 +28,7 @@ from dynamic_cheatsheet.language_model import LanguageModel
 
 # Import our utilities
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
 from src.evaluation import eval_score
 from langchain_community.embeddings import DashScopeEmbeddings
 
@@ -54,7 +54,7 @@ class DCEvaluatorV2:
             dc_model = model_name
         
         self.lm = LanguageModel(model_name=dc_model)
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         
         # For DC-RS: embedding model
         api_key = os.getenv("DASHSCOPE_API_KEY")
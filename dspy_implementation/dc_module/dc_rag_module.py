@@ -10,7 +10,7 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
 from dspy_implementation.dc_module.dc_wrapper import DCWrapper
 from dspy_implementation.dc_module.dc_prompts import GENERATOR_PROMPT, CURATOR_PROMPT, CURATOR_PROMPT_RS
 import numpy as np
@@ -40,7 +40,7 @@ class DCRAGModule:
             model_name: Model to use (default: qwen2.5-7b-instruct)
             variant: DC variant - "cumulative" or "retrieval_synthesis"
         """
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         self.dc = DCWrapper(model_name)
         self.cheatsheet = "(empty)"  # Start with empty cheatsheet
         self.variant = variant
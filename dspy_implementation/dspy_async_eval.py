@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Concurrent RAG evaluation with asyncio
+
+Evaluation loops are network-bound (one DashScope round-trip per question),
+so questions are dispatched concurrently through the RAG module's async
+path (`acall` -> `aforward`), capped by a semaphore.
+
+run_pipelined splits retrieval and generation into two stages instead:
+batched retrieval fills a bounded queue that generation workers drain, so
+pgvector/embedding latency overlaps with LLM latency.
+
+All runs share one long-lived event loop (in a background thread) rather
+than a fresh asyncio.run() loop per call, so pooled async HTTP connections
+(dspy_http) stay usable across checkpoint chunks.
+"""
+
+import os
+import sys
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Union
+
+import dspy
+from tqdm import tqdm
+
+# Max in-flight DashScope requests (tune to account RPM/TPM limits)
+DEFAULT_MAX_CONCURRENT = int(os.getenv("DASHSCOPE_MAX_CONCURRENT", "8"))
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _run(coro):
+    """
+    Run a coroutine on the shared evaluation event loop and wait for its result.
+
+    The task is created in a copy of the caller's context, so ContextVar
+    state - e.g. DSPy's dspy.context(lm=...) overrides - carries over to the
+    loop thread as it would with asyncio.run().
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="AsyncEvalLoop", daemon=True).start()
+
+    context = contextvars.copy_context()
+    result = concurrent.futures.Future()
+
+    def finish(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start():
+        context.run(_loop.create_task, coro).add_done_callback(finish)
+
+    _loop.call_soon_threadsafe(start)
+    return result.result()
+
+
+def progress_bar(iterable=None, **kwargs) -> tqdm:
+    """
+    tqdm for evaluation loops: refreshes at most every 2s and is disabled
+    when stderr is not a terminal (log files, nohup), so optimizer-driven
+    evaluations don't pay for per-iteration redraws.
+    """
+    kwargs.setdefault('mininterval', 2.0)
+    kwargs.setdefault('disable', not sys.stderr.isatty())
+    return tqdm(iterable, **kwargs)
+
+
+async def _arun_rag(rag_module, examples, max_concurrent: int, progress) -> list:
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def run_one(example):
+        async with semaphore:
+            try:
+                return await rag_module.acall(
+                    question=example.question,
+                    doc_id=example.doc_id,
+                    answer_format=example.answer_format
+                )
+            finally:
+                progress.update(1)
+
+    return await asyncio.gather(
+        *(run_one(example) for example in examples),
+        return_exceptions=True
+    )
+
+
+def run_rag_concurrently(rag_module, examples, desc: str = "Evaluation",
+                         max_concurrent: Optional[int] = None,
+                         progress: Optional[tqdm] = None) -> List[Union[dspy.Prediction, Exception]]:
+    """
+    Run a RAG module over examples concurrently.
+
+    Args:
+        rag_module: DSPy module implementing aforward(question, doc_id, answer_format)
+        examples: List of DSPy examples
+        desc: Description for progress bar (ignored if progress is given)
+        max_concurrent: Max in-flight questions (default: DASHSCOPE_MAX_CONCURRENT or 8)
+        progress: Optional existing tqdm bar to advance (for chunked/checkpointed loops)
+
+    Returns:
+        List aligned with examples: a dspy.Prediction, or the Exception
+        raised for that question
+    """
+    max_concurrent = max_concurrent or DEFAULT_MAX_CONCURRENT
+
+    if progress is not None:
+        return _run(_arun_rag(rag_module, examples, max_concurrent, progress))
+
+    with progress_bar(total=len(examples), desc=desc) as progress:
+        return _run(_arun_rag(rag_module, examples, max_concurrent, progress))
+
+
+async def _arun_rag_batched(batched_rag, examples, max_groups: int, progress) -> list:
+    semaphore = asyncio.Semaphore(max_groups)
+    groups = {}
+    for idx, example in enumerate(examples):
+        groups.setdefault(example.doc_id, []).append(idx)
+
+    results: list = [None] * len(examples)
+
+    async def run_group(indices):
+        async with semaphore:
+            try:
+                predictions = await batched_rag.aforward_batch([examples[i] for i in indices])
+            except Exception as e:
+                predictions = [e] * len(indices)
+            finally:
+                progress.update(len(indices))
+        for i, pred in zip(indices, predictions):
+            results[i] = pred
+
+    await asyncio.gather(*(run_group(indices) for indices in groups.values()))
+    return results
+
+
+def run_rag_batched(batched_rag, examples, desc: str = "Evaluation",
+                    max_concurrent: Optional[int] = None,
+                    progress: Optional[tqdm] = None) -> List[Union[dspy.Prediction, Exception]]:
+    """
+    Run a BatchedBaselineRAG over examples, one aforward_batch per document.
+
+    Documents run concurrently; each keeps up to its question count of
+    reasoning calls in flight, so max_concurrent is divided by the batch
+    size to bound the requests in flight.
+
+    Returns:
+        List aligned with examples, as run_rag_concurrently
+    """
+    max_concurrent = max_concurrent or DEFAULT_MAX_CONCURRENT
+    max_groups = max(1, max_concurrent // batched_rag.batch_size)
+
+    if progress is not None:
+        return _run(_arun_rag_batched(batched_rag, examples, max_groups, progress))
+
+    with progress_bar(total=len(examples), desc=desc) as progress:
+        return _run(_arun_rag_batched(batched_rag, examples, max_groups, progress))
+
+
+def with_failed_placeholders(results, failed_answer: str = "Failed") -> List[dspy.Prediction]:
+    """
+    Predictions from run_rag_concurrently / run_rag_batched results, with
+    each failed question reported and replaced by a placeholder answer
+    (scored as incorrect, so metrics stay aligned with the examples).
+    """
+    predictions = []
+    for pred in results:
+        if isinstance(pred, Exception):
+            tqdm.write(f"\n⚠️  Error on question: {pred}")
+            pred = dspy.Prediction(answer=failed_answer)
+        predictions.append(pred)
+    return predictions
+
+
+async def _arun_pipelined(retrieve_batch, generate, examples, num_workers: int,
+                          batch_size: int, queue_size: int, progress, on_result) -> list:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    results = {}
+    ordered = []
+
+    async def produce():
+        for start in range(0, len(examples), batch_size):
+            batch = examples[start:start + batch_size]
+            try:
+                # Retrieval is blocking (DB + embedding API) - run it off the event loop
+                contexts = await asyncio.to_thread(retrieve_batch, batch)
+            except Exception as e:
+                contexts = [e] * len(batch)
+            for offset, (example, context) in enumerate(zip(batch, contexts)):
+                await queue.put((start + offset, example, context))
+        for _ in range(num_workers):
+            await queue.put(None)
+
+    async def consume():
+        while (job := await queue.get()) is not None:
+            idx, example, context = job
+            try:
+                if isinstance(context, Exception):
+                    raise context
+                results[idx] = await generate(example, context)
+            except Exception as e:
+                results[idx] = e
+            progress.update(1)
+
+            # Hand results over in example order (e.g. for append-only checkpoints)
+            while len(ordered) in results:
+                result = results.pop(len(ordered))
+                if on_result is not None:
+                    on_result(len(ordered), result)
+                ordered.append(result)
+
+    await asyncio.gather(produce(), *(consume() for _ in range(num_workers)))
+    return ordered
+
+
+def iter_prefetched(chunks: Iterable[list], prefetch: Callable[[list], Any]) -> Iterator[list]:
+    """
+    Yield chunks while prefetch(next chunk) runs in a background thread.
+
+    For chunked (checkpointed) loops: e.g. retrieval for chunk i+1 runs
+    while chunk i waits on the LLM, so the next chunk starts with its
+    contexts already cached. Prefetch is best-effort - failures are ignored
+    and the work is simply redone inline.
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="Prefetch") as executor:
+        chunks = iter(chunks)
+        chunk = next(chunks, None)
+        while chunk:
+            next_chunk = next(chunks, None)
+            if next_chunk:
+                executor.submit(prefetch, next_chunk)
+            yield chunk
+            chunk = next_chunk
+
+
+def run_pipelined(retrieve_batch: Callable[[Sequence], List[str]],
+                  generate: Callable[[Any, str], Any], examples: Sequence,
+                  desc: str = "Evaluation", num_workers: Optional[int] = None,
+                  batch_size: int = 25, queue_size: int = 64,
+                  on_result: Optional[Callable[[int, Any], None]] = None,
+                  progress: Optional[tqdm] = None) -> list:
+    """
+    Two-stage retrieval -> generation pipeline over examples.
+
+    A producer retrieves contexts batch by batch into a bounded queue;
+    num_workers generation coroutines drain it concurrently.
+
+    Args:
+        retrieve_batch: Blocking fn(examples) -> contexts aligned with examples
+        generate: Async fn(example, context) -> prediction
+        examples: Examples to run
+        desc: Description for progress bar (ignored if progress is given)
+        num_workers: Concurrent generation calls (default: DASHSCOPE_MAX_CONCURRENT or 8)
+        batch_size: Examples per retrieve_batch call
+        queue_size: Max retrieved contexts waiting for generation
+        on_result: Optional fn(index, result) called in example order as
+                   results complete
+        progress: Optional existing tqdm bar to advance
+
+    Returns:
+        List aligned with examples: the prediction, or the Exception
+        raised for that example (retrieval or generation)
+    """
+    num_workers = num_workers or DEFAULT_MAX_CONCURRENT
+    args = (retrieve_batch, generate, examples, num_workers, batch_size, queue_size)
+
+    if progress is not None:
+        return _run(_arun_pipelined(*args, progress, on_result))
+
+    with progress_bar(total=len(examples), desc=desc) as progress:
+        return _run(_arun_pipelined(*args, progress, on_result))
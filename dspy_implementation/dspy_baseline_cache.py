@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Persistent baseline evaluation results
+
+The unoptimized student baseline on the dev set only changes when the
+model, the student program (instructions, demos, signatures), the
+evaluated questions or the evaluation setup change, so GEPA
+runs reuse one stored result instead of re-running ~93 questions each
+time. Results live in CACHE_PATH as baseline_{model}_{key}.json.
+"""
+
+import sys
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import dspy
+import orjson
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.config import config
+
+
+def baseline_cache_file(model_name: str, examples, program: dspy.Module, **setup) -> Path:
+    """
+    Cache path for a baseline evaluation.
+
+    Args:
+        model_name: Student model name
+        examples: Evaluated DSPy examples (keyed by doc_id + question, in order)
+        program: Evaluated student program; its class and dump_state()
+                 (per-predictor instructions, demos, signature fields) are
+                 part of the key, so prompt edits invalidate the stored result
+        **setup: Other settings that change results (e.g. extraction_batch_size)
+    """
+    digest = hashlib.sha1(orjson.dumps({
+        'examples': [(ex.doc_id, ex.question) for ex in examples],
+        'program': [type(program).__name__, program.dump_state()],
+        'setup': setup
+    }, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+    return Path(config.storage.cache_path) / f"baseline_{model_name}_{digest[:8]}.json"
+
+
+def load_baseline(cache_file: Path) -> Optional[Tuple[Dict[str, Any], List[dspy.Prediction]]]:
+    """(results, predictions) stored at cache_file, or None if there is none."""
+    if not cache_file.exists():
+        return None
+    with open(cache_file, 'rb') as f:
+        data = orjson.loads(f.read())
+    # JSON object keys are strings - restore the None (unanswerable) format key
+    results = data['results']
+    if 'by_format' in results:
+        results['by_format'] = {
+            (None if fmt == 'null' else fmt): stats for fmt, stats in results['by_format'].items()
+        }
+    return results, [dspy.Prediction(**p) for p in data['predictions']]
+
+
+def save_baseline(cache_file: Path, results: Dict[str, Any], predictions: List[dspy.Prediction]):
+    """Store baseline metrics and predictions at cache_file."""
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(cache_file, 'wb') as f:
+        # OPT_NON_STR_KEYS: by_format is keyed by None for unanswerable questions
+        f.write(orjson.dumps(
+            {'results': results, 'predictions': [p.toDict() for p in predictions]},
+            option=orjson.OPT_NON_STR_KEYS
+        ))
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Batching LMs for DSPy
+
+- OfflineBatchLM: buffers chat requests from concurrent DSPy threads and
+  submits them as one DashScope Batch API job (file upload -> batch job ->
+  poll -> results). Intended for throughput-bound runs such as
+  optimizer.compile(), where per-call latency does not matter but RPM
+  limits and per-token cost do.
+- BatchLM: online dynamic batching. Requests queued within a short window
+  are dispatched together as one burst of parallel async requests, so the
+  server sees batched prefill instead of a trickle of single prompts.
+"""
+
+import os
+import copy
+import json
+import time
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+
+import dspy
+import litellm
+from openai import OpenAI
+
+logger = logging.getLogger(__name__)
+
+DASHSCOPE_API_BASE = 'https://dashscope.aliyuncs.com/compatible-mode/v1'
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+class OfflineBatchLM(dspy.LM):
+    """
+    dspy.LM that routes requests through the Batch API.
+
+    Each forward() call enqueues its request and blocks until the batch it
+    belongs to finishes. A batch is submitted once `batch_size` requests are
+    queued, or `max_wait_s` after the first queued request - so throughput
+    depends on callers running concurrently (e.g. MIPROv2 num_threads, or
+    asyncio callers - aforward() waits for its batch in a worker thread).
+
+    Usage:
+        with dspy.context(lm=OfflineBatchLM('qwen2.5-7b-instruct')):
+            optimized = optimizer.compile(student=rag, trainset=train_set)
+    """
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None,
+                 api_base: str = DASHSCOPE_API_BASE, batch_size: int = 16,
+                 max_wait_s: float = 5.0, poll_interval_s: float = 15.0,
+                 max_resubmits: int = 2, **kwargs):
+        """
+        Args:
+            model_name: DashScope model name (e.g., 'qwen2.5-7b-instruct')
+            api_key: DashScope API key (default: DASHSCOPE_API_KEY)
+            api_base: OpenAI-compatible endpoint
+            batch_size: Submit once this many requests are queued
+            max_wait_s: Submit a partial batch after this many seconds
+            poll_interval_s: Seconds between batch status checks
+            max_resubmits: Times failed items are resubmitted before erroring
+            **kwargs: Passed to dspy.LM (temperature, max_tokens, ...)
+        """
+        api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        if not api_key:
+            raise ValueError("DASHSCOPE_API_KEY not found in environment")
+
+        super().__init__(model=f'openai/{model_name}', api_key=api_key,
+                         api_base=api_base, **kwargs)
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_s
+        self.poll_interval_s = poll_interval_s
+        self.max_resubmits = max_resubmits
+        self.client = OpenAI(api_key=api_key, base_url=api_base)
+
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._next_id = 0
+
+    def __deepcopy__(self, memo):
+        """Copies (e.g. from LM.copy()) get their own queue; locks and timers can't be deep-copied."""
+        new = copy.copy(self)
+        new.kwargs = dict(self.kwargs)
+        new.callbacks = list(self.callbacks)
+        new.history = []
+        new._lock = threading.Lock()
+        new._pending = []
+        new._timer = None
+        return new
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        kwargs = {**self.kwargs, **kwargs}
+        # Batch bodies go straight to the provider - drop DSPy/LiteLLM-only args
+        for key in ('api_key', 'api_base', 'cache', 'rollout_id', 'num_retries'):
+            kwargs.pop(key, None)
+
+        body = {
+            'model': self.model_name,
+            'messages': messages or [{"role": "user", "content": prompt}],
+            **kwargs
+        }
+
+        future = Future()
+        with self._lock:
+            self._pending.append({'custom_id': str(self._next_id), 'body': body, 'future': future})
+            self._next_id += 1
+
+            if len(self._pending) >= self.batch_size:
+                batch = self._take_pending()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_wait_s, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if batch:
+            self._run_batch(batch)
+
+        return future.result()
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        # forward() blocks until the batch job finishes - wait in a worker
+        # thread so concurrent async callers still land in the same batch
+        return await asyncio.to_thread(self.forward, prompt=prompt, messages=messages, **kwargs)
+
+    def _take_pending(self) -> List[Dict[str, Any]]:
+        """Detach queued requests (caller holds the lock)."""
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            self._timer = None
+            batch = self._take_pending()
+        if batch:
+            self._run_batch(batch)
+
+    def _run_batch(self, items: List[Dict[str, Any]]):
+        """Submit items, resubmitting only failed ones, and resolve futures."""
+        try:
+            remaining = items
+            for attempt in range(self.max_resubmits + 1):
+                results, errors = self._submit_and_wait(remaining)
+
+                for item in remaining:
+                    if item['custom_id'] in results:
+                        item['future'].set_result(litellm.ModelResponse(**results[item['custom_id']]))
+
+                remaining = [item for item in remaining if item['custom_id'] not in results]
+                if not remaining:
+                    return
+
+                logger.warning(f"Batch attempt {attempt + 1}: {len(remaining)}/{len(items)} requests failed, resubmitting")
+
+            for item in remaining:
+                item['future'].set_exception(RuntimeError(
+                    f"Batch request failed after {self.max_resubmits} resubmits: "
+                    f"{errors.get(item['custom_id'], 'no result returned')}"
+                ))
+
+        except Exception as e:
+            logger.error(f"Batch submission error: {e}")
+            for item in items:
+                if not item['future'].done():
+                    item['future'].set_exception(e)
+
+    def _submit_and_wait(self, items: List[Dict[str, Any]]):
+        """
+        Run one batch job.
+
+        Returns:
+            Tuple of ({custom_id: response_body}, {custom_id: error_message})
+        """
+        jsonl = "\n".join(
+            json.dumps({
+                'custom_id': item['custom_id'],
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': item['body']
+            }, ensure_ascii=False)
+            for item in items
+        )
+
+        input_file = self.client.files.create(
+            file=('batch_input.jsonl', jsonl.encode('utf-8')),
+            purpose='batch'
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        logger.info(f"Submitted batch {batch.id} ({len(items)} requests)")
+
+        while batch.status not in TERMINAL_STATUSES:
+            time.sleep(self.poll_interval_s)
+            batch = self.client.batches.retrieve(batch.id)
+
+        results, errors = {}, {}
+
+        if batch.output_file_id:
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get('response') or {}
+                if response.get('status_code') == 200:
+                    results[record['custom_id']] = response['body']
+                else:
+                    errors[record['custom_id']] = record.get('error') or response
+
+        if batch.error_file_id:
+            for line in self.client.files.content(batch.error_file_id).text.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    errors[record['custom_id']] = record.get('error') or record.get('response')
+
+        logger.info(f"Batch {batch.id} {batch.status}: {len(results)} ok, {len(errors)} failed")
+        return results, errors
+
+
+class BatchLM(dspy.LM):
+    """
+    dspy.LM that micro-batches requests to a wrapped LM (vLLM-style dynamic batching).
+
+    The OpenAI chat API takes one prompt per request, so a "batch" is a burst
+    of parallel aforward() calls to the wrapped LM, fired together. A
+    background event loop collects queued requests and flushes once
+    `max_batch` are waiting or `max_wait_ms` after the first. Each caller
+    gets its response as soon as its own request completes, not when the
+    slowest request of its burst does.
+
+    Works for thread-based callers (forward) and asyncio callers (aforward);
+    batches only fill up when callers run concurrently, e.g.
+    run_rag_concurrently() or MIPROv2 num_threads.
+
+    Usage:
+        dspy.configure(lm=BatchLM(student_lm, max_batch=32, max_wait_ms=25))
+    """
+
+    def __init__(self, lm: dspy.LM, max_batch: int = 32, max_wait_ms: float = 25.0,
+                 max_concurrent_batches: int = 2):
+        """
+        Args:
+            lm: Wrapped LM that performs the requests (e.g., CachedLM)
+            max_batch: Flush once this many requests are queued
+            max_wait_ms: Flush a partial batch this long after its first request
+            max_concurrent_batches: Caps in-flight requests at
+                                    max_batch * max_concurrent_batches
+        """
+        # Mirror the wrapped LM's config (model, kwargs, callbacks, ...)
+        self.__dict__.update(lm.__dict__)
+        self.history = []
+
+        self.lm = lm
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+
+    def __deepcopy__(self, memo):
+        """Copies share the wrapped LM but run their own batching loop."""
+        new = copy.copy(self)
+        new.kwargs = dict(self.kwargs)
+        new.callbacks = list(self.callbacks)
+        new.history = []
+        new._lock = threading.Lock()
+        new._loop = None
+        new._queue = None
+        return new
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        return self._submit(prompt, messages, kwargs).result()
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        return await asyncio.wrap_future(self._submit(prompt, messages, kwargs))
+
+    def _submit(self, prompt, messages, kwargs):
+        """Queue one request on the batching loop; returns a concurrent Future."""
+        loop = self._ensure_loop()
+        request = {'prompt': prompt, 'messages': messages, **self.kwargs, **kwargs}
+        return asyncio.run_coroutine_threadsafe(self._enqueue(request), loop)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background event loop and batch consumer on first use."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="BatchLM", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._start_consumer(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _start_consumer(self):
+        self._queue = asyncio.Queue()
+        # One slot per in-flight request, released as each request completes,
+        # so a slow request doesn't hold back the next burst
+        self._request_slots = asyncio.Semaphore(self.max_batch * self.max_concurrent_batches)
+        self._consumer = asyncio.create_task(self._consume())
+        self._inflight = set()
+
+    async def _enqueue(self, request: Dict[str, Any]):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, future))
+        return await future
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            for _ in batch:
+                await self._request_slots.acquire()
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        """Fire a batch: one task per request, resolving its caller's future on completion."""
+        logger.debug(f"BatchLM flushing {len(batch)} requests")
+        for request, future in batch:
+            task = asyncio.create_task(self.lm.aforward(**request))
+            self._inflight.add(task)
+            task.add_done_callback(functools.partial(self._resolve, future))
+
+    def _resolve(self, future: asyncio.Future, task: asyncio.Task):
+        self._inflight.discard(task)
+        self._request_slots.release()
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
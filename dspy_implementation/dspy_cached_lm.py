@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Persistent LM response cache for DSPy
+
+Optimizer trials and evaluation reruns send identical prompts to the same
+model over and over. CachedLM stores every completion on disk keyed by
+(model, messages, request kwargs), so repeats are served locally across
+processes and runs. Only deterministic (temperature 0) requests are cached:
+a sampled completion replayed on every rerun would turn "diverse" sampling
+(e.g. an optimizer's instruction proposals) into a fixed answer.
+
+An optional semantic layer can also serve near-duplicate prompts (cosine
+similarity >= threshold on an embedding of the full rendered prompt). It is
+off by default: rendered RAG prompts differ only in question/context, so a
+loose threshold can return another question's answer. Semantic hits are
+only looked up among prompts with identical instructions and demos (every
+message but the last user turn) and, with semantic_fields, the same values
+for e.g. doc_id/answer_format - so a response is never reused for another
+signature, optimized prompt or answer format.
+"""
+
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import dspy
+import litellm
+import numpy as np
+from diskcache import Cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / "cache" / "lm_cache"
+
+# DSPy ChatAdapter field markers: [[ ## answer_format ## ]]
+FIELD_MARKER = re.compile(r'\[\[ ## (\w+) ## \]\]')
+
+
+class CachedLM(dspy.LM):
+    """
+    dspy.LM with an on-disk exact-match response cache (+ optional semantic cache).
+
+    Usage:
+        lm = CachedLM(model='openai/qwen2.5-7b-instruct', api_key=..., api_base=...)
+        dspy.configure(lm=lm)
+    """
+
+    def __init__(self, model: str, cache_dir: Optional[str] = None,
+                 embed_fn: Optional[Callable[[str], List[float]]] = None,
+                 semantic_threshold: Optional[float] = None,
+                 semantic_fields: Sequence[str] = (), **kwargs):
+        """
+        Args:
+            model: LiteLLM model string (e.g., 'openai/qwen-max')
+            cache_dir: Cache directory (default: cache/lm_cache)
+            embed_fn: Text -> embedding function, required for the semantic layer
+            semantic_threshold: Cosine similarity for semantic hits (e.g., 0.97);
+                                None disables the semantic layer
+            semantic_fields: Input fields whose rendered values must match
+                             exactly for a semantic hit (e.g., doc_id, answer_format)
+            **kwargs: Passed to dspy.LM (api_key, api_base, temperature, ...)
+        """
+        # This class is the cache - skip DSPy's own request cache
+        kwargs.setdefault('cache', False)
+        super().__init__(model=model, **kwargs)
+
+        if semantic_threshold is not None and embed_fn is None:
+            raise ValueError("semantic_threshold requires embed_fn")
+
+        self.cache_dir = str(cache_dir or DEFAULT_CACHE_DIR)
+        self.embed_fn = embed_fn
+        self.semantic_threshold = semantic_threshold
+        self.semantic_fields = tuple(semantic_fields)
+
+        self._cache = Cache(self.cache_dir)
+        # One entry per semantic vector (response key -> (namespace, vector)),
+        # so each insert writes a single row
+        self._semantic_cache = Cache(str(Path(self.cache_dir) / "semantic"))
+        self._semantic_lock = threading.Lock()
+        # Per-namespace index: namespace -> (cache keys, normalized vectors)
+        self._semantic_keys: Dict[str, List[str]] = {}
+        self._semantic_vectors: Dict[str, np.ndarray] = {}
+
+        if semantic_threshold is not None:
+            self._load_semantic_index()
+
+    def __deepcopy__(self, memo):
+        # Copies share the cache handle (diskcache is process/thread safe)
+        new = dspy.LM.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.kwargs = dict(self.kwargs)
+        new.callbacks = list(self.callbacks)
+        new.history = []
+        return new
+
+    def _cache_key(self, messages, kwargs) -> str:
+        payload = json.dumps({'model': self.model, 'messages': messages, **kwargs},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _message_text(message) -> str:
+        content = message.get('content', '')
+        return content if isinstance(content, str) else json.dumps(content, default=str)
+
+    def _semantic_text(self, messages) -> str:
+        """The full rendered prompt: system instructions, demos and inputs"""
+        return "\n\n".join(f"{m.get('role', '')}: {self._message_text(m)}" for m in messages)
+
+    def _semantic_namespace(self, messages) -> str:
+        """
+        Hash of every message but the last user turn (instructions + demos),
+        signature field names, and the values of semantic_fields
+        """
+        user_turns = [i for i, m in enumerate(messages) if m.get('role') == 'user']
+        last = user_turns[-1] if user_turns else len(messages)
+        prefix = json.dumps(messages[:last] + messages[last + 1:], sort_keys=True, default=str)
+        inputs = self._message_text(messages[last]) if user_turns else ''
+
+        parts = [hashlib.sha256(prefix.encode('utf-8')).hexdigest(),
+                 ",".join(sorted(set(FIELD_MARKER.findall(inputs))))]
+        for field in self.semantic_fields:
+            match = re.search(rf'\[\[ ## {field} ## \]\]\n(.*?)\n', inputs)
+            parts.append(match.group(1).strip() if match else '')
+        return "|".join(parts)
+
+    def _load_semantic_index(self):
+        vectors: Dict[str, list] = {}
+        for key in self._semantic_cache.iterkeys():
+            entry = self._semantic_cache.get(key)
+            if entry is None:
+                continue
+            namespace, vec = entry
+            self._semantic_keys.setdefault(namespace, []).append(key)
+            vectors.setdefault(namespace, []).append(vec)
+        self._semantic_vectors = {ns: np.array(vecs, dtype=np.float32) for ns, vecs in vectors.items()}
+
+    def _semantic_lookup(self, namespace: str, vector: np.ndarray) -> Optional[str]:
+        with self._semantic_lock:
+            vectors = self._semantic_vectors.get(namespace)
+            if vectors is None:
+                return None
+            similarities = vectors @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.semantic_threshold:
+                return self._semantic_keys[namespace][best]
+        return None
+
+    def _semantic_add(self, namespace: str, key: str, vector: np.ndarray):
+        with self._semantic_lock:
+            self._semantic_keys.setdefault(namespace, []).append(key)
+            vectors = self._semantic_vectors.get(namespace)
+            row = vector[None, :]
+            self._semantic_vectors[namespace] = row if vectors is None else np.vstack([vectors, row])
+        self._semantic_cache.set(key, (namespace, vector.tolist()))
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    @staticmethod
+    def _from_cache(data: dict):
+        response = litellm.ModelResponse(**data)
+        response.cache_hit = True  # DSPy skips usage tracking for cache hits
+        return response
+
+    def _lookup(self, prompt, messages, kwargs):
+        """
+        Returns:
+            Tuple of (messages, key or None if the request isn't cacheable,
+                      cached_response_or_None, (namespace, semantic_vector) or None)
+        """
+        messages = messages or [{"role": "user", "content": prompt}]
+        request_kwargs = {k: v for k, v in {**self.kwargs, **kwargs}.items()
+                          if k not in ('api_key', 'api_base', 'cache') and v is not None}
+        if request_kwargs.get('temperature', 0.0) > 0:
+            return messages, None, None, None  # Sampled - always call the API
+
+        key = self._cache_key(messages, request_kwargs)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return messages, key, self._from_cache(cached), None
+
+        semantic = None
+        if self.semantic_threshold is not None:
+            semantic = (self._semantic_namespace(messages), self._embed(self._semantic_text(messages)))
+            similar_key = self._semantic_lookup(*semantic)
+            cached = self._cache.get(similar_key) if similar_key else None
+            if cached is not None:
+                logger.debug(f"Semantic cache hit for {key[:12]}")
+                return messages, key, self._from_cache(cached), None
+
+        return messages, key, None, semantic
+
+    def _store(self, key: Optional[str], response, semantic):
+        if key is None:
+            return
+        self._cache.set(key, response.model_dump())
+        if semantic is not None:
+            self._semantic_add(semantic[0], key, semantic[1])
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        messages, key, cached, semantic = self._lookup(prompt, messages, kwargs)
+        if cached is not None:
+            return cached
+
+        response = super().forward(prompt=prompt, messages=messages, **kwargs)
+        self._store(key, response, semantic)
+        return response
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        if self.semantic_threshold is None:
+            messages, key, cached, semantic = self._lookup(prompt, messages, kwargs)
+        else:
+            # Semantic lookups call the (blocking) embedding API - keep them
+            # off the event loop so concurrent requests don't serialize
+            messages, key, cached, semantic = await asyncio.to_thread(self._lookup, prompt, messages, kwargs)
+        if cached is not None:
+            return cached
+
+        response = await super().aforward(prompt=prompt, messages=messages, **kwargs)
+        self._store(key, response, semantic)
+        return response
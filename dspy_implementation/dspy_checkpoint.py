@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Append-only msgpack checkpoints for long evaluation runs
+
+Rewriting the full predictions list at every checkpoint makes checkpoint IO
+grow quadratically over a run. CheckpointWriter appends one msgpack record
+per prediction instead, written and fsync'd by a background thread so the
+evaluation loop never blocks on disk. checkpoint_record() keeps only the
+prediction fields a script reads back - by default answer and analysis;
+scripts whose metrics need more (e.g. the retrieved context) pass their
+own field list. DSPy internals are never stored. A write error in the
+background thread is re-raised from the next append() or from close().
+"""
+
+import os
+import queue
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+import msgpack
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Prediction fields persisted in checkpoints (default)
+CHECKPOINT_FIELDS = ('answer', 'analysis')
+
+
+def checkpoint_record(pred, fields: Sequence[str] = CHECKPOINT_FIELDS) -> Dict[str, Any]:
+    """
+    Selected fields of a prediction, for checkpointing.
+
+    Args:
+        pred: Prediction (or any object with the fields as attributes)
+        fields: Fields to keep (missing ones are stored as None)
+    """
+    return {field: getattr(pred, field, None) for field in fields}
+
+
+def as_prediction(record: Dict[str, Any]) -> SimpleNamespace:
+    """
+    Attribute view of a checkpoint record (.answer, .analysis, ...).
+
+    Resumed predictions are only read back for metrics and results, which
+    use attribute access - no need to rebuild dspy.Prediction objects.
+    """
+    return SimpleNamespace(**record)
+
+
+class CheckpointWriter:
+    """
+    Background writer appending records to a msgpack checkpoint file.
+
+    Usage:
+        with CheckpointWriter("checkpoint.msgpack") as checkpoint:
+            for pred in predictions:
+                checkpoint.append(checkpoint_record(pred))
+    """
+
+    def __init__(self, path: str, fsync_interval_s: float = 5.0):
+        """
+        Args:
+            path: msgpack checkpoint file (opened in append mode)
+            fsync_interval_s: Max seconds between flush + fsync to disk
+        """
+        self.path = path
+        self.fsync_interval_s = fsync_interval_s
+
+        self._queue: queue.Queue = queue.Queue()
+        self._packer = msgpack.Packer()
+        self._file = open(path, 'ab')
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._drain, name="CheckpointWriter", daemon=True)
+        self._thread.start()
+
+    def append(self, record: Dict[str, Any]):
+        """Queue one record for writing (non-blocking)."""
+        self._raise_error()
+        self._queue.put(record)
+
+    def close(self):
+        """Write all queued records, fsync and close the file."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError(f"Checkpoint writer for {self.path} failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _drain(self):
+        try:
+            self._write_records()
+        except BaseException as e:
+            logger.error(f"Checkpoint writer for {self.path} failed: {e}")
+            self._error = e
+
+    def _write_records(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.fsync_interval_s)
+            except queue.Empty:
+                self._sync()
+                continue
+
+            if record is _STOP:
+                self._sync()
+                return
+
+            self._file.write(self._packer.pack(record))
+
+
+def load_checkpoint(path: str) -> List[Dict[str, Any]]:
+    """
+    Load records from a msgpack checkpoint.
+
+    A truncated final record (process killed mid-write) is cut from the
+    file, so the run resumes from the last complete record and appends
+    cleanly.
+    """
+    if not os.path.exists(path):
+        return []
+
+    records = []
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        unpacker = msgpack.Unpacker(f, raw=False)
+        try:
+            # Iteration stops at the first incomplete record
+            for record in unpacker:
+                records.append(record)
+                valid_bytes = unpacker.tell()
+        except (ValueError, msgpack.UnpackException) as e:
+            logger.warning(f"Dropping corrupt checkpoint tail in {path}: {e}")
+
+    if valid_bytes < os.path.getsize(path):
+        logger.warning(f"Truncating incomplete checkpoint record in {path}")
+        os.truncate(path, valid_bytes)
+
+    return records
@@ -4,12 +4,27 @@ DSPy Dataset Wrapper for MMESGBench
 Handles dataset loading, corrections mapping, and train/dev/test splits
 """
 
+import sys
 import json
+import pickle
 import random
-from typing import List, Dict, Any
+import logging
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import dspy
 
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.config import config
+
+logger = logging.getLogger(__name__)
+
+# Bump when create_splits/to_dspy_examples change what they produce
+SPLITS_CACHE_VERSION = 1
+
+
 class MMESGBenchDataset:
     """Wrapper for MMESGBench dataset with corrected documents"""
 
@@ -26,15 +41,23 @@ class MMESGBenchDataset:
         # Make path absolute from project root
         self.dataset_path = project_root / dataset_path
 
-        # Load authoritative corrected dataset
-        self.data = self._load_dataset()
+        # Parsed data and splits are pickled; rebuilt when the dataset file changes
+        cache_file = Path(config.storage.cache_path) / "dataset_splits.pkl"
+        cached = self._load_cached_splits(cache_file)
+        if cached is not None:
+            self.data, splits = cached
+        else:
+            # Load authoritative corrected dataset
+            self.data = self._load_dataset()
 
         print(f"✅ Loaded {len(self.data)} questions from authoritative corrected dataset")
         print(f"   Dataset: {dataset_path}")
         print(f"   DSPy baseline: 45.1% (421/933)")
 
-        # Automatically create splits
-        splits = self.create_splits()
+        if cached is None:
+            # Automatically create splits
+            splits = self.create_splits()
+            self._save_cached_splits(cache_file, splits)
         self.train_set = splits['train']
         self.dev_set = splits['dev']
         self.test_set = splits['test']
@@ -45,6 +68,33 @@ class MMESGBenchDataset:
             data = json.load(f)
         return data
 
+    def _cache_key(self) -> Tuple:
+        stat = self.dataset_path.stat()
+        return (SPLITS_CACHE_VERSION, str(self.dataset_path), stat.st_mtime_ns, stat.st_size)
+
+    def _load_cached_splits(self, cache_file: Path) -> Optional[Tuple[List[Dict], Dict[str, List[dspy.Example]]]]:
+        """(data, splits) from cache_file if it was built from the current dataset file"""
+        if not cache_file.exists():
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load dataset cache {cache_file}: {e}")
+            return None
+        if cached.get('key') != self._cache_key():
+            return None
+        return cached['data'], cached['splits']
+
+    def _save_cached_splits(self, cache_file: Path, splits: Dict[str, List[dspy.Example]]):
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, 'wb') as f:
+                pickle.dump({'key': self._cache_key(), 'data': self.data, 'splits': splits},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Could not save dataset cache {cache_file}: {e}")
+
     def to_dspy_examples(self, split_data: List[Dict]) -> List[dspy.Example]:
         """
         Convert dataset to DSPy Example objects
@@ -170,6 +220,18 @@ class MMESGBenchDataset:
         return stats
 
 
+@lru_cache(maxsize=None)
+def get_dataset(dataset_path: str = "data/mmesgbench_dataset_corrected.json") -> MMESGBenchDataset:
+    """
+    Process-wide dataset per path.
+
+    Loading parses the full JSON and rebuilds the splits - scripts that run
+    several evaluations in one process share a single instance. Callers
+    must not modify the returned splits in place.
+    """
+    return MMESGBenchDataset(dataset_path)
+
+
 if __name__ == "__main__":
     print("=" * 60)
     print("MMESGBench Authoritative Dataset Loading")
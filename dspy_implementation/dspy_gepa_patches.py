@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+GEPA adapter patches
+
+DSPy's GEPA adapter builds the reflection prompt from every trajectory in
+the evaluated batch, so reflection_minibatch_size does not bound what the
+reflection LM (qwen-max) reads: prompts grow to hundreds of thousands of
+tokens, fail on context length and multiply reflection cost.
+
+cap_reflective_dataset() patches DspyAdapter.make_reflective_dataset to
+keep a seeded random sample of at most the optimizer's
+reflection_minibatch_size trajectories.
+
+parallel_instruction_proposer() builds a GEPA instruction_proposer that
+sends the reflection requests for all components being updated at once,
+instead of one component after another. reflection_kwargs() enables it (with
+component_selector='all') only when asked: updating every component per
+iteration changes GEPA's search, not just its speed.
+
+gepa_strategy() and parallel_reflection() read the GEPA_STRATEGY and
+GEPA_PARALLEL_REFLECTION switches shared by the GEPA scripts.
+"""
+
+import os
+import random
+import logging
+import functools
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Output budget for the reflection LM. The longest instruction GEPA has
+# accepted so far (reasoning.predict in
+# optimized_programs/gepa_skip_baseline_20251018_150806.json) is 7,749 chars /
+# 1,148 words, roughly 1.9k tokens before the ``` fences around it, so 2048
+# would truncate proposals of that size
+REFLECTION_MAX_TOKENS = 4096
+
+
+def gepa_strategy() -> str:
+    """
+    GEPA candidate_selection_strategy from GEPA_STRATEGY.
+
+    Dev runs default to 'current_best': each step mutates the best candidate
+    so far instead of sampling the Pareto front - fewer valset sweeps, less
+    diverse exploration. Set GEPA_STRATEGY=pareto for final runs.
+
+    Read at call time so values loaded by load_dotenv() are honoured.
+
+    Returns:
+        'current_best' or 'pareto'
+    """
+    return os.getenv('GEPA_STRATEGY', 'current_best')
+
+
+def parallel_reflection() -> bool:
+    """
+    Whether GEPA_PARALLEL_REFLECTION=1 is set.
+
+    When set, reasoning + extraction are updated every iteration, reflecting
+    on both concurrently (default: GEPA's round-robin selector). Pass the
+    result to reflection_kwargs().
+
+    Returns:
+        True if parallel reflection is enabled
+    """
+    return os.getenv('GEPA_PARALLEL_REFLECTION', '0') == '1'
+
+
+def cap_reflective_dataset(optimizer, seed: int = 42):
+    """
+    Bound the trajectories each GEPA reflection prompt is built from.
+
+    Call before GEPA.compile(). Idempotent: calling again replaces the cap.
+
+    Args:
+        optimizer: The GEPA optimizer; its reflection_minibatch_size is the
+                   max trajectories per reflection
+        seed: Seed for choosing which trajectories to keep
+    """
+    from dspy.teleprompt.gepa.gepa_utils import DspyAdapter
+
+    max_examples = optimizer.reflection_minibatch_size
+    original = getattr(DspyAdapter.make_reflective_dataset, '__wrapped__',
+                       DspyAdapter.make_reflective_dataset)
+    rng = random.Random(seed)
+
+    @functools.wraps(original)
+    def make_reflective_dataset(self, candidate, eval_batch, components_to_update):
+        trajectories = eval_batch.trajectories or []
+        if len(trajectories) > max_examples:
+            keep = sorted(rng.sample(range(len(trajectories)), max_examples))
+            logger.info(f"Reflective dataset capped: {len(trajectories)} -> {max_examples} trajectories")
+            # Slice every per-example list (outputs, scores, trajectories,
+            # objective scores, ...) so they stay aligned
+            per_example = {
+                field.name: [value[i] for i in keep]
+                for field in dataclasses.fields(eval_batch)
+                if isinstance(value := getattr(eval_batch, field.name), list)
+                and len(value) == len(trajectories)
+            }
+            eval_batch = dataclasses.replace(eval_batch, **per_example)
+        return original(self, candidate, eval_batch, components_to_update)
+
+    DspyAdapter.make_reflective_dataset = make_reflective_dataset
+
+
+def parallel_instruction_proposer(reflection_lm, max_workers: int = 4):
+    """
+    GEPA instruction_proposer that reflects on each component concurrently.
+
+    Uses GEPA's default reflection prompt, so proposals match the built-in
+    proposer; only the requests overlap. Pair with component_selector='all'
+    so an iteration updates several components (round-robin updates one).
+
+    Args:
+        reflection_lm: LM that proposes new instructions (e.g. qwen-max)
+        max_workers: Max reflection requests in flight
+
+    Returns:
+        Callable(candidate, reflective_dataset, components_to_update) -> {name: instruction}
+    """
+    from gepa.strategies.instruction_proposal import InstructionProposalSignature
+
+    def propose_one(candidate, reflective_dataset, name):
+        return InstructionProposalSignature.run(
+            lm=lambda prompt: reflection_lm(prompt)[0],
+            input_dict={
+                "current_instruction_doc": candidate[name],
+                "dataset_with_feedback": reflective_dataset[name]
+            }
+        )["new_instruction"]
+
+    def propose(candidate, reflective_dataset, components_to_update):
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(components_to_update)))) as pool:
+            instructions = pool.map(
+                lambda name: propose_one(candidate, reflective_dataset, name), components_to_update
+            )
+            return dict(zip(components_to_update, instructions))
+
+    return propose
+
+
+def reflection_kwargs(reflection_lm, parallel: bool) -> dict:
+    """
+    GEPA component selection / instruction proposal kwargs.
+
+    Args:
+        reflection_lm: LM that proposes new instructions (e.g. qwen-max)
+        parallel: Update every component each iteration, reflecting on them
+                  concurrently. False keeps GEPA's defaults (round-robin,
+                  built-in proposer)
+
+    Returns:
+        Dict of GEPA(...) keyword arguments (empty for the defaults)
+    """
+    if not parallel:
+        return {}
+    return {
+        'component_selector': 'all',
+        'instruction_proposer': parallel_instruction_proposer(reflection_lm),
+    }
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP/2 sessions for DashScope calls made through LiteLLM
+
+By default LiteLLM builds OpenAI clients per request configuration, so long
+runs can pay for repeated TLS handshakes to dashscope.aliyuncs.com. These
+helpers install process-wide keep-alive httpx clients (HTTP/2, so many
+concurrent requests share one connection) as LiteLLM's client sessions.
+
+Open them for the lifetime of an optimization run (e.g. between
+tracker.start_run() and tracker.end_run()) so sockets close cleanly.
+
+Note: the async client's connections belong to the event loop that opened
+them. Async callers should share one long-lived loop - BatchLM runs all its
+requests on its own background loop, and dspy_async_eval runs every
+concurrent evaluation on a single shared loop.
+"""
+
+import asyncio
+import logging
+
+import httpx
+import litellm
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_settings(max_connections: int, http2: bool, keepalive_expiry_s: float,
+                   timeout_s: float) -> dict:
+    return dict(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry_s
+        ),
+        timeout=httpx.Timeout(timeout_s, connect=10.0)
+    )
+
+
+def pooled_async_client(max_connections: int = 64, http2: bool = True,
+                        keepalive_expiry_s: float = 60.0, timeout_s: float = 600.0) -> httpx.AsyncClient:
+    """
+    Keep-alive httpx client for direct OpenAI-SDK callers, e.g.
+    AsyncOpenAI(..., http_client=pooled_async_client()). The SDK's default
+    pool is sized below typical evaluation concurrency.
+
+    Args: as for open_pooled_sessions
+    """
+    return httpx.AsyncClient(**_pool_settings(max_connections, http2, keepalive_expiry_s, timeout_s))
+
+
+def open_pooled_sessions(max_connections: int = 64, http2: bool = True,
+                         keepalive_expiry_s: float = 60.0, timeout_s: float = 600.0):
+    """
+    Route LiteLLM requests through shared keep-alive httpx clients.
+
+    Args:
+        max_connections: Max pooled (and keep-alive) connections per client
+        http2: Multiplex concurrent requests over HTTP/2 (needs `h2`)
+        keepalive_expiry_s: Idle seconds before a pooled connection is closed
+        timeout_s: Read timeout for a completion request
+    """
+    close_pooled_sessions()
+
+    settings = _pool_settings(max_connections, http2, keepalive_expiry_s, timeout_s)
+    litellm.client_session = httpx.Client(**settings)
+    litellm.aclient_session = httpx.AsyncClient(**settings)
+
+    logger.info(f"Pooled HTTP sessions open (http2={http2}, max_connections={max_connections})")
+
+
+def close_pooled_sessions():
+    """Close the shared clients and restore LiteLLM's default sessions."""
+    if litellm.client_session is not None:
+        litellm.client_session.close()
+        litellm.client_session = None
+
+    if litellm.aclient_session is not None:
+        try:
+            asyncio.run(litellm.aclient_session.aclose())
+        except Exception as e:
+            # Connections opened on another (now closed) loop can't be closed
+            # gracefully; the sockets are released when the process exits
+            logger.debug(f"Async HTTP session close: {e}")
+        litellm.aclient_session = None
@@ -7,6 +7,16 @@ Uses exact MMESGBench evaluation logic for 100% compatibility
 import sys
 from pathlib import Path
 
+import numpy as np
+import orjson
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:  # Kernels below then run as plain Python loops
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
 # Add parent directory to import existing evaluation logic
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
@@ -137,35 +147,51 @@ def mmesgbench_combined(example, pred, trace=None):
 # Format-Specific Metrics (for analysis)
 # ============================================================================
 
-def accuracy_by_format(predictions, examples):
+def format_breakdown(formats, correct):
+    """
+    Correct/total counts per answer format, in one groupby.
+
+    Args:
+        formats: Answer format per question (None = unanswerable, kept as a key)
+        correct: Per-question correctness (bools or 0/1 scores)
+
+    Returns:
+        dict: {format: {'correct': int, 'total': int}} in first-seen format order
+    """
+    counts = pd.DataFrame({
+        'answer_format': pd.Series(list(formats), dtype=object),
+        'correct': np.asarray(correct, dtype=np.float64)
+    }).groupby('answer_format', dropna=False, sort=False)['correct'].agg(['sum', 'size'])
+
+    return {
+        (None if pd.isna(fmt) else fmt): {'correct': int(n_correct), 'total': int(total)}
+        for fmt, n_correct, total in zip(counts.index, counts['sum'], counts['size'])
+    }
+
+
+def accuracy_by_format(predictions, examples, scores=None):
     """
     Calculate accuracy breakdown by answer format.
 
     Args:
         predictions: List of DSPy predictions
         examples: List of DSPy examples
+        scores: Optional precomputed per-question scores (from score_predictions)
 
     Returns:
         dict: Accuracy for each format type
     """
-    format_stats = {}
+    if scores is None:
+        scores = score_predictions(predictions, examples)
 
-    for pred, example in zip(predictions, examples):
-        fmt = example.answer_format
-
-        if fmt not in format_stats:
-            format_stats[fmt] = {'correct': 0, 'total': 0}
-
-        is_correct = mmesgbench_accuracy(example, pred)
-        format_stats[fmt]['correct'] += is_correct
-        format_stats[fmt]['total'] += 1
+    format_stats = format_breakdown([ex.answer_format for ex in examples], scores)
 
     # Calculate percentages
     format_accuracy = {}
     for fmt, stats in format_stats.items():
         format_accuracy[fmt] = {
             'accuracy': stats['correct'] / stats['total'] if stats['total'] > 0 else 0.0,
-            'correct': int(stats['correct']),
+            'correct': stats['correct'],
             'total': stats['total']
         }
 
@@ -176,27 +202,98 @@ def accuracy_by_format(predictions, examples):
 # Batch Evaluation
 # ============================================================================
 
-def evaluate_predictions(predictions, examples):
+@njit(cache=True)
+def _int_match(gt: np.ndarray, pred: np.ndarray) -> np.ndarray:
+    """MMESGBench Int rule: int(float(gt)) == int(float(pred))."""
+    out = np.empty(gt.size, np.bool_)
+    for i in range(gt.size):
+        out[i] = int(gt[i]) == int(pred[i])
+    return out
+
+
+@njit(cache=True)
+def _float_match(gt: np.ndarray, pred: np.ndarray, rtol: float) -> np.ndarray:
+    """MMESGBench Float rule: relative tolerance w.r.t. ground truth."""
+    out = np.empty(gt.size, np.bool_)
+    for i in range(gt.size):
+        if gt[i] != 0.0:
+            out[i] = abs(gt[i] - pred[i]) / abs(gt[i]) <= rtol
+        else:
+            out[i] = abs(pred[i]) <= rtol
+    return out
+
+
+def _parse_float(value):
+    try:
+        parsed = float(str(value).strip())
+    except ValueError:
+        return None
+    return parsed if np.isfinite(parsed) else None
+
+
+def score_predictions(predictions, examples) -> np.ndarray:
+    """
+    Per-question MMESGBench accuracy (1.0/0.0).
+
+    Int/Float answers that parse as plain numbers are scored together by
+    the JIT kernels above; everything else (strings, lists, "Not
+    answerable", values like "1.3%") goes through mmesgbench_accuracy.
+
+    Args:
+        predictions: List of DSPy predictions
+        examples: List of DSPy examples
+
+    Returns:
+        np.ndarray of scores aligned with predictions
+    """
+    scores = np.zeros(min(len(predictions), len(examples)))
+    numeric = {'Int': ([], [], []), 'Float': ([], [], [])}
+
+    for i, (pred, example) in enumerate(zip(predictions, examples)):
+        predicted_answer = getattr(pred, 'answer', '') or getattr(pred, 'extracted_answer', '')
+        if example.answer_format in numeric:
+            gt_value, pred_value = _parse_float(example.answer), _parse_float(predicted_answer)
+            if gt_value is not None and pred_value is not None:
+                rows, gts, preds = numeric[example.answer_format]
+                rows.append(i)
+                gts.append(gt_value)
+                preds.append(pred_value)
+                continue
+        scores[i] = mmesgbench_accuracy(example, pred)
+
+    rows, gts, preds = numeric['Int']
+    if rows:
+        scores[rows] = _int_match(np.array(gts), np.array(preds))
+
+    rows, gts, preds = numeric['Float']
+    if rows:
+        scores[rows] = _float_match(np.array(gts), np.array(preds), 1e-3)
+
+    return scores
+
+
+def evaluate_predictions(predictions, examples, scores=None):
     """
     Evaluate a batch of predictions with comprehensive metrics.
 
     Args:
         predictions: List of DSPy predictions
         examples: List of DSPy examples
+        scores: Optional precomputed per-question scores (from score_predictions)
 
     Returns:
         dict: Comprehensive evaluation results
     """
     # Overall metrics
-    total_correct = 0
+    if scores is None:
+        scores = score_predictions(predictions, examples)
+    total_correct = float(scores.sum())
     total_predictions = len(predictions)
 
     # Collect results for F1 calculation
     results_for_f1 = []
 
     for pred, example in zip(predictions, examples):
-        is_correct = mmesgbench_accuracy(example, pred)
-        total_correct += is_correct
 
         # Collect for F1
         predicted_answer = getattr(pred, 'answer', '')
@@ -214,7 +311,7 @@ def evaluate_predictions(predictions, examples):
     _, overall_f1 = eval_acc_and_f1_mmesgbench(results_for_f1)
 
     # Format-specific breakdown
-    format_breakdown = accuracy_by_format(predictions, examples)
+    format_breakdown = accuracy_by_format(predictions, examples, scores)
 
     return {
         'accuracy': overall_accuracy,
@@ -225,6 +322,67 @@ def evaluate_predictions(predictions, examples):
     }
 
 
+def prediction_records(predictions, examples, scores=None):
+    """
+    Yield per-question result records for detailed results JSON.
+
+    `correct` comes from the given per-question scores; without them it is
+    exact string match, computed in one vectorized comparison instead of
+    per-row Python attribute access.
+
+    Args:
+        predictions: List of DSPy predictions
+        examples: List of DSPy examples (aligned with predictions)
+        scores: Optional per-question scores (from score_predictions), so
+                records agree with the reported accuracy
+
+    Yields:
+        dict: One record per question (question, doc_id, answer_format,
+              ground_truth, predicted_answer, correct)
+    """
+    examples = examples[:len(predictions)]
+    df = pd.DataFrame({
+        'question': [ex.question for ex in examples],
+        'doc_id': [ex.doc_id for ex in examples],
+        'answer_format': [ex.answer_format for ex in examples],
+        'ground_truth': [ex.answer for ex in examples],
+        'predicted_answer': [pred.answer for pred in predictions[:len(examples)]]
+    })
+    if scores is not None:
+        correct = np.asarray(scores[:len(df)], dtype=bool)
+    else:
+        correct = df['ground_truth'].values == df['predicted_answer'].values
+
+    for row, is_correct in zip(df.itertuples(index=False), correct):
+        yield {**row._asdict(), 'correct': bool(is_correct)}
+
+
+def write_results_json(output_file, results, records):
+    """
+    Write detailed results JSON, streaming the per-question records.
+
+    `results` (summary metrics) is written first; `records` is consumed one
+    item at a time into a trailing "predictions" array, so the full record
+    list is never materialized.
+
+    Args:
+        output_file: Output JSON path
+        results: Summary dict (must not contain "predictions")
+        records: Iterable of per-question dicts (e.g. prediction_records())
+    """
+    with open(output_file, 'wb') as f:
+        # OPT_NON_STR_KEYS: format breakdowns are keyed by None for
+        # unanswerable questions (written as "null", like json.dump)
+        header = orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        # Re-open the summary object to append the predictions array
+        f.write(header[:-2] + b',\n' if results else b'{\n')
+        f.write(b'  "predictions": [')
+
+        for i, record in enumerate(records):
+            f.write((b',\n    ' if i else b'\n    ') + orjson.dumps(record))
+
+        f.write(b'\n  ]\n}\n')
+
 if __name__ == "__main__":
     print("=" * 60)
     print("DSPy Metrics for MMESGBench")
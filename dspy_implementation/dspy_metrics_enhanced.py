@@ -5,9 +5,11 @@ Separates retrieval accuracy from answer accuracy
 """
 
 import re
+import ast
 import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 # Add parent directory for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -15,7 +17,32 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from mmesgbench_exact_evaluation import (
     evaluate_prediction_mmesgbench
 )
-from dspy_implementation.dspy_metrics import mmesgbench_accuracy
+from dspy_implementation.dspy_metrics import format_breakdown, mmesgbench_accuracy
+
+
+def _pages_key(evidence_pages) -> Any:
+    """Hashable form of evidence_pages (list in dataset, str in older splits)."""
+    if isinstance(evidence_pages, (list, tuple)):
+        return tuple(evidence_pages)
+    return str(evidence_pages)
+
+
+@lru_cache(maxsize=None)
+def _evidence_page_markers(pages_key) -> Tuple[str, ...]:
+    """
+    Lowercase page-reference strings for an example's evidence pages.
+
+    Computed once per distinct evidence_pages value instead of on every
+    metric call (the optimizer scores the same examples every trial).
+    """
+    # Evidence pages format: [61, 116, 25], "61, 116, 25" or "page 61"
+    page_numbers = re.findall(r'\d+', str(pages_key))
+    return tuple(
+        pattern
+        for page_num in page_numbers
+        for pattern in (f"page {page_num}", f"p. {page_num}", f"p.{page_num}",
+                        f"pg {page_num}", f"pg. {page_num}")
+    )
 
 
 def retrieval_accuracy(example, prediction, trace=None) -> float:
@@ -44,29 +71,59 @@ def retrieval_accuracy(example, prediction, trace=None) -> float:
     if not context:
         return 0.0
 
-    # Check if any evidence page numbers appear in context
-    # Evidence pages format: "61, 116, 25" or "page 61"
-    page_numbers = re.findall(r'\d+', str(evidence_pages))
-
-    # Look for page references in context
-    for page_num in page_numbers:
-        # Check various formats: "page 61", "Page 61", "p.61", etc.
-        patterns = [
-            f"page {page_num}",
-            f"Page {page_num}",
-            f"p. {page_num}",
-            f"p.{page_num}",
-            f"pg {page_num}",
-            f"pg. {page_num}"
-        ]
-        # Convert patterns to lowercase for case-insensitive matching
-        if any(pattern.lower() in context.lower() for pattern in patterns):
-            return 1.0
+    # Check if any evidence page reference appears in context
+    # (case-insensitive: "page 61", "p. 61", "p.61", "pg 61", ...)
+    context_lower = context.lower()
+    if any(marker in context_lower for marker in _evidence_page_markers(_pages_key(evidence_pages))):
+        return 1.0
 
     # No matching evidence pages found - retrieval failed
     return 0.0
 
 
+def _cheap_equal(predicted: Any, ground_truth: Any, answer_format: str) -> bool:
+    """
+    Cheap sufficient check for a correct answer.
+
+    True only when MMESGBench matching would also accept the answer: the
+    numeric rules for Int/Float (int(float()) equality, 0.1% tolerance
+    relative to ground truth), case-insensitive equality for Str, identical
+    item sets for List. False means "unknown" - fall through to full
+    matching (ANLS, substring and fuzzy list matching).
+    """
+    pred = str(predicted).strip().lower()
+    gt = str(ground_truth).strip().lower()
+
+    # Numeric formats never match on strings (e.g. "Not answerable" as Int fails)
+    if answer_format == 'Int':
+        try:
+            return int(float(pred)) == int(float(gt))
+        except (ValueError, OverflowError):
+            return False
+
+    if answer_format == 'Float':
+        try:
+            pred_value, gt_value = float(pred), float(gt)
+        except ValueError:
+            return False
+        if gt_value:
+            return abs(gt_value - pred_value) / abs(gt_value) <= 1e-3
+        return abs(pred_value) <= 1e-3
+
+    if pred == gt:
+        return True
+
+    if answer_format == 'List':
+        try:
+            pred_items, gt_items = ast.literal_eval(pred), ast.literal_eval(gt)
+        except (ValueError, SyntaxError):
+            return False
+        if isinstance(pred_items, list) and isinstance(gt_items, list):
+            return {str(i).strip() for i in pred_items} == {str(i).strip() for i in gt_items}
+
+    return False
+
+
 def answer_accuracy(example, prediction, trace=None) -> float:
     """
     Measure answer correctness using MMESGBench fuzzy matching.
@@ -82,6 +139,11 @@ def answer_accuracy(example, prediction, trace=None) -> float:
     Returns:
         1.0 if answer correct, 0.0 otherwise
     """
+    # Fast path: exact/numeric/list-set match needs no fuzzy matching
+    predicted = getattr(prediction, 'answer', '') or getattr(prediction, 'extracted_answer', '')
+    if predicted and _cheap_equal(predicted, example.answer, example.answer_format):
+        return 1.0
+
     # Use the existing mmesgbench_accuracy function
     return mmesgbench_accuracy(example, prediction, trace)
 
@@ -103,10 +165,11 @@ def end_to_end_accuracy(example, prediction, trace=None) -> float:
         1.0 if both retrieval and answer correct, 0.0 otherwise
     """
     retrieval_correct = retrieval_accuracy(example, prediction, trace)
-    answer_correct = answer_accuracy(example, prediction, trace)
+    if not retrieval_correct:
+        return 0.0  # Answer can't rescue a retrieval miss - skip answer grading
 
     # Both must be correct
-    return retrieval_correct * answer_correct
+    return retrieval_correct * answer_accuracy(example, prediction, trace)
 
 
 def compute_detailed_metrics(example, prediction, trace=None) -> Dict[str, float]:
@@ -126,10 +189,13 @@ def compute_detailed_metrics(example, prediction, trace=None) -> Dict[str, float
     Returns:
         Dictionary of metrics
     """
+    retrieval_correct = retrieval_accuracy(example, prediction, trace)
+    answer_correct = answer_accuracy(example, prediction, trace)
+
     return {
-        'retrieval_correct': retrieval_accuracy(example, prediction, trace),
-        'answer_correct': answer_accuracy(example, prediction, trace),
-        'end_to_end_correct': end_to_end_accuracy(example, prediction, trace)
+        'retrieval_correct': retrieval_correct,
+        'answer_correct': answer_correct,
+        'end_to_end_correct': retrieval_correct * answer_correct
     }
 
 
@@ -154,37 +220,46 @@ def evaluate_predictions_enhanced(predictions, examples) -> Dict[str, Any]:
             - total: Total examples evaluated
             - by_format: Breakdown by answer format
     """
-    total = len(examples)
+    rows = detailed_metric_rows(predictions, examples)
+    return aggregate_detailed_metrics(rows, [example.answer_format for example in examples[:len(rows)]],
+                                      total=len(examples))
 
-    retrieval_correct = 0
-    answer_correct = 0
-    end_to_end_correct = 0
 
-    # Track by answer format
-    format_stats = {}
+def detailed_metric_rows(predictions, examples) -> List[Dict[str, float]]:
+    """Per-question compute_detailed_metrics rows (aligned with predictions)."""
+    return [compute_detailed_metrics(example, pred) for pred, example in zip(predictions, examples)]
+
+
+def aggregate_detailed_metrics(rows, formats, total: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Aggregate per-question metric rows into evaluate_predictions_enhanced's summary.
 
-    for pred, example in zip(predictions, examples):
-        # Compute metrics
-        metrics = compute_detailed_metrics(example, pred)
-
-        retrieval_correct += metrics['retrieval_correct']
-        answer_correct += metrics['answer_correct']
-        end_to_end_correct += metrics['end_to_end_correct']
-
-        # Track by format
-        fmt = example.answer_format
-        if fmt not in format_stats:
-            format_stats[fmt] = {
-                'total': 0,
-                'retrieval_correct': 0,
-                'answer_correct': 0,
-                'end_to_end_correct': 0
-            }
-
-        format_stats[fmt]['total'] += 1
-        format_stats[fmt]['retrieval_correct'] += metrics['retrieval_correct']
-        format_stats[fmt]['answer_correct'] += metrics['answer_correct']
-        format_stats[fmt]['end_to_end_correct'] += metrics['end_to_end_correct']
+    Rows only need the three metric columns, so summaries can be recomputed
+    from saved per-question records (e.g. when merging sharded runs).
+
+    Args:
+        rows: Per-question dicts with retrieval/answer/end_to_end_correct
+        formats: Answer format per row
+        total: Question count (default: len(rows))
+
+    Returns:
+        Same dictionary as evaluate_predictions_enhanced
+    """
+    if total is None:
+        total = len(rows)
+
+    # One aggregation per metric column
+    format_stats = {}
+    totals = {}
+    for name in ('retrieval_correct', 'answer_correct', 'end_to_end_correct'):
+        column = [row[name] for row in rows]
+        totals[name] = sum(column)
+        for fmt, counts in format_breakdown(formats, column).items():
+            format_stats.setdefault(fmt, {'total': counts['total']})[name] = counts['correct']
+
+    retrieval_correct = totals['retrieval_correct']
+    answer_correct = totals['answer_correct']
+    end_to_end_correct = totals['end_to_end_correct']
 
     # Calculate format-specific accuracies
     for fmt in format_stats:
@@ -8,10 +8,26 @@ Key difference from standard metrics:
 - Helps GEPA's reflection LM understand failures and propose better prompts
 """
 
+import re
 from typing import Optional
 import dspy
 from src.evaluation import eval_score
 
+# Page markers in retrieved context: "[Page 12, score: 0.731]"
+PAGE_PATTERN = re.compile(r'\[Page (\d+)')
+
+
+def retrieval_failure_feedback(gold: dspy.Example, pred: dspy.Prediction) -> Optional[str]:
+    """
+    Reflection feedback for a prediction whose retrieval returned no context
+    (the RAG module skips generation and sets retrieval_failed), else None.
+    """
+    if not getattr(pred, 'retrieval_failed', False):
+        return None
+    return (f"\n🔍 RETRIEVAL FAILED: no context retrieved from {gold.doc_id}, so no answer was "
+            f"generated\n→ Not an extraction error - consider rephrasing the question for this "
+            f"document type")
+
 
 def mmesgbench_gepa_metric(
     gold: dspy.Example,
@@ -54,8 +70,7 @@ def mmesgbench_gepa_metric(
     retrieved_pages = set()
     if hasattr(pred, 'context') and pred.context:
         # Extract page numbers from context
-        import re
-        page_matches = re.findall(r'\[Page (\d+)', pred.context)
+        page_matches = PAGE_PATTERN.findall(pred.context)
         retrieved_pages = set(int(p) for p in page_matches)
 
     ground_truth_pages = set(gold.evidence_pages)
@@ -189,6 +204,10 @@ def mmesgbench_answer_only_gepa_metric(
         feedback_parts.append(f"Got: {predicted_answer}")
         feedback_parts.append(f"Similarity: {answer_score:.2f} (need ≥0.50)")
 
+        retrieval_feedback = retrieval_failure_feedback(gold, pred)
+        if retrieval_feedback:
+            feedback_parts.append(retrieval_feedback)
+
         # Type-specific guidance
         if answer_format == "Str":
             feedback_parts.append(f"\n→ Extract exact string from context")
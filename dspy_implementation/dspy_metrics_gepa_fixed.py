@@ -13,10 +13,15 @@ Key insight from GEPA source code:
 - ScoreWithFeedback is a Prediction subclass with .score and .feedback attributes
 """
 
+import re
 from typing import Optional, Union
 import dspy
 from dspy.primitives import Prediction
 from src.evaluation import eval_score
+from dspy_implementation.dspy_metrics_gepa import retrieval_failure_feedback
+
+# Page markers in retrieved context: "[Page 12, score: 0.731]"
+PAGE_PATTERN = re.compile(r'\[Page (\d+)')
 
 
 # Define ScoreWithFeedback class (from GEPA's dspy_adapter)
@@ -112,7 +117,12 @@ def mmesgbench_answer_only_gepa_metric(
     feedback_parts.append(f"Predicted Answer: {predicted_answer}")
     feedback_parts.append(f"Answer Type: {answer_format}")
 
-    # 3. Answer analysis
+    # 3. Retrieval (generation is skipped when nothing was retrieved)
+    retrieval_feedback = retrieval_failure_feedback(gold, pred)
+    if retrieval_feedback:
+        feedback_parts.append(retrieval_feedback)
+
+    # 4. Answer analysis
     if not answer_correct:
         feedback_parts.append(f"\n🎯 ANSWER ISSUE:")
 
@@ -130,7 +140,7 @@ def mmesgbench_answer_only_gepa_metric(
             feedback_parts.append(f"  → Extract all items in the list")
             feedback_parts.append(f"  → Ensure proper list formatting")
 
-    # 4. Actionable recommendation
+    # 5. Actionable recommendation
     feedback_parts.append(f"\n💡 RECOMMENDATION:")
     if answer_correct:
         feedback_parts.append(f"  ✅ Current prompts work well for this type of question")
@@ -179,8 +189,7 @@ def mmesgbench_full_gepa_metric(
     # Check retrieval correctness
     retrieved_pages = set()
     if hasattr(pred, 'context') and pred.context:
-        import re
-        page_matches = re.findall(r'\[Page (\d+)', pred.context)
+        page_matches = PAGE_PATTERN.findall(pred.context)
         retrieved_pages = set(int(p) for p in page_matches)
 
     ground_truth_pages = set(gold.evidence_pages)
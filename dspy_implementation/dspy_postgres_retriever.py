@@ -4,11 +4,19 @@ PostgreSQL-based DSPy Retriever using pgvector + LangChain
 Queries langchain_pg_embedding table for semantic similarity search
 """
 
+import os
 import sys
+import pickle
+import tempfile
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Optional, Tuple
 import logging
 import time
+import numpy as np
 
 # Add parent directory to path
 parent_dir = Path(__file__).parent.parent
@@ -16,11 +24,234 @@ sys.path.insert(0, str(parent_dir))
 
 from langchain_community.vectorstores import PGVector
 from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_community.embeddings.dashscope import embed_with_retry
+from langchain_core.embeddings import Embeddings
+from diskcache import Cache
+from sqlalchemy import create_engine, text
 from src.utils.config import config
 
 logger = logging.getLogger(__name__)
 
 
+def _atomic_pickle(obj, path: Path):
+    """
+    Pickle obj to path via a temp file + os.replace, so concurrent writers
+    (e.g. evaluate_full_dataset.py --workers processes saving the same
+    cache) never leave a truncated or interleaved file - the last complete
+    write wins.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Query-embedding cache in front of DashScope embeddings.
+
+    Retrieval queries repeat across MIPROv2/GEPA trials and re-evaluations,
+    so each distinct query string is embedded (a billable API call) once.
+    Cached vectors are pickled to disk so later runs start warm.
+
+    Vectors are held as float32 arrays - the precision pgvector stores and
+    compares at - instead of lists of Python floats (~8x less memory/disk).
+    """
+
+    # Max texts per DashScope embedding request (text-embedding-v3/v4 limit)
+    EMBED_BATCH_SIZE = 10
+
+    def __init__(self, embeddings: Embeddings, cache_file: Path):
+        self.embeddings = embeddings
+        self.cache_file = Path(cache_file)
+        self._cache: Dict[str, np.ndarray] = {}
+        self._dirty = False
+
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    # Older caches hold float lists - convert on load
+                    self._cache = {
+                        query: np.asarray(vector, dtype=np.float32)
+                        for query, vector in pickle.load(f).items()
+                    }
+                logger.info(f"Loaded {len(self._cache)} cached query embeddings from {self.cache_file}")
+            except Exception as e:
+                logger.warning(f"Could not load embedding cache {self.cache_file}: {e}")
+
+        atexit.register(self.save)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cache.get(text)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self._cache[text] = vector
+            self._dirty = True
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Document embeddings are only needed at indexing time
+        return self.embeddings.embed_documents(texts)
+
+    def warm(self, queries: Iterable[str]) -> int:
+        """Embed any queries not yet cached and persist. Returns number embedded."""
+        missing = [q for q in dict.fromkeys(queries) if q not in self._cache]
+        for start in range(0, len(missing), self.EMBED_BATCH_SIZE):
+            batch = missing[start:start + self.EMBED_BATCH_SIZE]
+            for query, vector in zip(batch, self._embed_query_batch(batch)):
+                self._cache[query] = np.asarray(vector, dtype=np.float32)
+                self._dirty = True
+        self.save()
+        return len(missing)
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one API request (query text_type, like embed_query)."""
+        if not isinstance(self.embeddings, DashScopeEmbeddings):
+            return [self.embeddings.embed_query(t) for t in texts]
+
+        # embed_documents would embed with text_type="document"; keep "query"
+        # so batched vectors match the ones embed_query returns
+        results = embed_with_retry(
+            self.embeddings, input=texts, text_type="query", model=self.embeddings.model
+        )
+        return [r["embedding"] for r in sorted(results, key=lambda r: r["text_index"])]
+
+    def save(self):
+        """Write cache to disk if new embeddings were added."""
+        if not self._dirty:
+            return
+        try:
+            _atomic_pickle(self._cache, self.cache_file)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"Could not save embedding cache {self.cache_file}: {e}")
+
+
+class SemanticRetrievalCache:
+    """
+    Approximate retrieval cache: near-duplicate questions reuse a context.
+
+    Questions on the same document are often rephrasings of one another.
+    Entries are (doc_id, query embedding, context); a lookup returns the
+    context of the most similar cached query for the same doc_id if cosine
+    similarity >= threshold. Candidates come from random-projection LSH
+    (num_tables hash tables of num_bits hyperplanes each), so a lookup
+    compares against a few buckets instead of every entry.
+
+    The oldest entry is evicted once capacity is reached (FIFO). Entries
+    are pickled to cache_file so resumed runs start warm.
+    """
+
+    def __init__(self, threshold: float = 0.97, num_tables: int = 16, num_bits: int = 8,
+                 capacity: int = 4096, cache_file: Optional[Path] = None, seed: int = 0):
+        """
+        Args:
+            threshold: Min cosine similarity for a hit
+            num_tables: LSH hash tables (more = higher recall)
+            num_bits: Hyperplanes per table (more = smaller buckets)
+            capacity: Max entries before FIFO eviction
+            cache_file: Pickle file for persistence (None = in-memory only)
+            seed: Seed for the random hyperplanes (fixed so buckets are stable)
+        """
+        self.threshold = threshold
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.capacity = capacity
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._planes: Optional[np.ndarray] = None  # (tables, bits, dim), built on first vector
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, str, Tuple[int, ...]]]" = OrderedDict()
+        self._tables: List[Dict[int, set]] = [{} for _ in range(num_tables)]
+        self._next_id = 0
+        self._dirty = False
+
+        if self.cache_file and self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    for doc_id, vector, context in pickle.load(f):
+                        self.add(doc_id, vector, context)
+                self._dirty = False
+                logger.info(f"Loaded {len(self._entries)} semantic retrieval entries from {self.cache_file}")
+            except Exception as e:
+                logger.warning(f"Could not load semantic retrieval cache {self.cache_file}: {e}")
+
+        if self.cache_file:
+            atexit.register(self.save)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _normalize(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _hashes(self, vector: np.ndarray) -> Tuple[int, ...]:
+        if self._planes is None:
+            rng = np.random.default_rng(self.seed)
+            self._planes = rng.standard_normal(
+                (self.num_tables, self.num_bits, vector.shape[0])
+            ).astype(np.float32)
+        bits = (self._planes @ vector) > 0  # (tables, bits)
+        return tuple(int(h) for h in bits @ (1 << np.arange(self.num_bits)))
+
+    def lookup(self, doc_id: str, vector) -> Optional[str]:
+        """Context of the most similar cached query for doc_id, or None."""
+        vector = self._normalize(vector)
+        with self._lock:
+            candidates = set()
+            for table, h in zip(self._tables, self._hashes(vector)):
+                candidates.update(table.get(h, ()))
+
+            best_context, best_similarity = None, self.threshold
+            for entry_id in candidates:
+                entry_doc_id, entry_vector, context, _ = self._entries[entry_id]
+                if entry_doc_id != doc_id:
+                    continue
+                similarity = float(entry_vector @ vector)
+                if similarity >= best_similarity:
+                    best_context, best_similarity = context, similarity
+            return best_context
+
+    def add(self, doc_id: str, vector, context: str):
+        """Cache a retrieved context (evicting the oldest entry at capacity)."""
+        vector = self._normalize(vector)
+        with self._lock:
+            while len(self._entries) >= self.capacity:
+                old_id, (_, _, _, old_hashes) = self._entries.popitem(last=False)
+                for table, h in zip(self._tables, old_hashes):
+                    bucket = table[h]
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del table[h]
+
+            hashes = self._hashes(vector)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (doc_id, vector, context, hashes)
+            for table, h in zip(self._tables, hashes):
+                table.setdefault(h, set()).add(entry_id)
+            self._dirty = True
+
+    def save(self):
+        """Write entries to cache_file if new ones were added."""
+        if not self.cache_file or not self._dirty:
+            return
+        with self._lock:
+            entries = [(doc_id, vector, context) for doc_id, vector, context, _ in self._entries.values()]
+        try:
+            _atomic_pickle(entries, self.cache_file)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"Could not save semantic retrieval cache {self.cache_file}: {e}")
+
+
 class DSPyPostgresRetriever:
     """
     PostgreSQL + pgvector retriever for DSPy integration.
@@ -29,38 +260,111 @@ class DSPyPostgresRetriever:
     for semantic similarity search.
     """
 
-    def __init__(self, collection_name: str = None):
+    def __init__(self, collection_name: str = None, embedding_cache_file: str = None,
+                 retrieval_cache_dir: str = None):
         """
         Initialize PostgreSQL retriever with Qwen embeddings
 
         Args:
             collection_name: Collection name (default: from config)
+            embedding_cache_file: Query embedding cache
+                                  (default: {CACHE_PATH}/query_embeddings.pkl)
+            retrieval_cache_dir: Retrieved-context cache, persists across runs
+                                 (default: {CACHE_PATH}/retrieval). Clear it
+                                 after re-indexing the collection (clear_context_cache()).
         """
         print("🔍 Initializing PostgreSQL retriever (LangChain PGVector + Qwen embeddings)...")
 
         # Get collection name from config or parameter
         self.collection_name = collection_name or config.database.collection_name
 
-        # Initialize embeddings
-        self.embeddings = DashScopeEmbeddings(
-            model=config.qwen.embedding_model,
-            dashscope_api_key=config.qwen.api_key
+        # Initialize embeddings (query vectors cached across runs)
+        self.embeddings = CachedQueryEmbeddings(
+            DashScopeEmbeddings(
+                model=config.qwen.embedding_model,
+                dashscope_api_key=config.qwen.api_key
+            ),
+            cache_file=embedding_cache_file or Path(config.storage.cache_path) / "query_embeddings.pkl"
         )
 
         # Initialize vector store
         self.vector_store = PGVector(
             collection_name=self.collection_name,
             connection_string=config.database.url,
-            embedding_function=self.embeddings
+            embedding_function=self.embeddings,
+            engine_args=self._hnsw_engine_args()
         )
 
+        # Retrieval is deterministic in (doc_id, question, top_k), and optimizer
+        # trials re-run the same questions - cache contexts across trials/runs
+        self.context_cache = Cache(str(retrieval_cache_dir or Path(config.storage.cache_path) / "retrieval"))
+        self._contexts: Dict[str, str] = {}  # In-process layer over context_cache
+
         print(f"✅ PostgreSQL retriever ready (collection: {self.collection_name})")
 
+    @staticmethod
+    def _hnsw_index_usable() -> bool:
+        """
+        Whether an HNSW index from scripts/build_hnsw_index.py exists on a
+        pgvector that supports hnsw.iterative_scan (>= 0.8).
+        """
+        engine = create_engine(config.database.url)
+        try:
+            with engine.connect() as conn:
+                version, has_index = conn.execute(text(
+                    "SELECT (SELECT extversion FROM pg_extension WHERE extname = 'vector'), "
+                    "EXISTS (SELECT 1 FROM pg_indexes WHERE tablename = 'langchain_pg_embedding' "
+                    "AND indexdef ILIKE '%USING hnsw%')"
+                )).one()
+        except Exception as e:
+            logger.warning(f"Could not check for an HNSW index: {e}")
+            return False
+        finally:
+            engine.dispose()
+
+        if not has_index:
+            return False
+        major, minor = (int(part) for part in (version or '0.0').split('.')[:2])
+        if (major, minor) < (0, 8):
+            logger.warning(f"⚠️  HNSW index found on pgvector {version} (< 0.8, no iterative_scan): "
+                           f"doc_id-filtered queries will return fewer than top_k chunks. "
+                           f"Upgrade pgvector or drop the index (scripts/build_hnsw_index.py --drop)")
+            return False
+        return True
+
+    @classmethod
+    def _hnsw_engine_args(cls) -> Dict:
+        """
+        Per-connection HNSW search settings.
+
+        iterative_scan keeps scanning the graph until top_k rows pass the
+        doc_id filter; without it a single-document filter over 45 documents
+        can return far fewer than top_k chunks. It is turned on whenever the
+        HNSW index exists (the setting needs pgvector >= 0.8, which the build
+        script requires); without the index queries are exact scans anyway.
+        """
+        options = [f"-c hnsw.ef_search={config.database.hnsw_ef_search}"]
+        iterative_scan = config.database.hnsw_iterative_scan
+        if iterative_scan != 'off' and cls._hnsw_index_usable():
+            options.append(f"-c hnsw.iterative_scan={iterative_scan}")
+        elif iterative_scan == 'off':
+            logger.warning("⚠️  PG_HNSW_ITERATIVE_SCAN=off: doc_id-filtered HNSW queries may "
+                           "return fewer than top_k chunks")
+        return {"connect_args": {"options": " ".join(options)}}
+
+    def __deepcopy__(self, memo):
+        # Optimizers deep-copy the RAG module per candidate program; share the
+        # retriever (engine pool + embedding cache) instead of cloning it
+        return self
+
     def retrieve(self, doc_id: str, question: str, top_k: int = 5, max_retries: int = 3) -> str:
         """
         Retrieve top-k chunks for a question using LangChain PGVector similarity search.
         Includes retry logic with exponential backoff for connection errors.
 
+        Results are memoized on disk per (collection, doc_id, question, top_k);
+        empty results (no chunks or errors) are not cached.
+
         Args:
             doc_id: Document identifier (e.g., 'AR6 Synthesis Report...')
             question: ESG question text
@@ -70,6 +374,154 @@ class DSPyPostgresRetriever:
         Returns:
             Concatenated context string from top-k chunks
         """
+        key = self._context_key(doc_id, question, top_k)
+
+        context = self._cached_context(key)
+        if context is None:
+            context = self._search(doc_id, question, top_k, max_retries)
+            self._store_context(key, context)
+        return context
+
+    def retrieve_batch(self, doc_ids: List[str], questions: List[str], top_k: int = 5,
+                       batch_size: int = 25) -> List[str]:
+        """
+        Retrieve contexts for many questions at once (same results as retrieve).
+
+        Uncached questions are embedded in batched API requests and searched
+        with one SQL query per minibatch (a LATERAL top-k per question),
+        instead of one embedding call and one query per question.
+
+        Args:
+            doc_ids: Document identifier per question
+            questions: ESG question texts (aligned with doc_ids)
+            top_k: Number of chunks per question (default: 5)
+            batch_size: Questions per SQL query (default: 25)
+
+        Returns:
+            Context strings aligned with questions ("" if nothing retrieved)
+        """
+        keys = [self._context_key(d, q, top_k) for d, q in zip(doc_ids, questions)]
+        contexts = [self._cached_context(key) for key in keys]
+        # Search each uncached (doc_id, question) once, even if repeated
+        first_index = {}
+        for i, context in enumerate(contexts):
+            if context is None:
+                first_index.setdefault(keys[i], i)
+        missing = list(first_index.values())
+
+        self.embeddings.warm(questions[i] for i in missing)
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            batch_contexts = self._search_batch(
+                [doc_ids[i] for i in batch], [questions[i] for i in batch], top_k
+            )
+            if batch_contexts is None:
+                # Batched query failed - fall back to per-question search (with retries)
+                batch_contexts = [self._search(doc_ids[i], questions[i], top_k, 3) for i in batch]
+
+            for i, context in zip(batch, batch_contexts):
+                contexts[i] = context
+                self._store_context(keys[i], context)
+
+        # Fill in repeats from their first occurrence
+        return [contexts[first_index[key]] if context is None else context
+                for key, context in zip(keys, contexts)]
+
+    def _context_key(self, doc_id: str, question: str, top_k: int) -> str:
+        # Search settings change which chunks come back (fp16 distances,
+        # approximate HNSW scans) - contexts from other settings don't match
+        db = config.database
+        search = f"halfvec={db.halfvec}|ef={db.hnsw_ef_search}|scan={db.hnsw_iterative_scan}"
+        return hashlib.blake2b(
+            f"{self.collection_name}|{search}|{doc_id}|{question}|{top_k}".encode('utf-8')
+        ).hexdigest()
+
+    def _cached_context(self, key: str) -> Optional[str]:
+        context = self._contexts.get(key)
+        if context is None:
+            context = self.context_cache.get(key)
+            if context:
+                self._contexts[key] = context
+        return context
+
+    def _store_context(self, key: str, context: str):
+        # Empty results (no chunks or errors) are not cached
+        if context:
+            self.context_cache.set(key, context)
+            self._contexts[key] = context
+
+    def clear_context_cache(self):
+        """
+        Drop all cached contexts (in-process and on disk), e.g. after
+        re-indexing the collection. Nothing else invalidates them: baseline
+        and optimized evaluations in one run share every retrieval.
+        """
+        self._contexts.clear()
+        self.context_cache.clear()
+
+    def _search_batch(self, doc_ids: List[str], questions: List[str], top_k: int) -> Optional[List[str]]:
+        """
+        One pgvector query for a minibatch of questions (see retrieve_batch).
+
+        Mirrors PGVector.similarity_search_with_score with a {'source': doc_id}
+        filter: cosine distance within the collection, top_k per question.
+        With PG_HALFVEC=true, distances are computed on fp16 (halfvec) copies
+        of the embeddings, served by the halfvec expression index - half the
+        bytes per distance, at a negligible ranking change for top-5.
+
+        Returns:
+            Context strings aligned with questions, or None if the query failed
+        """
+        vectors = [self.embeddings.embed_query(q) for q in questions]
+        # Must match the indexed expression exactly for the planner to use it
+        distance = (f"e.embedding::halfvec({len(vectors[0])}) <=> CAST(q.vec AS halfvec({len(vectors[0])}))"
+                    if config.database.halfvec else "e.embedding <=> CAST(q.vec AS vector)")
+        query = text(f"""
+            SELECT q.idx, c.document, c.page, c.distance
+            FROM unnest(CAST(:vectors AS text[]), CAST(:doc_ids AS text[]))
+                 WITH ORDINALITY AS q(vec, doc_id, idx)
+            CROSS JOIN LATERAL (
+                SELECT e.document,
+                       e.cmetadata->>'page' AS page,
+                       {distance} AS distance
+                FROM langchain_pg_embedding e
+                WHERE e.collection_id = (
+                          SELECT uuid FROM langchain_pg_collection WHERE name = :collection
+                      )
+                  AND e.cmetadata->>'source' = q.doc_id
+                ORDER BY distance
+                LIMIT :top_k
+            ) c
+            ORDER BY q.idx, c.distance
+        """)
+
+        try:
+            with self.vector_store.session_maker() as session:
+                rows = session.execute(query, {
+                    "vectors": [str(v) for v in vectors],
+                    "doc_ids": list(doc_ids),
+                    "collection": self.collection_name,
+                    "top_k": top_k
+                }).fetchall()
+        except Exception as e:
+            logger.warning(f"Batched retrieval failed for {len(questions)} questions: {e}")
+            return None
+
+        context_parts = [[] for _ in questions]
+        for idx, document, page, distance in rows:
+            similarity = 1 / (1 + distance)  # Same conversion as _search
+            context_parts[idx - 1].append(
+                f"[Page {page or 'unknown'}, score: {similarity:.3f}]\n{document}"
+            )
+
+        for doc_id, parts in zip(doc_ids, context_parts):
+            if not parts:
+                logger.warning(f"No chunks found for {doc_id}")
+        return ["\n\n".join(parts) for parts in context_parts]
+
+    def _search(self, doc_id: str, question: str, top_k: int, max_retries: int) -> str:
+        """Uncached similarity search (see retrieve)."""
         last_error = None
 
         for attempt in range(max_retries):
@@ -128,6 +580,33 @@ class DSPyPostgresRetriever:
         logger.error(f"All {max_retries} retry attempts failed for {doc_id}: {last_error}")
         return ""
 
+    def precompute_query_embeddings(self, questions: Iterable[str]):
+        """
+        Embed all questions up front so optimizer trials never wait on
+        (or pay for) the embedding API for a query seen before.
+        """
+        embedded = self.embeddings.warm(questions)
+        print(f"✅ Query embeddings cached ({embedded} new)")
+
+    def precompute_contexts(self, examples, top_k: int = 5):
+        """
+        Retrieve contexts for all examples once before optimization.
+
+        Retrieval doesn't depend on the prompts being optimized, so every
+        optimizer trial afterwards is served from the context cache.
+
+        Args:
+            examples: DSPy examples with doc_id and question
+            top_k: Must match the top_k used by the RAG module
+        """
+        examples = list(examples)
+        contexts = self.retrieve_batch(
+            [ex.doc_id for ex in examples], [ex.question for ex in examples], top_k
+        )
+
+        missing = sum(1 for context in contexts if not context)
+        print(f"✅ Contexts cached for {len(examples) - missing}/{len(examples)} questions")
+
     def get_chunks_with_metadata(self, doc_id: str, question: str, top_k: int = 5) -> List[Dict]:
         """
         Retrieve chunks with full metadata (for debugging/analysis).
@@ -158,6 +637,22 @@ class DSPyPostgresRetriever:
             return []
 
 
+_shared_retrievers: Dict[str, DSPyPostgresRetriever] = {}
+
+
+def get_shared_retriever(collection_name: str = None) -> DSPyPostgresRetriever:
+    """
+    Process-wide retriever per collection.
+
+    RAG modules are instantiated several times per script (baseline,
+    optimized, reloaded) - reuse one connection pool and embedding cache.
+    """
+    collection_name = collection_name or config.database.collection_name
+    if collection_name not in _shared_retrievers:
+        _shared_retrievers[collection_name] = DSPyPostgresRetriever(collection_name)
+    return _shared_retrievers[collection_name]
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
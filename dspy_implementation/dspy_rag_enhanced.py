@@ -4,13 +4,62 @@ Enhanced DSPy RAG Module for MMESGBench
 Includes query generation for optimized retrieval
 """
 
+import asyncio
+import logging
 import dspy
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
 from dspy_implementation.dspy_signatures_enhanced import (
     QueryGeneration,
     ESGReasoning,
-    AnswerExtraction
+    AnswerExtraction,
+    BatchedAnswerExtraction
 )
+from dspy_implementation.dspy_signatures import extraction_config, validate_answer_format
+
+logger = logging.getLogger(__name__)
+
+BASELINE_QUERY_REASONING = "Using raw question (baseline)"
+
+
+def _retrieval_failed(search_query: str, query_reasoning: str, analysis: str) -> dspy.Prediction:
+    """
+    Fallback prediction when retrieval returns no context: generation is
+    skipped, and the answer never scores as correct. retrieval_failed lets
+    the GEPA metrics tell the reflection LM why.
+    """
+    return dspy.Prediction(
+        answer="Failed to retrieve context",
+        search_query=search_query,
+        query_reasoning=query_reasoning,
+        analysis=analysis,
+        context="",
+        retrieval_score=0.0,
+        retrieval_failed=True
+    )
+
+
+def _extraction_inputs(question: str, reasoning_output, answer_format: str) -> dict:
+    """Stage 3 inputs (and per-format LM config) from the Stage 2 output."""
+    return dict(
+        question=question,
+        analysis=reasoning_output.analysis,
+        answer_format=answer_format,
+        config=extraction_config(answer_format)
+    )
+
+
+def _prediction(answer: str, search_query: str, query_reasoning: str,
+                reasoning_output, context: str) -> dspy.Prediction:
+    """Complete prediction with all intermediate outputs."""
+    return dspy.Prediction(
+        answer=answer,
+        search_query=search_query,
+        query_reasoning=query_reasoning,
+        analysis=reasoning_output.analysis,
+        context=context,
+        rationale=getattr(reasoning_output, 'rationale', ''),
+        retrieval_score=0.0  # Could compute from retriever if available
+    )
 
 
 class EnhancedMMESGBenchRAG(dspy.Module):
@@ -49,7 +98,7 @@ class EnhancedMMESGBenchRAG(dspy.Module):
             self.query_gen = dspy.ChainOfThought(QueryGeneration)
 
         # Stage 1: Retrieval (existing)
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
 
         # Stage 2: Reasoning with CoT (existing)
         self.reasoning = dspy.ChainOfThought(ESGReasoning)
@@ -83,17 +132,9 @@ class EnhancedMMESGBenchRAG(dspy.Module):
                 - retrieval_score: Average similarity score
         """
         # Stage 0: Generate optimized query
-        if self.enable_query_optimization:
-            query_output = self.query_gen(
-                question=question,
-                doc_type="ESG Climate Report"
-            )
-            search_query = query_output.search_query
-            query_reasoning = query_output.reasoning
-        else:
-            # Fallback: use raw question
-            search_query = question
-            query_reasoning = "Using raw question (query optimization disabled)"
+        query_output = (self.query_gen(**self._query_inputs(question))
+                        if self.enable_query_optimization else None)
+        search_query, query_reasoning = self._search_query(question, query_output)
 
         # Stage 1: Retrieve with optimized query
         context = self.retriever.retrieve(
@@ -103,15 +144,8 @@ class EnhancedMMESGBenchRAG(dspy.Module):
         )
 
         if not context:
-            # Fallback if retrieval fails
-            return dspy.Prediction(
-                answer="Failed to retrieve context",
-                search_query=search_query,
-                query_reasoning=query_reasoning,
-                analysis="Document indexing or retrieval failed",
-                context="",
-                retrieval_score=0.0
-            )
+            return _retrieval_failed(search_query, query_reasoning,
+                                     "Document indexing or retrieval failed")
 
         # Stage 2: Generate analysis with CoT
         reasoning_output = self.reasoning(
@@ -122,22 +156,50 @@ class EnhancedMMESGBenchRAG(dspy.Module):
 
         # Stage 3: Extract answer from analysis
         extraction_output = self.extraction(
-            question=question,
-            analysis=reasoning_output.analysis,
-            answer_format=answer_format
+            **_extraction_inputs(question, reasoning_output, answer_format)
         )
 
-        # Return complete prediction with all intermediate outputs
-        return dspy.Prediction(
-            answer=extraction_output.extracted_answer,
-            search_query=search_query,
-            query_reasoning=query_reasoning,
-            analysis=reasoning_output.analysis,
+        return _prediction(extraction_output.extracted_answer, search_query, query_reasoning,
+                           reasoning_output, context)
+
+    async def aforward(self, question: str, doc_id: str, answer_format: str):
+        """Async forward pass (same stages as forward) for concurrent evaluation."""
+        query_output = (await self.query_gen.acall(**self._query_inputs(question))
+                        if self.enable_query_optimization else None)
+        search_query, query_reasoning = self._search_query(question, query_output)
+
+        # Retrieval is blocking (DB + embedding API) - run it off the event loop
+        context = await asyncio.to_thread(self.retriever.retrieve, doc_id, search_query, 5)
+
+        if not context:
+            return _retrieval_failed(search_query, query_reasoning,
+                                     "Document indexing or retrieval failed")
+
+        reasoning_output = await self.reasoning.acall(
+            question=question,
             context=context,
-            rationale=getattr(reasoning_output, 'rationale', ''),
-            retrieval_score=0.0  # Could compute from retriever if available
+            doc_id=doc_id
         )
 
+        extraction_output = await self.extraction.acall(
+            **_extraction_inputs(question, reasoning_output, answer_format)
+        )
+
+        return _prediction(extraction_output.extracted_answer, search_query, query_reasoning,
+                           reasoning_output, context)
+
+    @staticmethod
+    def _query_inputs(question: str) -> dict:
+        """Stage 0 inputs"""
+        return dict(question=question, doc_type="ESG Climate Report")
+
+    @staticmethod
+    def _search_query(question: str, query_output):
+        """(search_query, query_reasoning); the raw question if query generation is off"""
+        if query_output is None:
+            return question, "Using raw question (query optimization disabled)"
+        return query_output.search_query, query_output.reasoning
+
 
 class BaselineMMESGBenchRAG(dspy.Module):
     """
@@ -151,7 +213,7 @@ class BaselineMMESGBenchRAG(dspy.Module):
         super().__init__()
 
         # No query generation - use raw question
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         self.reasoning = dspy.ChainOfThought(ESGReasoning)
         self.extraction = dspy.Predict(AnswerExtraction)
 
@@ -167,14 +229,7 @@ class BaselineMMESGBenchRAG(dspy.Module):
         )
 
         if not context:
-            return dspy.Prediction(
-                answer="Failed to retrieve context",
-                search_query=question,
-                query_reasoning="Using raw question (baseline)",
-                analysis="Document retrieval failed",
-                context="",
-                retrieval_score=0.0
-            )
+            return _retrieval_failed(question, BASELINE_QUERY_REASONING, "Document retrieval failed")
 
         # Stage 2: Reasoning
         reasoning_output = self.reasoning(
@@ -185,21 +240,134 @@ class BaselineMMESGBenchRAG(dspy.Module):
 
         # Stage 3: Extraction
         extraction_output = self.extraction(
-            question=question,
-            analysis=reasoning_output.analysis,
-            answer_format=answer_format
+            **_extraction_inputs(question, reasoning_output, answer_format)
         )
 
-        return dspy.Prediction(
-            answer=extraction_output.extracted_answer,
-            search_query=question,
-            query_reasoning="Using raw question (baseline)",
-            analysis=reasoning_output.analysis,
+        return _prediction(extraction_output.extracted_answer, question, BASELINE_QUERY_REASONING,
+                           reasoning_output, context)
+
+    async def aforward(self, question: str, doc_id: str, answer_format: str):
+        """Async forward pass (same stages as forward) for concurrent evaluation."""
+        # Retrieval is blocking (DB + embedding API) - run it off the event loop
+        context = await asyncio.to_thread(self.retriever.retrieve, doc_id, question, 5)
+
+        if not context:
+            return _retrieval_failed(question, BASELINE_QUERY_REASONING, "Document retrieval failed")
+
+        reasoning_output = await self.reasoning.acall(
+            question=question,
             context=context,
-            rationale=getattr(reasoning_output, 'rationale', ''),
-            retrieval_score=0.0
+            doc_id=doc_id
         )
 
+        extraction_output = await self.extraction.acall(
+            **_extraction_inputs(question, reasoning_output, answer_format)
+        )
+
+        return _prediction(extraction_output.extracted_answer, question, BASELINE_QUERY_REASONING,
+                           reasoning_output, context)
+
+
+class BatchedBaselineRAG:
+    """
+    Evaluation wrapper that answers several questions per extraction call.
+
+    Retrieval and reasoning run per question (each question has its own
+    context), then up to `batch_size` analyses for the same document are
+    extracted in one LM request, so the extraction instructions are sent
+    once per batch instead of once per question.
+
+    Wraps a BaselineMMESGBenchRAG (fresh or optimized) without becoming
+    part of it: the batched predictor is built per call from the wrapped
+    module's extraction instructions and is never seen by optimizers.
+    """
+
+    MAX_BATCH_SIZE = 16  # Larger batches degrade per-item accuracy
+
+    def __init__(self, rag_module: BaselineMMESGBenchRAG, batch_size: int = 8):
+        self.rag = rag_module
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH_SIZE))
+
+    async def _areason(self, question: str, doc_id: str):
+        context = await asyncio.to_thread(self.rag.retriever.retrieve, doc_id, question, 5)
+        if not context:
+            return context, None
+        return context, await self.rag.reasoning.acall(question=question, context=context, doc_id=doc_id)
+
+    @staticmethod
+    def _valid_batch(examples, answers) -> bool:
+        """One non-empty answer per question, each in its question's answer format."""
+        if len(answers) != len(examples):
+            return False
+        return all(
+            str(answer).strip() and validate_answer_format(str(answer).strip(), ex.answer_format)
+            for ex, answer in zip(examples, answers)
+        )
+
+    async def _aextract_batch(self, examples, analyses) -> list:
+        """Batched extraction; falls back to one call per question if the output doesn't validate."""
+        if len(examples) > 1:
+            signature = BatchedAnswerExtraction.with_instructions(
+                f"{self.rag.extraction.signature.instructions}\n\n"
+                "Answer every question: extracted_answers[i] answers questions[i] "
+                "from analyses[i] in answer_formats[i]."
+            )
+            formats = [ex.answer_format for ex in examples]
+            try:
+                output = await dspy.Predict(signature).acall(
+                    answer_formats=formats,
+                    questions=[ex.question for ex in examples],
+                    analyses=analyses,
+                    config={"max_tokens": sum(extraction_config(fmt).get("max_tokens", 256) for fmt in formats)}
+                )
+                answers = output.extracted_answers
+                if self._valid_batch(examples, answers):
+                    return [str(answer).strip() for answer in answers]
+                logger.warning(f"Batched extraction returned {len(answers)} answers for "
+                               f"{len(examples)} questions (or a malformed answer); "
+                               f"extracting individually")
+            except Exception as e:
+                logger.warning(f"Batched extraction failed ({type(e).__name__}: {e}); "
+                               f"extracting individually")
+
+        outputs = await asyncio.gather(*(
+            self.rag.extraction.acall(
+                question=ex.question,
+                analysis=analysis,
+                answer_format=ex.answer_format,
+                config=extraction_config(ex.answer_format)
+            )
+            for ex, analysis in zip(examples, analyses)
+        ))
+        return [output.extracted_answer for output in outputs]
+
+    async def aforward_batch(self, examples) -> list:
+        """
+        Predictions for examples (expected to share a doc_id), in order.
+
+        Returns:
+            List of dspy.Prediction with the same fields as BaselineMMESGBenchRAG
+        """
+        reasoned = await asyncio.gather(*(self._areason(ex.question, ex.doc_id) for ex in examples))
+
+        answered = [i for i, (context, _) in enumerate(reasoned) if context]
+        answers = {}
+        for start in range(0, len(answered), self.batch_size):
+            batch = answered[start:start + self.batch_size]
+            extracted = await self._aextract_batch(
+                [examples[i] for i in batch], [reasoned[i][1].analysis for i in batch]
+            )
+            answers.update(zip(batch, extracted))
+
+        predictions = []
+        for i, (ex, (context, reasoning_output)) in enumerate(zip(examples, reasoned)):
+            if reasoning_output is None:
+                predictions.append(_retrieval_failed(ex.question, BASELINE_QUERY_REASONING,
+                                                     "Document retrieval failed"))
+                continue
+            predictions.append(_prediction(answers[i], ex.question, BASELINE_QUERY_REASONING,
+                                           reasoning_output, context))
+        return predictions
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -4,9 +4,10 @@ DSPy RAG Module for MMESGBench
 Implements two-stage RAG: ColBERT Retrieval → Reasoning → Extraction
 """
 
+import asyncio
 import dspy
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
-from dspy_implementation.dspy_signatures import ESGReasoning, AnswerExtraction
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+from dspy_implementation.dspy_signatures import ESGReasoning, AnswerExtraction, extraction_config
 
 
 class MMESGBenchRAG(dspy.Module):
@@ -25,7 +26,7 @@ class MMESGBenchRAG(dspy.Module):
         super().__init__()
 
         # Initialize PostgreSQL retriever (pgvector + Qwen embeddings)
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
 
         # DSPy modules for two-stage generation
         # Stage 1: Generate detailed analysis with chain-of-thought
@@ -58,12 +59,7 @@ class MMESGBenchRAG(dspy.Module):
         context = self.retriever.retrieve(doc_id, question, top_k=5)
 
         if not context:
-            # Fallback if retrieval fails
-            return dspy.Prediction(
-                answer="Failed to retrieve context",
-                analysis="Document indexing or retrieval failed",
-                context=""
-            )
+            return self._retrieval_failed()
 
         # Step 2: Generate analysis (Stage 1) with chain-of-thought
         reasoning_output = self.reasoning(
@@ -74,12 +70,54 @@ class MMESGBenchRAG(dspy.Module):
 
         # Step 3: Extract answer (Stage 2) from analysis
         extraction_output = self.extraction(
+            **self._extraction_inputs(question, reasoning_output, answer_format)
+        )
+
+        return self._prediction(extraction_output, reasoning_output, context)
+
+    async def aforward(self, question: str, doc_id: str, answer_format: str):
+        """Async forward pass (same stages as forward) for concurrent evaluation."""
+        # Retrieval is blocking (DB + embedding API) - run it off the event loop
+        context = await asyncio.to_thread(self.retriever.retrieve, doc_id, question, 5)
+
+        if not context:
+            return self._retrieval_failed()
+
+        reasoning_output = await self.reasoning.acall(
+            question=question,
+            context=context,
+            doc_id=doc_id
+        )
+
+        extraction_output = await self.extraction.acall(
+            **self._extraction_inputs(question, reasoning_output, answer_format)
+        )
+
+        return self._prediction(extraction_output, reasoning_output, context)
+
+    @staticmethod
+    def _retrieval_failed():
+        """Fallback prediction when retrieval returns no context"""
+        return dspy.Prediction(
+            answer="Failed to retrieve context",
+            analysis="Document indexing or retrieval failed",
+            context="",
+            retrieval_failed=True  # Explained in GEPA feedback
+        )
+
+    @staticmethod
+    def _extraction_inputs(question: str, reasoning_output, answer_format: str) -> dict:
+        """Stage 2 inputs (and per-format LM config) from the Stage 1 output"""
+        return dict(
             question=question,
             analysis=reasoning_output.analysis,
-            answer_format=answer_format
+            answer_format=answer_format,
+            config=extraction_config(answer_format)
         )
 
-        # Return complete prediction
+    @staticmethod
+    def _prediction(extraction_output, reasoning_output, context: str):
+        """Complete prediction from both stages' outputs"""
         return dspy.Prediction(
             answer=extraction_output.extracted_answer,
             analysis=reasoning_output.analysis,
@@ -97,7 +135,7 @@ class MMESGBenchRAGBasic(dspy.Module):
 
     def __init__(self):
         super().__init__()
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         self.reasoning = dspy.Predict(ESGReasoning)  # Basic Predict, no CoT
         self.extraction = dspy.Predict(AnswerExtraction)
 
@@ -123,7 +161,8 @@ class MMESGBenchRAGBasic(dspy.Module):
         extraction_output = self.extraction(
             question=question,
             analysis=reasoning_output.analysis,
-            answer_format=answer_format
+            answer_format=answer_format,
+            config=extraction_config(answer_format)
         )
 
         return dspy.Prediction(
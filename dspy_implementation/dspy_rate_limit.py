@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Client-side DashScope rate limiting for DSPy
+
+Concurrent DSPy threads (Evaluate num_threads, GEPA minibatches) can push
+past the account's per-model RPM/TPM limits. Every 429 is then retried with
+backoff, and a burst of retries stalls the whole run for longer than
+running single-threaded would.
+
+RateLimitedLM wraps an LM and throttles *before* the limit is hit: a call
+waits until the last minute's requests and tokens leave room for it, and
+the number of in-flight requests is capped. A 429 that slips through is
+retried up to MAX_ATTEMPTS times with exponential backoff.
+"""
+
+import os
+import copy
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+import dspy
+import litellm
+
+logger = logging.getLogger(__name__)
+
+# Per-model account limits (DashScope console -> rate limits); keep some
+# headroom below the documented numbers
+DEFAULT_RPM = int(os.getenv("DASHSCOPE_RPM", "600"))
+DEFAULT_TPM = int(os.getenv("DASHSCOPE_TPM", "1000000"))
+
+WINDOW_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over request count and token usage.
+
+    Token usage is only known once a response arrives, so the TPM check is
+    against completed requests: a call is admitted while the window's tokens
+    are below the TPM cap.
+    """
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM,
+                 max_concurrent: Optional[int] = None):
+        """
+        Args:
+            rpm: Max requests started per minute
+            tpm: Max tokens (prompt + completion) used per minute
+            max_concurrent: Max in-flight requests (default: rpm / 60, at least 1)
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrent = max_concurrent or max(1, rpm // 60)
+
+        self._lock = threading.Lock()
+        self._requests = deque()   # start times
+        self._tokens = deque()     # (finish time, total tokens)
+        self._token_total = 0
+        self._in_flight = 0
+
+    def _expire(self, now: float):
+        while self._requests and now - self._requests[0] >= WINDOW_SECONDS:
+            self._requests.popleft()
+        while self._tokens and now - self._tokens[0][0] >= WINDOW_SECONDS:
+            self._token_total -= self._tokens.popleft()[1]
+
+    def try_acquire(self) -> float:
+        """
+        Admit one request if the limits allow it.
+
+        Returns:
+            float: 0.0 if admitted (call release() when done), otherwise the
+                   number of seconds to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+
+            delays = []
+            if len(self._requests) >= self.rpm:
+                delays.append(WINDOW_SECONDS - (now - self._requests[0]))
+            if self._token_total >= self.tpm:
+                delays.append(WINDOW_SECONDS - (now - self._tokens[0][0]))
+            if self._in_flight >= self.max_concurrent:
+                delays.append(0.05)
+            if delays:
+                return max(max(delays), 0.01)
+
+            self._requests.append(now)
+            self._in_flight += 1
+            return 0.0
+
+    def release(self, tokens: int = 0):
+        """Finish an admitted request and record its token usage."""
+        with self._lock:
+            self._in_flight -= 1
+            if tokens:
+                self._tokens.append((time.monotonic(), tokens))
+                self._token_total += tokens
+
+    def acquire(self):
+        delay = self.try_acquire()
+        while delay:
+            time.sleep(delay)
+            delay = self.try_acquire()
+
+    async def aacquire(self):
+        delay = self.try_acquire()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self.try_acquire()
+
+
+def _total_tokens(response) -> int:
+    if getattr(response, 'cache_hit', False):
+        return 0
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', 0) or 0
+
+
+def _backoff(attempt: int) -> float:
+    return min(2 * 2 ** attempt, 30) + random.uniform(0, 1)
+
+
+class RateLimitedLM(dspy.LM):
+    """
+    dspy.LM that throttles requests to a wrapped LM under RPM/TPM limits.
+
+    Deep copies (made by DSPy optimizers) share the limiter, so all copies
+    of one model draw from the same budget. Wrap each model separately:
+    DashScope limits are per model.
+
+    Usage:
+        student_lm = RateLimitedLM(dspy.LM('openai/qwen2.5-7b-instruct', ...))
+        dspy.configure(lm=student_lm)
+    """
+
+    def __init__(self, lm: dspy.LM, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM,
+                 max_concurrent: Optional[int] = None):
+        """
+        Args:
+            lm: Wrapped LM that performs the requests
+            rpm: Requests per minute allowed for this model
+            tpm: Tokens per minute allowed for this model
+            max_concurrent: Max in-flight requests (default: rpm / 60)
+        """
+        # Mirror the wrapped LM's config (model, kwargs, callbacks, ...)
+        self.__dict__.update(lm.__dict__)
+        self.history = []
+
+        self.lm = lm
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm, max_concurrent=max_concurrent)
+
+    def __deepcopy__(self, memo):
+        """Copies share the wrapped LM and the limiter."""
+        new = copy.copy(self)
+        new.kwargs = dict(self.kwargs)
+        new.callbacks = list(self.callbacks)
+        new.history = []
+        return new
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            self.limiter.acquire()
+            tokens = 0
+            try:
+                response = self.lm.forward(prompt=prompt, messages=messages, **kwargs)
+                tokens = _total_tokens(response)
+                return response
+            except litellm.RateLimitError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"{self.model}: rate limited, retrying in {delay:.1f}s "
+                               f"({attempt + 1}/{MAX_ATTEMPTS})")
+            finally:
+                self.limiter.release(tokens)
+            time.sleep(delay)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            await self.limiter.aacquire()
+            tokens = 0
+            try:
+                response = await self.lm.aforward(prompt=prompt, messages=messages, **kwargs)
+                tokens = _total_tokens(response)
+                return response
+            except litellm.RateLimitError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"{self.model}: rate limited, retrying in {delay:.1f}s "
+                               f"({attempt + 1}/{MAX_ATTEMPTS})")
+            finally:
+                self.limiter.release(tokens)
+            await asyncio.sleep(delay)
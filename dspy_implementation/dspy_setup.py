@@ -5,26 +5,41 @@ Configures DSPy to work with Qwen API (OpenAI-compatible)
 """
 
 import os
+import sys
+from pathlib import Path
 import dspy
 from dotenv import load_dotenv
 
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dspy_implementation.dspy_http import open_pooled_sessions
+
 # Load environment variables
 load_dotenv()
 
-def setup_dspy_qwen(model_name='qwen-max'):
+def setup_dspy_qwen(model_name='qwen-max', semantic_threshold=None, api_key=None,
+                    persistent_cache=False):
     """
     Configure DSPy to use Qwen API (OpenAI-compatible interface)
 
     Args:
         model_name: Qwen model to use (default: 'qwen-max')
                    Options: 'qwen-max', 'qwen2.5-7b-instruct', 'qwen2.5-14b-instruct', etc.
+        semantic_threshold: If set (e.g., 0.97), use a CachedLM that also serves
+                            near-duplicate prompts with the same instructions,
+                            demos, doc_id and answer_format (Qwen embeddings
+                            of the full rendered prompt)
+        api_key: DashScope API key (default: DASHSCOPE_API_KEY from environment)
+        persistent_cache: Use a CachedLM (exact-match responses stored in the
+                          project's cache/lm_cache) so repeated prompts - e.g.
+                          across optimizer trials and reruns - skip the API
     """
-    api_key = os.getenv("DASHSCOPE_API_KEY")
+    api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
     if not api_key:
         raise ValueError("DASHSCOPE_API_KEY not found in environment")
 
-    # Configure DSPy with Qwen's OpenAI-compatible endpoint
-    lm = dspy.LM(
+    lm_kwargs = dict(
         model=f'openai/{model_name}',
         api_key=api_key,
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
@@ -32,12 +47,37 @@ def setup_dspy_qwen(model_name='qwen-max'):
         max_tokens=1024
     )
 
+    # Configure DSPy with Qwen's OpenAI-compatible endpoint
+    if semantic_threshold is None and not persistent_cache:
+        lm = dspy.LM(**lm_kwargs)
+    elif semantic_threshold is None:
+        from dspy_implementation.dspy_cached_lm import CachedLM
+
+        lm = CachedLM(**lm_kwargs)
+    else:
+        from dspy_implementation.dspy_cached_lm import CachedLM
+        from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+
+        lm = CachedLM(
+            # Uncached DashScope embeddings: prompts are one-off texts, keep
+            # them out of the retriever's query embedding cache
+            embed_fn=get_shared_retriever().embeddings.embeddings.embed_query,
+            semantic_threshold=semantic_threshold,
+            semantic_fields=('doc_id', 'answer_format'),
+            **lm_kwargs
+        )
+
     dspy.configure(lm=lm)
+    open_pooled_sessions()  # Keep-alive HTTP/2 to DashScope for all LM calls
 
     print(f"✅ DSPy configured with {model_name}")
     print(f"   Model: {model_name}")
     print(f"   Temperature: 0.0")
     print(f"   Max tokens: 1024")
+    if persistent_cache or semantic_threshold is not None:
+        print(f"   Response cache: {lm.cache_dir}")
+    if semantic_threshold is not None:
+        print(f"   Semantic response cache: threshold {semantic_threshold}")
 
     return lm
 
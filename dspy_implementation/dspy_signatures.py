@@ -104,6 +104,32 @@ class ESGReasoningWithChainOfThought(dspy.Signature):
 # Utility Functions
 # ============================================================================
 
+# Output budget for Stage 2 by answer format. Extraction only emits the
+# answer value (plus adapter field markers), so numeric answers need a few
+# tokens; Stage 1 reasoning keeps the LM's full max_tokens.
+EXTRACTION_MAX_TOKENS = {
+    "Int": 64,
+    "Float": 64,
+    "Bool": 64,
+    "Str": 256,
+    "List": 512,
+}
+
+
+def extraction_config(answer_format: str) -> dict:
+    """
+    Per-call LM config for AnswerExtraction (pass as `config=` to Predict).
+
+    Args:
+        answer_format: One of ['Int', 'Float', 'Str', 'List']
+
+    Returns:
+        Config dict with max_tokens for the format (empty if unknown)
+    """
+    max_tokens = EXTRACTION_MAX_TOKENS.get(answer_format)
+    return {"max_tokens": max_tokens} if max_tokens else {}
+
+
 def validate_answer_format(answer: str, expected_format: str) -> bool:
     """
     Validate that extracted answer matches expected format.
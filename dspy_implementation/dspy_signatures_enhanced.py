@@ -85,6 +85,28 @@ class AnswerExtraction(dspy.Signature):
     )
 
 
+class BatchedAnswerExtraction(dspy.Signature):
+    """
+    Extract structured answers for several questions at once.
+
+    Instructions are set per call from the (possibly optimized)
+    AnswerExtraction instructions, see BatchedBaselineRAG.
+    """
+    answer_formats: list[str] = dspy.InputField(
+        desc="Required answer format per question: Int, Float, Str, or List"
+    )
+    questions: list[str] = dspy.InputField(
+        desc="Original ESG questions"
+    )
+    analyses: list[str] = dspy.InputField(
+        desc="Chain-of-thought reasoning from Stage 1, one per question"
+    )
+
+    extracted_answers: list[str] = dspy.OutputField(
+        desc="One final answer per question, in question order"
+    )
+
+
 # Keep original signatures for backward compatibility
 class ESGReasoningOriginal(dspy.Signature):
     """Original reasoning signature without query optimization."""
@@ -16,9 +16,12 @@ Expected improvements:
 import sys
 import json
 import os
+import queue
+import atexit
+import logging
+import logging.handlers
 from pathlib import Path
 from datetime import datetime
-from tqdm import tqdm
 import dspy
 from dspy.teleprompt import MIPROv2
 import mlflow
@@ -29,6 +32,8 @@ sys.path.insert(0, str(project_root))
 os.chdir(project_root)
 
 from dspy_implementation.dspy_setup import setup_dspy_qwen
+from dspy_implementation.dspy_batch_lm import OfflineBatchLM
+from dspy_implementation.dspy_async_eval import progress_bar
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
 from dspy_implementation.dspy_rag_enhanced import EnhancedMMESGBenchRAG, BaselineMMESGBenchRAG
 from dspy_implementation.dspy_metrics_enhanced import (
@@ -36,6 +41,37 @@ from dspy_implementation.dspy_metrics_enhanced import (
     evaluate_predictions_enhanced
 )
 from dspy_implementation.mlflow_tracking import DSPyMLFlowTracker, create_run_name
+from dspy_implementation.dspy_http import open_pooled_sessions, close_pooled_sessions
+
+logger = logging.getLogger(__name__)
+
+
+def setup_logging(log_dir: str = "logs/miprov2") -> Path:
+    """
+    Route logs through a QueueHandler so evaluation threads never block on
+    console/file writes; a background QueueListener does the actual I/O.
+
+    Returns:
+        Path to the log file
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = Path(log_dir) / f"enhanced_miprov2_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=50 * 1024 * 1024, backupCount=3)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    return log_file
 
 
 def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation"):
@@ -51,8 +87,10 @@ def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation"):
         Dictionary with retrieval, answer, and end-to-end metrics
     """
     predictions = []
+    errors = 0
 
-    for example in tqdm(examples, desc=desc):
+    progress = progress_bar(examples, desc=desc)
+    for example in progress:
         try:
             pred = rag_module(
                 question=example.question,
@@ -61,7 +99,9 @@ def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation"):
             )
             predictions.append(pred)
         except Exception as e:
-            print(f"\n⚠️  Error on question: {e}")
+            errors += 1
+            progress.set_postfix(errors=errors)
+            logger.warning("⚠️  Error on question: %s", e)
             predictions.append(dspy.Prediction(answer="Failed"))
 
     # Compute enhanced metrics
@@ -72,7 +112,12 @@ def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation"):
 
 def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
                           num_candidates: int = 10,
-                          init_temperature: float = 1.0):
+                          init_temperature: float = 1.0,
+                          model_name: str = 'qwen-max',
+                          use_batch_lm: bool = False,
+                          valset_size: int = 40,
+                          minibatch_size: int = 25,
+                          minibatch_full_eval_steps: int = 4):
     """
     Optimize RAG pipeline with query generation.
 
@@ -89,20 +134,25 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
         mlflow_tracker: MLFlow tracking object
         num_candidates: Number of instruction candidates
         init_temperature: Temperature for candidate generation
+        model_name: Qwen model name (used for the batch LM)
+        use_batch_lm: Route compile-time LM calls through the Batch API
+        valset_size: Train questions held out for scoring trials
+        minibatch_size: Valset questions scored per trial
+        minibatch_full_eval_steps: Trials between full-valset evaluations
 
     Returns:
         Tuple of (optimized_rag, dev_results)
     """
-    print("\n" + "=" * 80)
-    print("BASELINE MIPROV2 OPTIMIZATION - Reasoning + Extraction Only")
-    print("=" * 80)
+    logger.info("\n" + "=" * 80)
+    logger.info("BASELINE MIPROV2 OPTIMIZATION - Reasoning + Extraction Only")
+    logger.info("=" * 80)
 
     # ==================================================
     # Step 1: Evaluate True Baseline on Dev Set (for fair comparison)
     # ==================================================
-    print("\n📊 Step 1: Evaluating TRUE BASELINE on dev set...")
-    print("   This uses raw questions for retrieval (current approach)")
-    print(f"   Dev set: {len(dev_set)} questions")
+    logger.info("\n📊 Step 1: Evaluating TRUE BASELINE on dev set...")
+    logger.info("   This uses raw questions for retrieval (current approach)")
+    logger.info(f"   Dev set: {len(dev_set)} questions")
 
     baseline_rag = BaselineMMESGBenchRAG()
 
@@ -113,10 +163,10 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
         desc="Baseline eval on dev set"
     )
 
-    print(f"\n📈 True Baseline Results (dev set):")
-    print(f"   Retrieval accuracy: {baseline_results['retrieval_accuracy']:.1%}")
-    print(f"   Answer accuracy: {baseline_results['answer_accuracy']:.1%}")
-    print(f"   End-to-end accuracy: {baseline_results['end_to_end_accuracy']:.1%}")
+    logger.info(f"\n📈 True Baseline Results (dev set):")
+    logger.info(f"   Retrieval accuracy: {baseline_results['retrieval_accuracy']:.1%}")
+    logger.info(f"   Answer accuracy: {baseline_results['answer_accuracy']:.1%}")
+    logger.info(f"   End-to-end accuracy: {baseline_results['end_to_end_accuracy']:.1%}")
 
     # Log to MLFlow
     mlflow_tracker.log_baseline(
@@ -134,30 +184,30 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
     # ==================================================
     # Step 2: Skip Enhanced RAG - Use Baseline for Optimization
     # ==================================================
-    print("\n📊 Step 2: Using BASELINE RAG for optimization...")
-    print("   Optimizing only: Reasoning + Extraction prompts")
-    print("   NOT optimizing: Query generation (keeping raw questions)")
+    logger.info("\n📊 Step 2: Using BASELINE RAG for optimization...")
+    logger.info("   Optimizing only: Reasoning + Extraction prompts")
+    logger.info("   NOT optimizing: Query generation (keeping raw questions)")
 
     # Use baseline RAG for optimization (no query generation)
     rag_to_optimize = BaselineMMESGBenchRAG()
 
-    print(f"\n📈 Baseline to be optimized:")
-    print(f"   Retrieval accuracy: {baseline_results['retrieval_accuracy']:.1%}")
-    print(f"   Answer accuracy: {baseline_results['answer_accuracy']:.1%}")
-    print(f"   End-to-end accuracy: {baseline_results['end_to_end_accuracy']:.1%}")
+    logger.info(f"\n📈 Baseline to be optimized:")
+    logger.info(f"   Retrieval accuracy: {baseline_results['retrieval_accuracy']:.1%}")
+    logger.info(f"   Answer accuracy: {baseline_results['answer_accuracy']:.1%}")
+    logger.info(f"   End-to-end accuracy: {baseline_results['end_to_end_accuracy']:.1%}")
 
     # ==================================================
     # Step 3: Configure and Run MIPROv2 Optimization
     # ==================================================
-    print(f"\n🔧 Step 3: Configuring MIPROv2 optimizer...")
-    print(f"   Auto mode: light (6 trials, ~20-30 min)")
-    print(f"   Temperature: {init_temperature}")
-    print(f"   Metric: End-to-end accuracy (retrieval + answer)")
-    print(f"   Training set: {len(train_set)} questions")
+    logger.info(f"\n🔧 Step 3: Configuring MIPROv2 optimizer...")
+    logger.info(f"   Auto mode: light (6 trials, ~20-30 min)")
+    logger.info(f"   Temperature: {init_temperature}")
+    logger.info(f"   Metric: End-to-end accuracy (retrieval + answer)")
+    logger.info(f"   Training set: {len(train_set)} questions")
 
-    print("\n🎯 Optimizing 2 components:")
-    print("   1. ESG reasoning (optimize analysis prompts)")
-    print("   2. Answer extraction (optimize extraction prompts)")
+    logger.info("\n🎯 Optimizing 2 components:")
+    logger.info("   1. ESG reasoning (optimize analysis prompts)")
+    logger.info("   2. Answer extraction (optimize extraction prompts)")
 
     # Log optimization config
     mlflow_tracker.log_params({
@@ -165,42 +215,67 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
         'auto_mode': 'light',
         'init_temperature': init_temperature,
         'train_size': len(train_set),
+        'minibatch_size': minibatch_size,
+        'minibatch_full_eval_steps': minibatch_full_eval_steps,
         'query_optimization': False  # Not optimizing query generation in this test
     })
 
+    # Hold out the tail of the train set for trial scoring so candidates are
+    # ranked on questions they weren't bootstrapped from
+    opt_trainset = train_set[:-valset_size]
+    opt_valset = train_set[-valset_size:]
+
     optimizer = MIPROv2(
         metric=mmesgbench_end_to_end_metric,  # Optimize for both retrieval + answer
         auto="light",  # Light mode: 6 trials, ~20-30 min
         verbose=True
     )
 
-    print(f"\n🚀 Running MIPROv2 optimization...")
-    print(f"   Mode: auto='light' (6 trials, ~20-30 minutes)")
-    print(f"   Training on {len(train_set)} questions (20% of dataset)")
-    print(f"   Progress tracked in MLFlow\\n")
+    logger.info(f"\n🚀 Running MIPROv2 optimization...")
+    logger.info(f"   Mode: auto='light' (6 trials, ~20-30 minutes)")
+    logger.info(f"   Training on {len(opt_trainset)} questions, validating on {len(opt_valset)}")
+    logger.info(f"   Minibatch: {minibatch_size} questions/trial, full eval every {minibatch_full_eval_steps} trials")
+    logger.info(f"   Progress tracked in MLFlow\\n")
 
     os.makedirs("checkpoints", exist_ok=True)
 
+    # Retrieve every train/dev question once; trials then hit the context cache
+    rag_to_optimize.retriever.precompute_contexts(train_set + dev_set)
+
+    # Compile is throughput-bound: optionally trade latency for Batch API
+    # quotas/pricing. Dev-set evaluation below stays on the interactive LM.
+    compile_lm = dspy.settings.lm
+    if use_batch_lm:
+        logger.info(f"   Using DashScope Batch API for compile ({model_name})")
+        compile_lm = OfflineBatchLM(model_name, temperature=0.0, max_tokens=1024)
+
     try:
         # When using auto mode, don't pass manual parameters
         # They are automatically configured by the auto setting
-        optimized_rag = optimizer.compile(
-            student=rag_to_optimize,
-            trainset=train_set
-        )
+        with dspy.context(lm=compile_lm):
+            optimized_rag = optimizer.compile(
+                student=rag_to_optimize,
+                trainset=opt_trainset,
+                valset=opt_valset,
+                # Score each trial on a minibatch; only periodically run the
+                # full valset so weak candidates are dropped cheaply
+                minibatch=True,
+                minibatch_size=minibatch_size,
+                minibatch_full_eval_steps=minibatch_full_eval_steps
+            )
 
-        print("\n✅ MIPROv2 optimization completed!")
+        logger.info("\n✅ MIPROv2 optimization completed!")
 
     except Exception as e:
-        print(f"\n⚠️  Optimization failed: {e}")
-        print(f"   Falling back to baseline")
+        logger.warning(f"\n⚠️  Optimization failed: {e}")
+        logger.info(f"   Falling back to baseline")
         optimized_rag = rag_to_optimize
 
     # ==================================================
     # Step 4: Evaluate Optimized Model on Dev Set
     # ==================================================
-    print("\n📊 Step 4: Evaluating optimized model on dev set...")
-    print(f"   Dev set size: {len(dev_set)} questions (10% of dataset)")
+    logger.info("\n📊 Step 4: Evaluating optimized model on dev set...")
+    logger.info(f"   Dev set size: {len(dev_set)} questions (10% of dataset)")
 
     dev_results, dev_predictions = evaluate_rag_with_metrics(
         optimized_rag,
@@ -209,7 +284,7 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
     )
 
     # Log to MLFlow FIRST (before printing, so it happens even if print crashes)
-    print("\n📊 Logging results to MLFlow...")
+    logger.info("\n📊 Logging results to MLFlow...")
     try:
         mlflow_tracker.log_final_results(dev_results)
 
@@ -231,58 +306,58 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
             predictions_file = f.name
 
         mlflow.log_artifact(predictions_file, "predictions")
-        print(f"   ✅ MLFlow logging complete (run: {mlflow_tracker.run_id})")
-        print(f"   ✅ Predictions artifact saved")
+        logger.info(f"   ✅ MLFlow logging complete (run: {mlflow_tracker.run_id})")
+        logger.info(f"   ✅ Predictions artifact saved")
     except Exception as e:
-        print(f"   ⚠️  MLFlow logging error: {e}")
+        logger.warning(f"   ⚠️  MLFlow logging error: {e}")
 
     # Print results (wrapped in try-except to not crash the whole script)
     try:
-        print(f"\n📈 Dev Set Results (Optimized):")
-        print(f"   Retrieval accuracy: {dev_results['retrieval_accuracy']:.1%} " +
+        logger.info(f"\n📈 Dev Set Results (Optimized):")
+        logger.info(f"   Retrieval accuracy: {dev_results['retrieval_accuracy']:.1%} " +
               f"({dev_results['retrieval_correct']}/{dev_results['total']})")
-        print(f"   Answer accuracy: {dev_results['answer_accuracy']:.1%} " +
+        logger.info(f"   Answer accuracy: {dev_results['answer_accuracy']:.1%} " +
               f"({dev_results['answer_correct']}/{dev_results['total']})")
-        print(f"   End-to-end accuracy: {dev_results['end_to_end_accuracy']:.1%} " +
+        logger.info(f"   End-to-end accuracy: {dev_results['end_to_end_accuracy']:.1%} " +
               f"({dev_results['end_to_end_correct']}/{dev_results['total']})")
 
         # Print format breakdown
-        print(f"\n📋 Format Breakdown (Dev Set):")
+        logger.info(f"\n📋 Format Breakdown (Dev Set):")
         for fmt, stats in dev_results['by_format'].items():
             fmt_str = str(fmt) if fmt is not None else "None"
-            print(f"   {fmt_str:6s}:")
-            print(f"      Retrieval: {stats['retrieval_accuracy']:6.1%} ({stats['retrieval_correct']}/{stats['total']})")
-            print(f"      Answer:    {stats['answer_accuracy']:6.1%} ({stats['answer_correct']}/{stats['total']})")
-            print(f"      E2E:       {stats['end_to_end_accuracy']:6.1%} ({stats['end_to_end_correct']}/{stats['total']})")
+            logger.info(f"   {fmt_str:6s}:")
+            logger.info(f"      Retrieval: {stats['retrieval_accuracy']:6.1%} ({stats['retrieval_correct']}/{stats['total']})")
+            logger.info(f"      Answer:    {stats['answer_accuracy']:6.1%} ({stats['answer_correct']}/{stats['total']})")
+            logger.info(f"      E2E:       {stats['end_to_end_accuracy']:6.1%} ({stats['end_to_end_correct']}/{stats['total']})")
     except Exception as e:
-        print(f"\n⚠️  Error printing results: {e}")
-        print(f"   Results still logged to MLFlow successfully!")
+        logger.warning(f"\n⚠️  Error printing results: {e}")
+        logger.info(f"   Results still logged to MLFlow successfully!")
 
     # ==================================================
     # Step 5: Comparison and Analysis
     # ==================================================
     try:
-        print("\n" + "=" * 80)
-        print("COMPARISON: Baseline vs Optimized")
-        print("=" * 80)
+        logger.info("\n" + "=" * 80)
+        logger.info("COMPARISON: Baseline vs Optimized")
+        logger.info("=" * 80)
 
-        print(f"\n📊 Retrieval Accuracy:")
-        print(f"   Baseline (default prompts):    {baseline_results['retrieval_accuracy']:.1%}")
-        print(f"   Optimized (MIPROv2):           {dev_results['retrieval_accuracy']:.1%}")
+        logger.info(f"\n📊 Retrieval Accuracy:")
+        logger.info(f"   Baseline (default prompts):    {baseline_results['retrieval_accuracy']:.1%}")
+        logger.info(f"   Optimized (MIPROv2):           {dev_results['retrieval_accuracy']:.1%}")
         retrieval_gain = dev_results['retrieval_accuracy'] - baseline_results['retrieval_accuracy']
-        print(f"   Improvement: {retrieval_gain:+.1%}")
+        logger.info(f"   Improvement: {retrieval_gain:+.1%}")
 
-        print(f"\n📊 Answer Accuracy:")
-        print(f"   Baseline (default prompts):    {baseline_results['answer_accuracy']:.1%}")
-        print(f"   Optimized (MIPROv2):           {dev_results['answer_accuracy']:.1%}")
+        logger.info(f"\n📊 Answer Accuracy:")
+        logger.info(f"   Baseline (default prompts):    {baseline_results['answer_accuracy']:.1%}")
+        logger.info(f"   Optimized (MIPROv2):           {dev_results['answer_accuracy']:.1%}")
         answer_gain = dev_results['answer_accuracy'] - baseline_results['answer_accuracy']
-        print(f"   Improvement: {answer_gain:+.1%}")
+        logger.info(f"   Improvement: {answer_gain:+.1%}")
 
-        print(f"\n📊 End-to-End Accuracy:")
-        print(f"   Baseline (default prompts):    {baseline_results['end_to_end_accuracy']:.1%}")
-        print(f"   Optimized (MIPROv2):           {dev_results['end_to_end_accuracy']:.1%}")
+        logger.info(f"\n📊 End-to-End Accuracy:")
+        logger.info(f"   Baseline (default prompts):    {baseline_results['end_to_end_accuracy']:.1%}")
+        logger.info(f"   Optimized (MIPROv2):           {dev_results['end_to_end_accuracy']:.1%}")
         e2e_gain = dev_results['end_to_end_accuracy'] - baseline_results['end_to_end_accuracy']
-        print(f"   Improvement: {e2e_gain:+.1%}")
+        logger.info(f"   Improvement: {e2e_gain:+.1%}")
 
         # Log comparison to MLFlow
         mlflow_tracker.log_comparison(
@@ -292,52 +367,52 @@ def optimize_enhanced_rag(train_set, dev_set, mlflow_tracker,
 
         # Determine success
         if e2e_gain >= 0.03:
-            print(f"\n✅ SUCCESS: Achieved target improvement (+3% or more)!")
+            logger.info(f"\n✅ SUCCESS: Achieved target improvement (+3% or more)!")
         elif e2e_gain > 0:
-            print(f"\n⚠️  Minor improvement, consider more optimization")
+            logger.warning(f"\n⚠️  Minor improvement, consider more optimization")
         else:
-            print(f"\n⚠️  No improvement, may need architecture changes")
+            logger.warning(f"\n⚠️  No improvement, may need architecture changes")
     except Exception as e:
-        print(f"\n⚠️  Error in comparison analysis: {e}")
-        print(f"   Results already logged to MLFlow")
+        logger.warning(f"\n⚠️  Error in comparison analysis: {e}")
+        logger.info(f"   Results already logged to MLFlow")
 
     return optimized_rag, dev_results, dev_predictions
 
 
 def main():
     """Main execution flow."""
-    print("=" * 80)
-    print("BASELINE MIPROV2 OPTIMIZATION - MMESGBench RAG")
-    print("=" * 80)
-    print(f"\nStarted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("=" * 80)
+    logger.info("BASELINE MIPROV2 OPTIMIZATION - MMESGBench RAG")
+    logger.info("=" * 80)
+    logger.info(f"\nStarted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-    print(f"\n🎯 Test: Baseline Prompt Optimization")
-    print(f"   Optimizing: Reasoning + Extraction prompts")
-    print(f"   NOT optimizing: Query generation (testing simplified approach first)")
+    logger.info(f"\n🎯 Test: Baseline Prompt Optimization")
+    logger.info(f"   Optimizing: Reasoning + Extraction prompts")
+    logger.info(f"   NOT optimizing: Query generation (testing simplified approach first)")
 
     # Initialize DSPy
-    print(f"\n📋 Setting up DSPy environment...")
+    logger.info(f"\n📋 Setting up DSPy environment...")
     model_name = os.getenv('QWEN_MODEL', 'qwen-max')
     setup_dspy_qwen(model_name=model_name)
-    print(f"✅ DSPy configured with {model_name}")
+    logger.info(f"✅ DSPy configured with {model_name}")
 
     # Load dataset
-    print(f"\n📊 Loading MMESGBench dataset...")
+    logger.info(f"\n📊 Loading MMESGBench dataset...")
     dataset = MMESGBenchDataset()
 
     train_set = dataset.train_set
     dev_set = dataset.dev_set
     test_set = dataset.test_set
 
-    print(f"\n📈 Dataset Summary:")
-    print(f"   Training: {len(train_set)} questions (20%)")
-    print(f"   Dev: {len(dev_set)} questions (10%)")
-    print(f"   Test: {len(test_set)} questions (70%)")
-    print(f"   Documents: 45/45 (100% coverage)")
-    print(f"   Total chunks: 54,608")
+    logger.info(f"\n📈 Dataset Summary:")
+    logger.info(f"   Training: {len(train_set)} questions (20%)")
+    logger.info(f"   Dev: {len(dev_set)} questions (10%)")
+    logger.info(f"   Test: {len(test_set)} questions (70%)")
+    logger.info(f"   Documents: 45/45 (100% coverage)")
+    logger.info(f"   Total chunks: 54,608")
 
     # Initialize MLFlow tracking
-    print(f"\n📊 Initializing MLFlow tracking...")
+    logger.info(f"\n📊 Initializing MLFlow tracking...")
     tracker = DSPyMLFlowTracker(experiment_name="MMESGBench_Baseline_Optimization")
 
     run_name = create_run_name("baseline_rag_prompt_optimization")
@@ -350,6 +425,7 @@ def main():
             'model': 'qwen-max'
         }
     )
+    open_pooled_sessions()  # Keep-alive HTTP/2 to DashScope for this run
 
     # Run optimization
     try:
@@ -358,11 +434,13 @@ def main():
             dev_set=dev_set,
             mlflow_tracker=tracker,
             num_candidates=10,
-            init_temperature=1.0
+            init_temperature=1.0,
+            model_name=model_name,
+            use_batch_lm=os.getenv('USE_BATCH_LM') == '1'
         )
 
         # Save optimized module
-        print(f"\n💾 Saving optimized module...")
+        logger.info(f"\n💾 Saving optimized module...")
         os.makedirs("dspy_implementation/optimized_modules", exist_ok=True)
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -370,10 +448,10 @@ def main():
 
         try:
             optimized_rag.save(module_path)
-            print(f"   Saved to: {module_path}")
+            logger.info(f"   Saved to: {module_path}")
             tracker.log_model_artifact({'module_path': module_path}, "baseline_rag_module")
         except Exception as e:
-            print(f"   ⚠️  Could not save module: {e}")
+            logger.warning(f"   ⚠️  Could not save module: {e}")
 
         # Save detailed results
         results_file = f"baseline_rag_results_{timestamp}.json"
@@ -409,24 +487,25 @@ def main():
             with open(results_file, 'w') as f:
                 json.dump(detailed_results, f, indent=2)
 
-            print(f"\n💾 Detailed results saved to: {results_file}")
+            logger.info(f"\n💾 Detailed results saved to: {results_file}")
 
             # Log detailed results artifact to MLFlow
             mlflow.log_artifact(results_file, "results")
-            print(f"   ✅ Results artifact logged to MLFlow")
+            logger.info(f"   ✅ Results artifact logged to MLFlow")
         except Exception as e:
-            print(f"   ⚠️  Could not save/log detailed results: {e}")
+            logger.warning(f"   ⚠️  Could not save/log detailed results: {e}")
 
     finally:
         # Always end MLFlow run
         tracker.end_run()
+        close_pooled_sessions()
 
-    print(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 80)
+    logger.info(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("=" * 80)
 
-    print(f"\n🎉 Optimization complete!")
-    print(f"   View MLFlow results: mlflow ui")
-    print(f"   Then open: http://localhost:5000")
+    logger.info(f"\n🎉 Optimization complete!")
+    logger.info(f"   View MLFlow results: mlflow ui")
+    logger.info(f"   Then open: http://localhost:5000")
 
     return optimized_rag, dev_results
 
@@ -456,16 +535,27 @@ if __name__ == "__main__":
         help="Qwen model to use (default: qwen-max, options: qwen2.5-7b-instruct, etc.)"
     )
 
+    parser.add_argument(
+        "--batch-lm",
+        action="store_true",
+        help="Use DashScope Batch API during MIPROv2 compile (cheaper, higher latency)"
+    )
+
     args = parser.parse_args()
 
+    log_file = setup_logging()
+    logger.info(f"📝 Logging to {log_file}")
+
     # Set model as environment variable for main() to use
     os.environ['QWEN_MODEL'] = args.model
+    if args.batch_lm:
+        os.environ['USE_BATCH_LM'] = '1'
 
     # Run optimization
     optimized_module, results = main()
 
-    print("\n✅ Baseline MIPROv2 optimization pipeline complete!")
-    print(f"   Dev end-to-end accuracy: {results['end_to_end_accuracy']:.1%}")
-    print(f"   Dev retrieval accuracy: {results['retrieval_accuracy']:.1%}")
-    print(f"   Dev answer accuracy: {results['answer_accuracy']:.1%}")
-    print("\n   Ready for test set evaluation!")
+    logger.info("\n✅ Baseline MIPROv2 optimization pipeline complete!")
+    logger.info(f"   Dev end-to-end accuracy: {results['end_to_end_accuracy']:.1%}")
+    logger.info(f"   Dev retrieval accuracy: {results['retrieval_accuracy']:.1%}")
+    logger.info(f"   Dev answer accuracy: {results['answer_accuracy']:.1%}")
+    logger.info("\n   Ready for test set evaluation!")
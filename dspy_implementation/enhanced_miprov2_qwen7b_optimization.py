@@ -27,28 +27,30 @@ os.chdir(project_root)
 from dspy_implementation.dspy_setup import setup_dspy_qwen
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
 from dspy_implementation.dspy_rag_enhanced import BaselineMMESGBenchRAG
+from dspy_implementation.dspy_async_eval import run_rag_concurrently
+from dspy_implementation.dspy_cached_lm import CachedLM
+from dspy_implementation.dspy_batch_lm import BatchLM
 from dspy_implementation.dspy_metrics_enhanced import (
     mmesgbench_end_to_end_metric,
     evaluate_predictions_enhanced
 )
 from dspy_implementation.mlflow_tracking import DSPyMLFlowTracker, create_run_name
+from dspy_implementation.dspy_http import open_pooled_sessions, close_pooled_sessions
+
+DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+DASHSCOPE_API_BASE = 'https://dashscope.aliyuncs.com/compatible-mode/v1'
 
 
 def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation"):
-    """Evaluate RAG module with enhanced metrics."""
+    """Evaluate RAG module with enhanced metrics (questions run concurrently)."""
     predictions = []
 
-    for example in tqdm(examples, desc=desc):
-        try:
-            pred = rag_module(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-            predictions.append(pred)
-        except Exception as e:
-            print(f"\n⚠️  Error on question: {e}")
+    for result in run_rag_concurrently(rag_module, examples, desc=desc):
+        if isinstance(result, Exception):
+            tqdm.write(f"\n⚠️  Error on question: {result}")
             predictions.append(dspy.Prediction(answer="Failed"))
+        else:
+            predictions.append(result)
 
     results = evaluate_predictions_enhanced(predictions, examples)
     return results, predictions
@@ -72,22 +74,33 @@ def optimize_with_teacher_student(train_set, dev_set, mlflow_tracker):
     # ==================================================
     print(f"\n📊 Step 1: Evaluating STUDENT BASELINE (qwen2.5-7b-instruct)...")
 
-    # Configure student model
-    student_lm = dspy.LM(
-        model='openai/qwen2.5-7b-instruct',
-        api_key=os.getenv("DASHSCOPE_API_KEY"),
-        api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
-        temperature=0.0,
-        max_tokens=1024
+    # Configure student model (concurrent requests are dynamically batched)
+    student_lm = BatchLM(
+        CachedLM(
+            model='openai/qwen2.5-7b-instruct',
+            api_key=DASHSCOPE_API_KEY,
+            api_base=DASHSCOPE_API_BASE,
+            temperature=0.0,
+            max_tokens=1024
+        ),
+        max_batch=32,
+        max_wait_ms=25
     )
 
-    dspy.configure(lm=student_lm)
     print(f"✅ Configured student model: qwen2.5-7b-instruct")
 
+    # LM choice is scoped with dspy.context (thread/task-local) rather than
+    # reconfiguring global settings between phases
     rag_student = BaselineMMESGBenchRAG()
-    baseline_results, baseline_preds = evaluate_rag_with_metrics(
-        rag_student, dev_set, "Baseline eval (student)"
-    )
+
+    # Retrieval is prompt-independent: fetch train/dev contexts once so the
+    # baseline eval and every MIPROv2 trial read them from the cache
+    rag_student.retriever.precompute_contexts(train_set + dev_set)
+
+    with dspy.context(lm=student_lm):
+        baseline_results, baseline_preds = evaluate_rag_with_metrics(
+            rag_student, dev_set, "Baseline eval (student)"
+        )
 
     print(f"\n📈 Student Baseline Results:")
     print(f"   Retrieval: {baseline_results['retrieval_accuracy']:.1%}")
@@ -105,12 +118,15 @@ def optimize_with_teacher_student(train_set, dev_set, mlflow_tracker):
     # ==================================================
     print(f"\n🔧 Step 2: Configuring TEACHER MODEL (qwen-max) for optimization...")
 
+    # Not cached (neither CachedLM nor DSPy's own cache): sampled proposals
+    # must differ between runs
     teacher_lm = dspy.LM(
         model='openai/qwen-max',
-        api_key=os.getenv("DASHSCOPE_API_KEY"),
-        api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
+        api_key=DASHSCOPE_API_KEY,
+        api_base=DASHSCOPE_API_BASE,
         temperature=1.0,  # Higher temp for diverse prompt generation
-        max_tokens=2048
+        max_tokens=2048,
+        cache=False
     )
 
     print(f"✅ Configured teacher model: qwen-max")
@@ -146,12 +162,13 @@ def optimize_with_teacher_student(train_set, dev_set, mlflow_tracker):
     print(f"   Testing: Can good prompts help weaker models?\n")
 
     try:
-        optimized_rag = optimizer.compile(
-            student=rag_student,
-            trainset=train_set,
-            valset=dev_set,  # Use explicit valset for fair comparison
-            requires_permission_to_run=False  # Skip confirmation prompt
-        )
+        with dspy.context(lm=student_lm):
+            optimized_rag = optimizer.compile(
+                student=rag_student,
+                trainset=train_set,
+                valset=dev_set,  # Use explicit valset for fair comparison
+                requires_permission_to_run=False  # Skip confirmation prompt
+            )
 
         print("\n✅ MIPROv2 optimization completed!")
 
@@ -166,12 +183,10 @@ def optimize_with_teacher_student(train_set, dev_set, mlflow_tracker):
     # ==================================================
     print(f"\n📊 Step 4: Evaluating OPTIMIZED STUDENT...")
 
-    # Make sure we're using student model for evaluation
-    dspy.configure(lm=student_lm)
-
-    opt_results, opt_preds = evaluate_rag_with_metrics(
-        optimized_rag, dev_set, "Optimized eval (student)"
-    )
+    with dspy.context(lm=student_lm):
+        opt_results, opt_preds = evaluate_rag_with_metrics(
+            optimized_rag, dev_set, "Optimized eval (student)"
+        )
 
     print(f"\n📈 Optimized Student Results:")
     print(f"   Retrieval: {opt_results['retrieval_accuracy']:.1%}")
@@ -252,6 +267,7 @@ def main():
             'phase': 'teacher_student_optimization'
         }
     )
+    open_pooled_sessions()  # Keep-alive HTTP/2 to DashScope for this run
 
     # Run optimization
     try:
@@ -294,6 +310,7 @@ def main():
 
     finally:
         tracker.end_run()
+        close_pooled_sessions()
 
     print(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 80)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Evaluation Server - warm process for repeated evaluation runs
+
+Loads the dataset and opens the shared retriever (pgvector pool, embedding
+client, context/embedding caches) once, then runs evaluations on request,
+so each run skips the cold start and reuses the in-process caches.
+
+Usage:
+    python dspy_implementation/eval_server.py --port 8765
+
+    curl -X POST localhost:8765/run \
+        -d '{"approach": "simple_raw", "dataset_name": "dev", "max_questions": 10}'
+
+Runs are executed one at a time (they share the API rate limit); the
+response is the run's summary metrics as JSON.
+"""
+
+import os
+import sys
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import orjson
+
+# Add parent directory to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+
+from dspy_implementation.dspy_dataset import get_dataset
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+
+
+def _simple_raw(dataset_name='dev', max_questions=None, **kwargs):
+    from dspy_implementation.evaluate_simple_baseline_deepseek_raw import evaluate_simple_baseline_raw
+    return evaluate_simple_baseline_raw(dataset_name=dataset_name, max_questions=max_questions, **kwargs)
+
+
+def _simple_deepseek(dataset_name='dev', max_questions=None, **kwargs):
+    from dspy_implementation.evaluate_simple_baseline_deepseek import evaluate_simple_baseline_deepseek
+    return evaluate_simple_baseline_deepseek(dataset_name=dataset_name, max_questions=max_questions, **kwargs)
+
+
+def _simple_qwen(dataset_name='dev', max_questions=None, **kwargs):
+    from dspy_implementation.evaluate_simple_baseline import evaluate_simple_baseline
+    return evaluate_simple_baseline(dataset_name=dataset_name, max_questions=max_questions, **kwargs)
+
+
+def _qwen_baseline_train(max_questions=None, **kwargs):
+    # Always the train set
+    from dspy_implementation.evaluate_qwen_baseline_train import run_qwen_baseline_train
+    return run_qwen_baseline_train(max_questions=max_questions)
+
+
+# approach -> runner(dataset_name, max_questions, **extra) returning a results dict
+APPROACHES = {
+    'simple_raw': _simple_raw,
+    'simple_deepseek': _simple_deepseek,
+    'simple_qwen': _simple_qwen,
+    'qwen_baseline_train': _qwen_baseline_train,
+}
+
+
+def run_evaluation(approach: str, **params) -> dict:
+    """
+    Run one evaluation in this process.
+
+    Args:
+        approach: Key of APPROACHES
+        **params: dataset_name, max_questions and runner-specific options
+
+    Returns:
+        dict: Summary results (per-question predictions are in the run's results file)
+    """
+    if approach not in APPROACHES:
+        raise ValueError(f"Unknown approach: {approach} (expected one of {sorted(APPROACHES)})")
+
+    results = APPROACHES[approach](**params)
+    return {k: v for k, v in results.items() if k != 'predictions'}
+
+
+class EvalRequestHandler(BaseHTTPRequestHandler):
+    """POST /run {approach, dataset_name, max_questions, ...} -> summary JSON"""
+
+    def do_POST(self):
+        if self.path != '/run':
+            self._reply(404, {'error': f"Unknown path: {self.path}"})
+            return
+
+        try:
+            params = orjson.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(params, dict):
+                raise TypeError(f"body is a JSON {type(params).__name__}, not an object")
+            approach = params.pop('approach')
+        except (ValueError, TypeError, KeyError) as e:  # ValueError covers JSONDecodeError
+            self._reply(400, {'error': f"Expected JSON object body with 'approach': {e}"})
+            return
+
+        print(f"\n🚀 Run requested: {approach} {params}")
+        try:
+            self._reply(200, run_evaluation(approach, **params))
+        except Exception as e:
+            print(f"❌ Run failed: {e}")
+            self._reply(500, {'error': str(e)})
+
+    def _reply(self, status: int, body: dict):
+        # Format breakdowns are keyed by None for unanswerable questions
+        payload = orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765):
+    """Warm up the shared dataset and retriever, then serve runs until interrupted."""
+    print("🔥 Warming up shared state...")
+    dataset = get_dataset()
+    print(f"   Dataset: {len(dataset.train_set) + len(dataset.dev_set) + len(dataset.test_set)} questions")
+    get_shared_retriever()
+    print("   Retriever: connected")
+
+    # Single-threaded server: requests queue up and runs never overlap
+    server = HTTPServer((host, port), EvalRequestHandler)
+    print(f"\n✅ Eval server listening on http://{host}:{port}/run")
+    print(f"   Approaches: {', '.join(APPROACHES)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve evaluation runs from a warm process")
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8765, help='Port')
+
+    args = parser.parse_args()
+    serve(host=args.host, port=args.port)
@@ -5,10 +5,10 @@ Validates that DSPy implementation matches 41.3% accuracy baseline
 """
 
 import sys
-import json
 import os
 from pathlib import Path
 from tqdm import tqdm
+import dspy
 
 # Add parent directory to path
 project_root = Path(__file__).parent.parent
@@ -20,7 +20,18 @@ os.chdir(project_root)
 from dspy_implementation.dspy_setup import setup_dspy_qwen
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
 from dspy_implementation.dspy_rag_module import MMESGBenchRAG
-from dspy_implementation.dspy_metrics import evaluate_predictions
+from dspy_implementation.dspy_metrics import (
+    evaluate_predictions,
+    prediction_records,
+    write_results_json
+)
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, progress_bar
+from dspy_implementation.dspy_checkpoint import (
+    CheckpointWriter,
+    as_prediction,
+    checkpoint_record,
+    load_checkpoint
+)
 
 
 def run_baseline_evaluation(use_dev_set=True, max_questions=None):
@@ -69,48 +80,41 @@ def run_baseline_evaluation(use_dev_set=True, max_questions=None):
     rag = MMESGBenchRAG()
 
     # Check for checkpoint
-    checkpoint_file = f"dspy_baseline_{'dev' if use_dev_set else 'test'}_checkpoint.json"
-    if os.path.exists(checkpoint_file):
+    checkpoint_file = f"dspy_baseline_{'dev' if use_dev_set else 'test'}_checkpoint.msgpack"
+    predictions = [as_prediction(p) for p in load_checkpoint(checkpoint_file)]
+    start_idx = len(predictions)
+    if predictions:
         print(f"\n📂 Found checkpoint: {checkpoint_file}")
-        with open(checkpoint_file, 'r') as f:
-            checkpoint = json.load(f)
-        predictions = checkpoint.get('predictions', [])
-        start_idx = len(predictions)
         print(f"   Resuming from question {start_idx + 1}/{len(eval_set)}")
-    else:
-        predictions = []
-        start_idx = 0
 
     # Run evaluation
     print(f"\n🔄 Running evaluation on {len(eval_set)} questions...")
     print("   This may take several minutes...\n")
 
     examples = []
+    checkpoint_every = 10
+
+    # Questions within each checkpoint chunk run concurrently; predictions
+    # are appended to the msgpack checkpoint by a background writer
+    with progress_bar(desc="Evaluating", initial=start_idx, total=len(eval_set)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        for chunk_start in range(start_idx, len(eval_set), checkpoint_every):
+            chunk = eval_set[chunk_start:chunk_start + checkpoint_every]
+
+            for offset, (example, pred) in enumerate(zip(chunk, run_rag_concurrently(rag, chunk, progress=progress))):
+                if isinstance(pred, Exception):
+                    tqdm.write(f"\n⚠️  Error on question {chunk_start + offset + 1}: {pred}")
+                    # Create empty prediction for failed questions
+                    pred = dspy.Prediction(answer="Failed to generate")
 
-    for i, example in enumerate(tqdm(eval_set[start_idx:], desc="Evaluating", initial=start_idx, total=len(eval_set))):
-        try:
-            # Run RAG pipeline
-            pred = rag(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-
-            predictions.append(pred)
-            examples.append(example)
-
-            # Save checkpoint every 10 questions
-            if (len(predictions)) % 10 == 0:
-                with open(checkpoint_file, 'w') as f:
-                    json.dump({'predictions': [vars(p) for p in predictions]}, f)
-                tqdm.write(f"   ✓ Checkpoint saved: {len(predictions)}/{len(eval_set)} questions")
-
-        except Exception as e:
-            print(f"\n⚠️  Error on question {start_idx + i + 1}: {e}")
-            # Create empty prediction for failed questions
-            import dspy
-            predictions.append(dspy.Prediction(answer="Failed to generate"))
-            examples.append(example)
+                predictions.append(pred)
+                examples.append(example)
+                checkpoint.append(checkpoint_record(pred))
+
+            # In-place bar update instead of a flushed line per chunk
+            progress.set_postfix_str(f"ckpt={len(predictions)}", refresh=False)
+
+    print(f"   ✓ Checkpointed: {len(predictions)}/{len(eval_set)} questions")
 
     # Ensure we have examples for all predictions
     if len(examples) < len(predictions):
@@ -168,22 +172,10 @@ def run_baseline_evaluation(use_dev_set=True, max_questions=None):
             "achieved_accuracy": results['accuracy'],
             "difference": diff,
             "within_tolerance": abs(diff) <= 0.005
-        },
-        "predictions": [
-            {
-                "question": ex.question,
-                "doc_id": ex.doc_id,
-                "answer_format": ex.answer_format,
-                "ground_truth": ex.answer,
-                "predicted_answer": pred.answer,
-                "correct": pred.answer == ex.answer
-            }
-            for ex, pred in zip(examples, predictions)
-        ]
+        }
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(detailed_results, f, indent=2)
+    write_results_json(output_file, detailed_results, prediction_records(predictions, examples))
 
     print(f"\n💾 Detailed results saved to: {output_file}")
 
@@ -7,6 +7,8 @@ Validates DSPy implementation against complete MMESGBench dataset
 import sys
 import json
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 import dspy
@@ -19,92 +21,144 @@ sys.path.insert(0, str(project_root))
 os.chdir(project_root)
 
 from dspy_implementation.dspy_setup import setup_dspy_qwen
+from dspy_implementation.dspy_dataset import get_dataset
 from dspy_implementation.dspy_rag_module import MMESGBenchRAG
-from dspy_implementation.dspy_metrics import evaluate_predictions
+from dspy_implementation.dspy_metrics import (
+    evaluate_predictions,
+    prediction_records,
+    write_results_json
+)
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, progress_bar
+from dspy_implementation.dspy_checkpoint import (
+    CheckpointWriter,
+    as_prediction,
+    checkpoint_record,
+    load_checkpoint
+)
+
+CHECKPOINT_FILE = "dspy_full_dataset_checkpoint.msgpack"
+CHECKPOINT_EVERY = 50
+
 
 def load_full_dataset():
-    """Load full MMESGBench dataset with corrections"""
-    import json
-
-    # Load authoritative corrected dataset
-    with open('mmesgbench_dataset_corrected.json', 'r') as f:
-        data = json.load(f)
-
-    # Convert to DSPy examples
-    examples = []
-    for item in data:
-        example = dspy.Example(
-            doc_id=item['doc_id'],
-            question=item['question'],
-            answer=str(item['answer']),
-            answer_format=item['answer_format']
-        ).with_inputs('doc_id', 'question', 'answer_format')
-        examples.append(example)
-
-    return examples
-
-def run_full_evaluation():
-    """Run evaluation on all 933 questions"""
+    """
+    Load full MMESGBench dataset with corrections, in dataset order.
+
+    The parsed dataset comes from get_dataset(), whose pickle cache in
+    CACHE_PATH/dataset_splits.pkl is rebuilt when the dataset file changes.
+    """
+    # doc_id corrections are already applied in the dataset
+    dataset = get_dataset()
+    return dataset.to_dspy_examples(dataset.data)
+
+def evaluate_questions(rag, questions, checkpoint_file: str, desc: str = "Evaluating",
+                       position: int = 0):
+    """
+    Evaluate questions with resume support from a msgpack checkpoint.
+
+    Args:
+        rag: RAG module
+        questions: DSPy examples to evaluate
+        checkpoint_file: msgpack checkpoint for these questions
+        desc: Progress bar description
+        position: Progress bar line (one per shard worker)
+
+    Returns:
+        Predictions aligned with questions (dspy.Prediction for new ones,
+        attribute views for ones resumed from the checkpoint)
+    """
+    predictions = [as_prediction(p) for p in load_checkpoint(checkpoint_file)]
+    start_idx = len(predictions)
+    if predictions:
+        tqdm.write(f"📂 {desc}: resuming from {checkpoint_file} at question {start_idx + 1}/{len(questions)}")
+
+    # Questions within each checkpoint chunk run concurrently; predictions
+    # are appended to the msgpack checkpoint by a background writer
+    with progress_bar(desc=desc, initial=start_idx, total=len(questions), position=position) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        for chunk_start in range(start_idx, len(questions), CHECKPOINT_EVERY):
+            chunk = questions[chunk_start:chunk_start + CHECKPOINT_EVERY]
+
+            for offset, pred in enumerate(run_rag_concurrently(rag, chunk, progress=progress)):
+                if isinstance(pred, Exception):
+                    tqdm.write(f"\n⚠️  {desc}: error on question {chunk_start + offset + 1}: {pred}")
+                    pred = dspy.Prediction(answer="Failed to generate")
+                predictions.append(pred)
+                checkpoint.append(checkpoint_record(pred))
+
+            # In-place bar update instead of a flushed line per chunk
+            progress.set_postfix_str(f"ckpt={len(predictions)}", refresh=False)
+
+    tqdm.write(f"   ✓ {desc}: checkpointed {len(predictions)}/{len(questions)} questions")
+
+    return predictions
+
+
+def _shard_checkpoint_file(shard_id: int, shards: int) -> str:
+    # Keyed by shard count too: rerunning with another --workers splits the
+    # dataset differently and must not resume a stale shard
+    return CHECKPOINT_FILE.replace(".msgpack", f".shard{shard_id}of{shards}.msgpack")
+
+
+def _eval_shard(shard_id: int, shards: int, shard):
+    """Process-pool worker: own DSPy setup, RAG module and checkpoint per shard."""
+    setup_dspy_qwen()
+    rag = MMESGBenchRAG()
+    predictions = evaluate_questions(
+        rag, shard, _shard_checkpoint_file(shard_id, shards),
+        desc=f"Shard {shard_id}", position=shard_id
+    )
+    return [checkpoint_record(pred) for pred in predictions]
+
+
+def run_full_evaluation(workers: int = 1):
+    """
+    Run evaluation on all 933 questions.
+
+    Args:
+        workers: Worker processes; >1 splits the dataset into contiguous
+                 shards, each with its own RAG module and checkpoint
+    """
     print("=" * 80)
     print("DSPy Full Dataset Evaluation - 933 Questions")
     print("=" * 80)
 
-    # Initialize DSPy
-    print("\n📋 Setting up DSPy environment...")
-    setup_dspy_qwen()
-
     # Load full dataset
     print("📊 Loading full MMESGBench dataset (933 questions)...")
     eval_set = load_full_dataset()
     print(f"✅ Loaded {len(eval_set)} questions with document corrections")
     print(f"   Target accuracy: 41.3% (385/933)")
 
-    # Initialize RAG module
-    print("\n🚀 Initializing MMESGBenchRAG module...")
-    rag = MMESGBenchRAG()
-
-    # Check for checkpoint
-    checkpoint_file = "dspy_full_dataset_checkpoint.json"
-    if os.path.exists(checkpoint_file):
-        print(f"\n📂 Found checkpoint: {checkpoint_file}")
-        with open(checkpoint_file, 'r') as f:
-            checkpoint = json.load(f)
-        predictions = [dspy.Prediction(**p) for p in checkpoint.get('predictions', [])]
-        start_idx = len(predictions)
-        print(f"   Resuming from question {start_idx + 1}/{len(eval_set)}")
-    else:
-        predictions = []
-        start_idx = 0
-
     # Run evaluation
     print(f"\n🔄 Running evaluation on {len(eval_set)} questions...")
-    print(f"   Starting from question {start_idx + 1}")
     print("   This will take approximately 30-45 minutes...\n")
 
-    for i, example in enumerate(tqdm(eval_set[start_idx:], desc="Evaluating", initial=start_idx, total=len(eval_set))):
-        try:
-            # Run RAG pipeline
-            pred = rag(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
+    if workers > 1:
+        shard_size = -(-len(eval_set) // workers)  # ceil division
+        shards = [eval_set[i:i + shard_size] for i in range(0, len(eval_set), shard_size)]
+        checkpoint_files = [_shard_checkpoint_file(i, len(shards)) for i in range(len(shards))]
+        print(f"   Sharded across {len(shards)} worker processes")
 
-            predictions.append(pred)
+        predictions = []
+        # spawn: workers must not inherit the parent's threads/connections
+        with ProcessPoolExecutor(max_workers=len(shards),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            shard_preds_iter = executor.map(
+                _eval_shard, range(len(shards)), [len(shards)] * len(shards), shards
+            )
+            for shard_preds in shard_preds_iter:
+                predictions.extend(as_prediction(p) for p in shard_preds)
+    else:
+        # Initialize DSPy
+        print("\n📋 Setting up DSPy environment...")
+        setup_dspy_qwen()
 
-            # Save checkpoint every 50 questions
-            if len(predictions) % 50 == 0:
-                with open(checkpoint_file, 'w') as f:
-                    json.dump({
-                        'predictions': [vars(p) for p in predictions],
-                        'completed': len(predictions),
-                        'total': len(eval_set)
-                    }, f, indent=2)
-                tqdm.write(f"   ✓ Checkpoint saved: {len(predictions)}/{len(eval_set)} questions")
+        # Initialize RAG module
+        print("\n🚀 Initializing MMESGBenchRAG module...")
+        rag = MMESGBenchRAG()
 
-        except Exception as e:
-            tqdm.write(f"\n⚠️  Error on question {start_idx + i + 1}: {e}")
-            predictions.append(dspy.Prediction(answer="Failed to generate"))
+        checkpoint_files = [CHECKPOINT_FILE]
+        predictions = evaluate_questions(rag, eval_set, CHECKPOINT_FILE)
 
     # Evaluate results
     print("\n📊 Computing evaluation metrics...")
@@ -158,35 +212,36 @@ def run_full_evaluation():
             "achieved_accuracy": results['accuracy'],
             "difference": diff,
             "within_tolerance": abs(diff) <= 0.02
-        },
-        "predictions": [
-            {
-                "question": ex.question,
-                "doc_id": ex.doc_id,
-                "answer_format": ex.answer_format,
-                "ground_truth": ex.answer,
-                "predicted_answer": pred.answer,
-                "correct": pred.answer == ex.answer
-            }
-            for ex, pred in zip(examples, predictions)
-        ]
+        }
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(detailed_results, f, indent=2)
+    write_results_json(output_file, detailed_results, prediction_records(predictions, examples))
 
     print(f"\n💾 Detailed results saved to: {output_file}")
 
-    # Clean up checkpoint
-    if os.path.exists(checkpoint_file):
-        os.remove(checkpoint_file)
-        print(f"🧹 Checkpoint removed: {checkpoint_file}")
+    # Clean up checkpoints
+    for checkpoint_file in checkpoint_files:
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+            print(f"🧹 Checkpoint removed: {checkpoint_file}")
 
     return results
 
 
 if __name__ == "__main__":
-    results = run_full_evaluation()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run DSPy full dataset evaluation")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes to shard the dataset across (default: 1)"
+    )
+
+    args = parser.parse_args()
+
+    results = run_full_evaluation(workers=args.workers)
 
     print("\n✅ Full dataset evaluation complete!")
     print(f"   Final accuracy: {results['accuracy']:.1%}")
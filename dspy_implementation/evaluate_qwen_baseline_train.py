@@ -5,10 +5,11 @@ PostgreSQL + Qwen text-embedding-v4 (replacing SentenceTransformer baseline)
 """
 
 import sys
-import json
 import os
+from itertools import islice
 from pathlib import Path
 from tqdm import tqdm
+import dspy
 
 # Add parent directory to path
 project_root = Path(__file__).parent.parent
@@ -18,9 +19,21 @@ sys.path.insert(0, str(project_root))
 os.chdir(project_root)
 
 from dspy_implementation.dspy_setup import setup_dspy_qwen
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
+from dspy_implementation.dspy_dataset import get_dataset
 from dspy_implementation.dspy_rag_module import MMESGBenchRAG
-from dspy_implementation.dspy_metrics import evaluate_predictions
+from dspy_implementation.dspy_metrics import (
+    evaluate_predictions,
+    prediction_records,
+    score_predictions,
+    write_results_json
+)
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, progress_bar, iter_prefetched
+from dspy_implementation.dspy_checkpoint import (
+    CheckpointWriter,
+    as_prediction,
+    checkpoint_record,
+    load_checkpoint
+)
 
 
 def run_qwen_baseline_train(max_questions=None):
@@ -44,7 +57,7 @@ def run_qwen_baseline_train(max_questions=None):
 
     # Load dataset
     print("📊 Loading MMESGBench dataset with corrections...")
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
 
     # Use training set
     eval_set = dataset.train_set
@@ -66,64 +79,53 @@ def run_qwen_baseline_train(max_questions=None):
     rag = MMESGBenchRAG()
 
     # Check for checkpoint
-    checkpoint_file = "qwen_baseline_train_checkpoint.json"
-    if os.path.exists(checkpoint_file):
+    checkpoint_file = "qwen_baseline_train_checkpoint.msgpack"
+    predictions = [as_prediction(p) for p in load_checkpoint(checkpoint_file)]
+    start_idx = len(predictions)
+    if predictions:
         print(f"\n📂 Found checkpoint: {checkpoint_file}")
-        with open(checkpoint_file, 'r') as f:
-            checkpoint = json.load(f)
-        predictions = checkpoint.get('predictions', [])
-        start_idx = len(predictions)
         print(f"   Resuming from question {start_idx + 1}/{len(eval_set)}")
-    else:
-        predictions = []
-        start_idx = 0
 
     # Run evaluation
     print(f"\n🔄 Running evaluation on {len(eval_set)} questions...")
     print("   This may take several minutes...\n")
 
-    examples = []
-
-    for i, example in enumerate(tqdm(eval_set[start_idx:], desc="Evaluating", initial=start_idx, total=len(eval_set))):
-        try:
-            # Run RAG pipeline
-            pred = rag(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-
-            predictions.append(pred)
-            examples.append(example)
-
-            # Save checkpoint every 10 questions
-            if (len(predictions)) % 10 == 0:
-                with open(checkpoint_file, 'w') as f:
-                    json.dump({
-                        'predictions': [
-                            {
-                                'answer': p.answer,
-                                'analysis': getattr(p, 'analysis', ''),
-                                'context': getattr(p, 'context', '')
-                            } for p in predictions
-                        ]
-                    }, f)
-                tqdm.write(f"   ✓ Checkpoint saved: {len(predictions)}/{len(eval_set)} questions")
-
-        except Exception as e:
-            print(f"\n⚠️  Error on question {start_idx + i + 1}: {e}")
-            # Create empty prediction for failed questions
-            import dspy
-            predictions.append(dspy.Prediction(answer="Failed to generate"))
-            examples.append(example)
-
-    # Ensure we have examples for all predictions
-    if len(examples) < len(predictions):
-        examples = eval_set[:len(predictions)]
+    checkpoint_every = 10
+    remaining = islice(eval_set, start_idx, None)
+    chunks = iter(lambda: list(islice(remaining, checkpoint_every)), [])
+
+    def prefetch_contexts(chunk):
+        rag.retriever.retrieve_batch([ex.doc_id for ex in chunk], [ex.question for ex in chunk])
+
+    # Questions within each checkpoint chunk run concurrently, while the next
+    # chunk's contexts are retrieved in the background; predictions are
+    # appended to the msgpack checkpoint by a background writer.
+    # tqdm's total counts the resumed questions too (initial=start_idx)
+    with progress_bar(desc="Evaluating", initial=start_idx, total=len(eval_set)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        for chunk in iter_prefetched(chunks, prefetch_contexts):
+            for pred in run_rag_concurrently(rag, chunk, progress=progress):
+                if isinstance(pred, Exception):
+                    tqdm.write(f"\n⚠️  Error on question {len(predictions) + 1}: {pred}")
+                    # Create empty prediction for failed questions
+                    pred = dspy.Prediction(answer="Failed to generate")
+
+                predictions.append(pred)
+                checkpoint.append(checkpoint_record(pred))
+
+            # In-place bar update instead of a flushed line per chunk
+            progress.set_postfix_str(f"ckpt={len(predictions)}", refresh=False)
+
+    print(f"   ✓ Checkpointed: {len(predictions)}/{len(eval_set)} questions")
+
+    # Predictions (resumed + new) always cover a prefix of eval_set
+    examples = eval_set[:len(predictions)]
 
     # Evaluate results
     print("\n📊 Computing evaluation metrics...")
-    results = evaluate_predictions(predictions, examples)
+    # Score once; metrics and per-question records share the scores
+    scores = score_predictions(predictions, examples)
+    results = evaluate_predictions(predictions, examples, scores=scores)
 
     # Print detailed results
     print("\n" + "=" * 80)
@@ -179,22 +181,10 @@ def run_qwen_baseline_train(max_questions=None):
             "new_baseline": results['accuracy'],
             "difference": diff,
             "improvement": diff >= 0
-        },
-        "predictions": [
-            {
-                "question": ex.question,
-                "doc_id": ex.doc_id,
-                "answer_format": ex.answer_format,
-                "ground_truth": ex.answer,
-                "predicted_answer": pred.answer,
-                "correct": pred.answer == ex.answer
-            }
-            for ex, pred in zip(examples, predictions)
-        ]
+        }
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(detailed_results, f, indent=2)
+    write_results_json(output_file, detailed_results, prediction_records(predictions, examples, scores=scores))
 
     print(f"\n💾 Detailed results saved to: {output_file}")
 
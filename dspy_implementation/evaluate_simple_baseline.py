@@ -12,9 +12,12 @@ Purpose: Fair comparison with Dynamic Cheatsheet's single-stage generation
 
 import os
 import sys
-import json
+import asyncio
+import hashlib
 import argparse
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tqdm import tqdm
 
@@ -23,10 +26,15 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 import dspy
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
+import orjson
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever, SemanticRetrievalCache
+from dspy_implementation.dspy_dataset import get_dataset
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, progress_bar
+from dspy_implementation.dspy_checkpoint import CheckpointWriter, load_checkpoint
+from dspy_implementation.dspy_metrics import format_breakdown
+from dspy_implementation.dspy_http import open_pooled_sessions
 from src.evaluation import eval_score
-from collections import defaultdict
+from src.utils.config import config
 
 
 class SimpleDirectQA(dspy.Signature):
@@ -42,6 +50,8 @@ class SimpleDirectQA(dspy.Signature):
     - For List: Return valid JSON array (e.g., ["item1", "item2"])
     - For None/unanswerable: Return exactly "Not answerable"
     """
+    # doc_id first: questions on the same document share the prompt prefix
+    doc_id: str = dspy.InputField(desc="Source ESG report")
     question: str = dspy.InputField(desc="The ESG question to answer")
     context: str = dspy.InputField(desc="Retrieved document context from ESG reports")
     answer_format: str = dspy.InputField(desc="Required answer format: Int, Float, Str, List, or None")
@@ -59,18 +69,45 @@ class SimpleBaselineRAG(dspy.Module):
     No separate reasoning/extraction stages.
     """
     
-    def __init__(self):
+    def __init__(self, semantic_threshold: float = None):
+        """
+        Args:
+            semantic_threshold: Cosine similarity at which a near-duplicate
+                                question (same document) reuses a cached
+                                context (e.g., 0.97); None disables it
+        """
         super().__init__()
-        self.retriever = DSPyPostgresRetriever()
+        self.retriever = get_shared_retriever()
         self.qa = dspy.Predict(SimpleDirectQA)
+        self.semantic_cache = None
+        if semantic_threshold is not None:
+            self.semantic_cache = SemanticRetrievalCache(
+                threshold=semantic_threshold,
+                cache_file=Path(config.storage.cache_path) / "semantic_retrieval.pkl"
+            )
+    
+    def _retrieve(self, doc_id: str, question: str) -> str:
+        """Top-5 context, served from the semantic cache for near-duplicates"""
+        if self.semantic_cache is None:
+            return self.retriever.retrieve(doc_id, question, top_k=5)
+        
+        # Query embeddings are cached by the retriever, so re-runs skip the API
+        vector = self.retriever.embeddings.embed_query(question)
+        context = self.semantic_cache.lookup(doc_id, vector)
+        if context is None:
+            context = self.retriever.retrieve(doc_id, question, top_k=5)
+            if context:
+                self.semantic_cache.add(doc_id, vector, context)
+        return context
     
     def forward(self, question: str, doc_id: str, answer_format: str):
         """Single-stage forward pass"""
         # Retrieve context
-        context = self.retriever.retrieve(doc_id, question, top_k=5)
+        context = self._retrieve(doc_id, question)
         
         # Direct answer generation (single stage)
         result = self.qa(
+            doc_id=doc_id,
             question=question,
             context=context,
             answer_format=answer_format
@@ -78,9 +115,71 @@ class SimpleBaselineRAG(dspy.Module):
         
         return dspy.Prediction(answer=result.answer, context=context)
 
+    async def aforward(self, question: str, doc_id: str, answer_format: str):
+        """Async forward pass (same stages as forward) for concurrent evaluation."""
+        # Retrieval is blocking (DB + embedding API) - run it off the event loop
+        context = await asyncio.to_thread(self._retrieve, doc_id, question)
+
+        result = await self.qa.acall(
+            doc_id=doc_id,
+            question=question,
+            context=context,
+            answer_format=answer_format
+        )
+
+        return dspy.Prediction(answer=result.answer, context=context)
+
+
+def context_id(context: str) -> str:
+    """Content hash identifying a retrieved context in the context store"""
+    return hashlib.blake2b(context.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def score_prediction(example, pred) -> dict:
+    """
+    Score one prediction into a result record.
+    
+    Args:
+        example: DSPy example with question, answer, answer_format, doc_id
+        pred: SimpleBaselineRAG prediction, or the Exception raised for it
+    
+    Returns:
+        Prediction record (as stored under results['predictions']) plus the
+        retrieved 'context', which the caller moves to the context store
+    """
+    if not isinstance(pred, Exception):
+        try:
+            score = float(eval_score(example.answer, pred.answer, example.answer_format))
+            return {
+                'question': example.question,
+                'ground_truth': example.answer,
+                'answer': pred.answer,
+                'answer_format': example.answer_format,
+                'doc_id': example.doc_id,
+                'context_id': context_id(pred.context),
+                'context': pred.context,
+                'score': score,
+                'correct': score >= 0.5
+            }
+        except Exception as e:
+            pred = e
+    
+    return {
+        'question': example.question,
+        'ground_truth': example.answer,
+        'answer': f"ERROR: {str(pred)}",
+        'answer_format': example.answer_format,
+        'doc_id': example.doc_id,
+        'context_id': None,
+        'context': "",
+        'score': 0.0,
+        'correct': False
+    }
+
 
 def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct", 
-                              max_questions=None, output_file=None):
+                              max_questions=None, output_file=None, semantic_threshold=None,
+                              pretty=False):
     """
     Evaluate simple single-stage baseline.
     
@@ -89,6 +188,10 @@ def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct
         model_name: Model to use (default: qwen2.5-7b-instruct)
         max_questions: Limit number of questions (for testing)
         output_file: Path to save results
+        semantic_threshold: Reuse contexts of near-duplicate questions at this
+                            cosine similarity (None = exact retrieval only)
+        pretty: Indent the results JSON (default: compact - predictions
+                include full retrieved contexts)
     """
     
     print(f"\n{'='*60}")
@@ -113,9 +216,10 @@ def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct
     )
     
     dspy.configure(lm=lm)
+    open_pooled_sessions()  # Keep-alive HTTP/2 to DashScope for all LM calls
     
     # Load dataset
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
     if dataset_name == "dev":
         data = dataset.dev_set
     elif dataset_name == "test":
@@ -127,65 +231,69 @@ def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct
         data = data[:max_questions]
         print(f"⚠️  Limited to {max_questions} questions for testing\n")
     
+    # Group questions by document (stable) so consecutive requests share
+    # the document's prompt prefix; checkpoints follow the same order
+    data = sorted(data, key=lambda ex: ex.doc_id)
+    
     print(f"📊 Evaluating {len(data)} questions...\n")
     
     # Initialize model
-    model = SimpleBaselineRAG()
+    model = SimpleBaselineRAG(semantic_threshold=semantic_threshold)
     
-    # Evaluate
-    predictions = {}
-    correct = 0
-    format_breakdown = defaultdict(lambda: {'correct': 0, 'total': 0})
+    # Resume from checkpoint (one msgpack record per scored question)
+    # Records reference their retrieved context by content hash; each
+    # distinct context is stored once in a side file
+    checkpoint_file = f"simple_baseline_{dataset_name}_checkpoint.msgpack"
+    contexts_checkpoint_file = f"simple_baseline_{dataset_name}_contexts.msgpack"
+    records = load_checkpoint(checkpoint_file)
+    contexts = {c['context_id']: c['context'] for c in load_checkpoint(contexts_checkpoint_file)}
+    start_idx = len(records)
+    if records:
+        print(f"📂 Found checkpoint: {checkpoint_file}")
+        print(f"   Resuming from question {start_idx + 1}/{len(data)}\n")
     
-    for i, example in enumerate(tqdm(data, desc="Evaluating")):
-        q_id = f"q{i}"
-        
-        try:
-            # Get prediction
-            pred = model(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-            
-            answer = pred.answer
-            
-            # Evaluate
-            score = eval_score(example.answer, answer, example.answer_format)
-            is_correct = (score >= 0.5)
-            
-            if is_correct:
-                correct += 1
-            
-            # Store prediction
-            predictions[q_id] = {
-                'question': example.question,
-                'ground_truth': example.answer,
-                'answer': answer,
-                'answer_format': example.answer_format,
-                'doc_id': example.doc_id,
-                'context': pred.context,
-                'score': score,
-                'correct': is_correct
-            }
-            
-            # Update format breakdown
-            format_breakdown[example.answer_format]['correct'] += (1 if is_correct else 0)
-            format_breakdown[example.answer_format]['total'] += 1
+    if model.semantic_cache is None:
+        # Retrieve all contexts up front in batched calls; the QA loop then
+        # reads them from the retriever's context cache
+        model.retriever.precompute_contexts(data[start_idx:])
+    else:
+        # Retrieve per question so near-duplicates are served by the semantic cache
+        print(f"🧠 Semantic retrieval cache: {len(model.semantic_cache)} entries "
+              f"(threshold {semantic_threshold})")
+    
+    # Questions within each checkpoint chunk run concurrently. Scoring runs
+    # in a thread pool while the next chunk's requests are in flight; scored
+    # records are appended (in order) to the checkpoint by a background writer
+    checkpoint_every = 10
+    pending = deque()
+    
+    def drain(wait: bool):
+        while pending and (wait or pending[0].done()):
+            record = pending.popleft().result()
+            context = record.pop('context')
+            if record['context_id'] is not None and record['context_id'] not in contexts:
+                contexts[record['context_id']] = context
+                context_store.append({'context_id': record['context_id'], 'context': context})
+            records.append(record)
+            checkpoint.append(record)
+    
+    with progress_bar(desc="Evaluating", initial=start_idx, total=len(data)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint, \
+            CheckpointWriter(contexts_checkpoint_file) as context_store, \
+            ThreadPoolExecutor(max_workers=4) as scorer:
+        for chunk_start in range(start_idx, len(data), checkpoint_every):
+            chunk = data[chunk_start:chunk_start + checkpoint_every]
             
-        except Exception as e:
-            print(f"\n⚠️  Error on question {i}: {e}")
-            predictions[q_id] = {
-                'question': example.question,
-                'ground_truth': example.answer,
-                'answer': f"ERROR: {str(e)}",
-                'answer_format': example.answer_format,
-                'doc_id': example.doc_id,
-                'context': "",
-                'score': 0.0,
-                'correct': False
-            }
-            format_breakdown[example.answer_format]['total'] += 1
+            for offset, (example, pred) in enumerate(zip(chunk, run_rag_concurrently(model, chunk, progress=progress))):
+                if isinstance(pred, Exception):
+                    tqdm.write(f"\n⚠️  Error on question {chunk_start + offset}: {pred}")
+                pending.append(scorer.submit(score_prediction, example, pred))
+            drain(wait=False)
+        drain(wait=True)
+    
+    predictions = {f"q{i}": record for i, record in enumerate(records)}
+    correct = sum(1 for record in records if record['correct'])
+    breakdown = format_breakdown([r['answer_format'] for r in records], [r['correct'] for r in records])
     
     # Compute metrics
     total = len(data)
@@ -200,8 +308,8 @@ def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct
     print(f"Format-Specific Breakdown:")
     print(f"{'='*60}")
     
-    for fmt in sorted(format_breakdown.keys()):
-        stats = format_breakdown[fmt]
+    for fmt in sorted(breakdown.keys()):
+        stats = breakdown[fmt]
         fmt_acc = stats['correct'] / stats['total'] if stats['total'] > 0 else 0
         print(f"{fmt:8s}: {fmt_acc:6.1%} ({stats['correct']:3d}/{stats['total']:3d})")
     
@@ -211,6 +319,8 @@ def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct
         output_dir = project_root / "results" / f"{dataset_name}_set"
         output_dir.mkdir(parents=True, exist_ok=True)
         output_file = output_dir / f"simple_baseline_{dataset_name}_predictions_{timestamp}.json"
+    output_file = Path(output_file)
+    contexts_file = output_file.with_name(f"{output_file.stem}_contexts.json")
     
     results = {
         'model': model_name,
@@ -221,14 +331,27 @@ def evaluate_simple_baseline(dataset_name="dev", model_name="qwen2.5-7b-instruct
         'overall_accuracy': accuracy,
         'correct': correct,
         'total': total,
-        'format_breakdown': {k: dict(v) for k, v in format_breakdown.items()},
+        'format_breakdown': breakdown,
+        'contexts_file': contexts_file.name,
         'predictions': predictions
     }
     
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    # OPT_NON_STR_KEYS: the format breakdown is keyed by None for
+    # unanswerable questions (written as "null", like json.dump)
+    options = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(results, option=options))
+    
+    # Retrieved contexts, keyed by each prediction's context_id
+    with open(contexts_file, 'wb') as f:
+        f.write(orjson.dumps(contexts))
     
     print(f"\n✅ Results saved to: {output_file}")
+    print(f"   Contexts saved to: {contexts_file}")
+    
+    # Results are saved - the checkpoints are no longer needed
+    os.remove(checkpoint_file)
+    os.remove(contexts_checkpoint_file)
     
     return results
 
@@ -262,6 +385,18 @@ def main():
         default=None,
         help='Output file path (default: auto-generated)'
     )
+    parser.add_argument(
+        '--semantic-threshold',
+        type=float,
+        default=None,
+        help='Reuse retrieved context for near-duplicate questions on the same '
+             'document at this cosine similarity (e.g., 0.97; default: off)'
+    )
+    parser.add_argument(
+        '--pretty',
+        action='store_true',
+        help='Write indented results JSON (default: compact)'
+    )
     
     args = parser.parse_args()
     
@@ -269,7 +404,9 @@ def main():
         dataset_name=args.dataset,
         model_name=args.model,
         max_questions=args.max_questions,
-        output_file=args.output
+        output_file=args.output,
+        semantic_threshold=args.semantic_threshold,
+        pretty=args.pretty
     )
 
 
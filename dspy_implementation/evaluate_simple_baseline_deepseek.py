@@ -5,8 +5,8 @@ Evaluates on dev set (93 questions) for comparison with DC-CU
 """
 
 import os
-import json
 import sys
+import asyncio
 from pathlib import Path
 from datetime import datetime
 from tqdm import tqdm
@@ -16,13 +16,19 @@ import dspy
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_dataset import get_dataset
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+from dspy_implementation.dspy_async_eval import run_pipelined, progress_bar
+from dspy_implementation.dspy_checkpoint import CheckpointWriter, load_checkpoint
+from dspy_implementation.dspy_metrics import format_breakdown, write_results_json
+from dspy_implementation.dspy_http import open_pooled_sessions
 from src.evaluation_utils import eval_score
 
 class SimpleDirectQA(dspy.Signature):
     """Answer ESG questions directly from context with proper formatting"""
     
+    # doc_id first: questions on the same document share the prompt prefix
+    doc_id = dspy.InputField(desc="Source ESG report")
     context = dspy.InputField(desc="Retrieved ESG report context")
     question = dspy.InputField(desc="ESG question to answer")
     answer_format = dspy.InputField(desc="Expected answer format: Int, Float, Str, List, or null")
@@ -37,6 +43,55 @@ class SimpleDirectQA(dspy.Signature):
     CRITICAL: Return ONLY the final answer in the specified format. No explanations, no reasoning, no extra text.""")
 
 
+class SimpleQAModule(dspy.Module):
+    """Retrieve top-5 chunks, then answer in one SimpleDirectQA call"""
+
+    def __init__(self, retriever):
+        super().__init__()
+        self.retriever = retriever
+        self.qa = dspy.Predict(SimpleDirectQA)
+
+    def forward(self, question, doc_id, answer_format):
+        context = self.retriever.retrieve(doc_id, question, top_k=5)
+        return self.qa(doc_id=doc_id, context=context, question=question, answer_format=answer_format)
+
+    async def aforward(self, question, doc_id, answer_format):
+        # Retrieval is blocking (DB + embedding API) - run it off the event loop
+        context = await asyncio.to_thread(self.retriever.retrieve, doc_id, question, 5)
+        return await self.qa.acall(doc_id=doc_id, context=context, question=question, answer_format=answer_format)
+
+    # Split stages for run_pipelined (retrieval batch -> per-item generation)
+
+    def retrieve_batch(self, items):
+        return self.retriever.retrieve_batch(
+            [item['doc_id'] for item in items], [item['question'] for item in items], top_k=5
+        )
+
+    async def agenerate(self, item, context):
+        return await self.qa.acall(doc_id=item['doc_id'], context=context, question=item['question'],
+                                   answer_format=item['answer_format'])
+
+
+def score_result(item, result):
+    """Score one SimpleQAModule result (or the Exception raised for it) into a prediction record"""
+    record = {
+        'question': item['question'],
+        'doc_id': item['doc_id'],
+        'answer_format': item['answer_format'],
+        'ground_truth': item['answer'],
+        'predicted': f'ERROR: {str(result)}',
+        'correct': False,
+        'score': 0.0
+    }
+    
+    if not isinstance(result, Exception):
+        pred = result.answer.strip()
+        answer_score = float(eval_score(item['answer'], pred, item['answer_format']))
+        record.update(predicted=pred, correct=answer_score >= 0.5, score=answer_score)
+    
+    return record
+
+
 def setup_deepseek(model_name='deepseek-v3.1'):
     """Configure DSPy to use DeepSeek v3.1 via DashScope OpenAI-compatible endpoint"""
     from dotenv import load_dotenv
@@ -56,6 +111,7 @@ def setup_deepseek(model_name='deepseek-v3.1'):
     )
     
     dspy.configure(lm=lm)
+    open_pooled_sessions()  # Keep-alive HTTP/2 to DashScope for all LM calls
     
     print(f"✅ DSPy configured with DeepSeek")
     print(f"   Model: {model_name}")
@@ -77,7 +133,7 @@ def evaluate_simple_baseline_deepseek(dataset_name='dev', model_name='deepseek-v
     
     # Load dataset
     print(f"\n📊 Loading {dataset_name} set...")
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
     
     if dataset_name == 'dev':
         eval_set = dataset.dev_set
@@ -89,76 +145,59 @@ def evaluate_simple_baseline_deepseek(dataset_name='dev', model_name='deepseek-v
     if max_questions:
         eval_set = eval_set[:max_questions]
     
+    # Group questions by document (stable) so consecutive requests share
+    # the document's prompt prefix; checkpoints follow the same order
+    eval_set = sorted(eval_set, key=lambda item: item['doc_id'])
+    
     print(f"   Total questions: {len(eval_set)}")
     
     # Initialize retriever and module
     print("\n🔧 Initializing retriever...")
-    retriever = DSPyPostgresRetriever()
+    retriever = get_shared_retriever()
     
     print("\n🤖 Creating Simple QA module...")
-    qa_module = dspy.Predict(SimpleDirectQA)
+    qa_module = SimpleQAModule(retriever)
     
     # Evaluate
     print(f"\n🧪 Running evaluation on {len(eval_set)} questions...")
     
-    correct = 0
-    predictions = []
-    format_breakdown = {}
-    
-    for i, item in enumerate(tqdm(eval_set, desc="Evaluating")):
-        question = item['question']
-        doc_id = item['doc_id']
-        answer_format = item['answer_format']
-        gt = item['answer']
-        
-        # Track format
-        if answer_format not in format_breakdown:
-            format_breakdown[answer_format] = {'correct': 0, 'total': 0}
-        format_breakdown[answer_format]['total'] += 1
-        
-        try:
-            # Retrieve context
-            retrieved = retriever.retrieve_contexts([doc_id], question, top_k=5)
-            context = "\n\n".join(retrieved)
-            
-            # Get answer
-            result = qa_module(
-                context=context,
-                question=question,
-                answer_format=answer_format
-            )
-            
-            pred = result.answer.strip()
-            
-            # Evaluate
-            answer_score = eval_score(gt, pred, answer_format)
-            is_correct = (answer_score >= 0.5)
-            
-            if is_correct:
-                correct += 1
-                format_breakdown[answer_format]['correct'] += 1
-            
-            predictions.append({
-                'question': question,
-                'doc_id': doc_id,
-                'answer_format': answer_format,
-                'ground_truth': gt,
-                'predicted': pred,
-                'correct': is_correct,
-                'score': answer_score
-            })
-            
-        except Exception as e:
-            print(f"\n⚠️  Error on question {i+1}: {e}")
-            predictions.append({
-                'question': question,
-                'doc_id': doc_id,
-                'answer_format': answer_format,
-                'ground_truth': gt,
-                'predicted': f'ERROR: {str(e)}',
-                'correct': False,
-                'score': 0.0
-            })
+    # Resume from checkpoint (one msgpack record per scored question)
+    checkpoint_file = f"simple_baseline_deepseek_{dataset_name}_checkpoint.msgpack"
+    predictions = load_checkpoint(checkpoint_file)
+    start_idx = len(predictions)
+    if predictions:
+        print(f"   Resuming from question {start_idx + 1}/{len(eval_set)} ({checkpoint_file})")
+    
+    remaining = eval_set[start_idx:]
+    
+    async def answer_and_score(item, context):
+        result = await qa_module.agenerate(item, context)
+        # eval_score is CPU work - keep it off the event loop so the next QA
+        # request is dispatched immediately
+        return await asyncio.to_thread(score_result, item, result)
+    
+    def on_result(idx, record):
+        if isinstance(record, Exception):
+            tqdm.write(f"\n⚠️  Error on question {start_idx + idx + 1}: {record}")
+            record = score_result(remaining[idx], record)
+        predictions.append(record)
+        checkpoint.append(record)
+    
+    # Batched retrieval feeds a bounded queue drained by concurrent QA calls,
+    # so DB/embedding latency overlaps LLM latency. Scored records reach the
+    # checkpoint (background writer) in question order
+    with progress_bar(desc="Evaluating", initial=start_idx, total=len(eval_set)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        run_pipelined(
+            qa_module.retrieve_batch,
+            answer_and_score,
+            remaining,
+            on_result=on_result,
+            progress=progress
+        )
+    
+    correct = sum(1 for record in predictions if record['correct'])
+    breakdown = format_breakdown([r['answer_format'] for r in predictions], [r['correct'] for r in predictions])
     
     # Calculate accuracy
     accuracy = correct / len(eval_set)
@@ -170,9 +209,9 @@ def evaluate_simple_baseline_deepseek(dataset_name='dev', model_name='deepseek-v
     print(f"Accuracy: {accuracy:.1%} ({correct}/{len(eval_set)})")
     print("\nFormat Breakdown:")
     
-    valid_formats = [k for k in format_breakdown.keys() if k is not None]
+    valid_formats = [k for k in breakdown.keys() if k is not None]
     for fmt in sorted(valid_formats):
-        stats = format_breakdown[fmt]
+        stats = breakdown[fmt]
         fmt_acc = (stats['correct'] / stats['total'] * 100) if stats['total'] > 0 else 0
         print(f"  {fmt}: {fmt_acc:.1f}% ({stats['correct']}/{stats['total']})")
     
@@ -187,16 +226,20 @@ def evaluate_simple_baseline_deepseek(dataset_name='dev', model_name='deepseek-v
         'total': len(eval_set),
         'correct': correct,
         'accuracy': accuracy,
-        'format_breakdown': format_breakdown,
+        'format_breakdown': breakdown,
         'predictions': predictions,
         'timestamp': timestamp
     }
     
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    # Per-question records are streamed one line each after the summary
+    summary = {k: v for k, v in results.items() if k != 'predictions'}
+    write_results_json(output_file, summary, predictions)
     
     print(f"\n💾 Results saved to: {output_file}")
     
+    # Results are saved - the checkpoint is no longer needed
+    os.remove(checkpoint_file)
+    
     return results
 
 
@@ -5,33 +5,43 @@ Fair comparison with DC-CU - both use direct LLM calls without framework overhea
 """
 
 import os
-import json
 import sys
+import json
+import asyncio
+import hashlib
+import random
+import multiprocessing
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from tqdm import tqdm
-from openai import OpenAI
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
 from dotenv import load_dotenv
+from tqdm import tqdm
+from diskcache import Cache
 
 # Add project root to path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_postgres_retriever import DSPyPostgresRetriever
+from dspy_implementation.dspy_dataset import get_dataset
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+from dspy_implementation.dspy_async_eval import DEFAULT_MAX_CONCURRENT, progress_bar
+from dspy_implementation.dspy_http import pooled_async_client
+from dspy_implementation.dspy_checkpoint import CheckpointWriter, load_checkpoint
+from dspy_implementation.dspy_metrics import format_breakdown, write_results_json
 from src.evaluation_utils import eval_score
+from src.utils.config import config
 
 
-def create_simple_baseline_prompt(context, question, answer_format):
-    """Create a simple 1-stage prompt for direct QA"""
-    return f"""You are an ESG (Environmental, Social, Governance) analyst. Answer the following question based ONLY on the provided context from an ESG report.
-
-Context from ESG Report:
-{context}
-
-Question: {question}
-
-Expected Answer Format: {answer_format}
+# Static prompt segments, built once (prompts differ only in the slots between them)
+PROMPT_PREFIX = (
+    "You are an ESG (Environmental, Social, Governance) analyst. Answer the following question "
+    "based ONLY on the provided context from an ESG report.\n\n[Document: "
+)
+PROMPT_CONTEXT = "]\nContext from ESG Report:\n"
+PROMPT_QUESTION = "\n\nQuestion: "
+PROMPT_FORMAT = "\n\nExpected Answer Format: "
+PROMPT_SUFFIX = """
 
 Instructions:
 - For Int: Return only the integer number (e.g., '5')
@@ -45,8 +55,160 @@ CRITICAL: Return ONLY the final answer in the specified format. No explanations,
 Answer:"""
 
 
-def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1', max_questions=None):
-    """Evaluate Simple Baseline (raw LLM calls, no DSPy) with DeepSeek on dev set"""
+def create_simple_baseline_prompt(doc_id, context, question, answer_format):
+    """
+    Create a simple 1-stage prompt for direct QA
+
+    Static instructions and the document header come first, so prompts for
+    questions on the same document share a prefix (server-side prefix cache).
+    """
+    return "".join((PROMPT_PREFIX, str(doc_id), PROMPT_CONTEXT, str(context), PROMPT_QUESTION,
+                    str(question), PROMPT_FORMAT, str(answer_format), PROMPT_SUFFIX))
+
+
+def completion_request(model_name, item, context) -> dict:
+    """Chat completion request body for one question"""
+    return {
+        'model': model_name,
+        'messages': [
+            {"role": "user", "content": create_simple_baseline_prompt(
+                item['doc_id'], context, item['question'], item['answer_format'])}
+        ],
+        'temperature': 0.0,
+        'max_tokens': 512
+    }
+
+
+# Transient API failures (429, 5xx, connection resets/timeouts) are retried;
+# anything else (bad request, auth) fails the question immediately
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+MAX_ATTEMPTS = 5
+
+
+async def create_completion(client, request: dict, max_attempts: int = MAX_ATTEMPTS):
+    """
+    Chat completion with exponential backoff on transient errors.
+
+    Args:
+        client: AsyncOpenAI client (created with max_retries=0 - retries happen here)
+        request: Chat completion request body
+        max_attempts: Attempts before the last error is raised
+
+    Returns:
+        Chat completion response
+    """
+    for attempt in range(max_attempts):
+        try:
+            return await client.chat.completions.create(**request)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_attempts - 1:
+                raise
+            # Exponential backoff with jitter: ~1s, 2s, 4s, 8s (capped at 30s),
+            # so throttled requests don't retry in lockstep
+            wait_time = min(2 ** attempt, 30) + random.uniform(0, 1)
+            tqdm.write(f"   ⏳ {type(e).__name__} (attempt {attempt + 1}/{max_attempts}), retrying in {wait_time:.1f}s...")
+            await asyncio.sleep(wait_time)
+
+
+async def batch_completions(client, requests, poll_interval_s: float = 30.0) -> list:
+    """
+    Run chat completion requests through the OpenAI-compatible Batch API.
+
+    Offline runs trade latency for cost: all requests are uploaded as one
+    JSONL batch job, which is polled until it finishes.
+
+    Returns:
+        List aligned with requests: answer text, or an Exception for a
+        request that failed or is missing from the output
+    """
+    lines = [
+        json.dumps({"custom_id": str(i), "method": "POST", "url": "/v1/chat/completions", "body": request},
+                   ensure_ascii=False)
+        for i, request in enumerate(requests)
+    ]
+    batch_input = await client.files.create(
+        file=("batch_input.jsonl", "\n".join(lines).encode('utf-8')),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_input.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"📦 Submitted batch {batch.id} ({len(requests)} requests), polling every {poll_interval_s:.0f}s...")
+    
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval_s)
+        batch = await client.batches.retrieve(batch.id)
+    
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+    
+    answers = [RuntimeError("Missing from batch output")] * len(requests)
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get('response') or {}
+            if response.get('status_code') == 200:
+                answer_text = response['body']['choices'][0]['message']['content'].strip()
+            else:
+                answer_text = RuntimeError(f"Batch request failed: {result.get('error') or response.get('body')}")
+            answers[int(result['custom_id'])] = answer_text
+    
+    return answers
+
+
+def completion_key(request: dict) -> str:
+    """Response cache key for a chat completion request (model, messages, sampling)"""
+    payload = json.dumps(request, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def answer_record(item, pred):
+    """Unscored prediction record for one raw LLM answer (or the Exception raised for it)"""
+    record = {
+        'question': item['question'],
+        'doc_id': item['doc_id'],
+        'answer_format': item['answer_format'],
+        'ground_truth': item['answer'],
+        'predicted': pred
+    }
+    if isinstance(pred, Exception):
+        record.update(predicted=f'ERROR: {str(pred)}', error=True)
+    return record
+
+
+def score_record(record):
+    """Add eval_score results to an answer_record (runs in a worker process)"""
+    record = {**record, 'correct': False, 'score': 0.0}
+    if record.pop('error', False):
+        return record
+    
+    try:
+        answer_score = float(eval_score(record['ground_truth'], record['predicted'], record['answer_format']))
+        record.update(correct=answer_score >= 0.5, score=answer_score)
+    except Exception as e:
+        tqdm.write(f"\n⚠️  Error on question: {record['question'][:50]}: {e}")
+        record['predicted'] = f'ERROR: {str(e)}'
+    
+    return record
+
+
+def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1', max_questions=None,
+                                 use_cache=True, use_batch=False):
+    """
+    Evaluate Simple Baseline (raw LLM calls, no DSPy) with DeepSeek on dev set
+
+    Completions are deterministic (temperature 0), so responses are cached on
+    disk by request and re-runs only call the API for new prompts. With
+    use_batch, uncached prompts go through the Batch API (one offline job)
+    instead of concurrent requests.
+    """
     
     print("="*70)
     print("Simple Baseline (RAW) Evaluation with DeepSeek v3")
@@ -61,19 +223,24 @@ def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1',
     if not api_key:
         raise ValueError("DASHSCOPE_API_KEY not found in environment")
     
-    # Initialize OpenAI client (same as DC uses)
-    client = OpenAI(
+    # Initialize OpenAI client (same as DC uses; async for concurrent requests)
+    client = AsyncOpenAI(
         api_key=api_key,
-        base_url='https://dashscope.aliyuncs.com/compatible-mode/v1'
+        base_url='https://dashscope.aliyuncs.com/compatible-mode/v1',
+        max_retries=0,  # create_completion owns retries (backoff with jitter)
+        http_client=pooled_async_client(timeout_s=120.0)  # Keep-alive pool sized for concurrency
     )
     
     print(f"\n✅ Initialized with DeepSeek v3.1")
     print(f"   Model: {model_name}")
     print(f"   API: Direct OpenAI-compatible calls (no DSPy)")
     
+    # diskcache is SQLite (WAL) backed - safe for concurrent readers/writers
+    response_cache = Cache(str(Path(config.storage.cache_path) / "raw_llm")) if use_cache else None
+    
     # Load dataset
     print(f"\n📊 Loading {dataset_name} set...")
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
     
     if dataset_name == 'dev':
         eval_set = dataset.dev_set
@@ -85,81 +252,113 @@ def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1',
     if max_questions:
         eval_set = eval_set[:max_questions]
     
+    # Group questions by document (stable) so consecutive requests share
+    # the document's prompt prefix
+    eval_set = sorted(eval_set, key=lambda item: item['doc_id'])
+    
     print(f"   Total questions: {len(eval_set)}")
     
     # Initialize retriever
     print("\n🔧 Initializing retriever...")
-    retriever = DSPyPostgresRetriever()
+    retriever = get_shared_retriever()
     
     # Evaluate
     print(f"\n🧪 Running evaluation on {len(eval_set)} questions...")
     
-    correct = 0
-    predictions = []
-    format_breakdown = {}
+    # Resume from checkpoint (one msgpack record per answered question)
+    checkpoint_file = f"simple_baseline_raw_deepseek_{dataset_name}_checkpoint.msgpack"
+    predictions = load_checkpoint(checkpoint_file)
+    start_idx = len(predictions)
+    if predictions:
+        print(f"   Resuming from question {start_idx + 1}/{len(eval_set)} ({checkpoint_file})")
+    
+    remaining = eval_set[start_idx:]
     
-    for i, item in enumerate(tqdm(eval_set, desc="Evaluating")):
-        question = item['question']
-        doc_id = item['doc_id']
-        answer_format = item['answer_format']
-        gt = item['answer']
+    # Retrieval pass first (batched embedding + SQL), then all prompts are
+    # dispatched concurrently (or as one batch job); scoring happens after
+    contexts = retriever.retrieve_batch(
+        [item['doc_id'] for item in remaining],
+        [item['question'] for item in remaining],
+        top_k=5
+    )
+    
+    requests = [completion_request(model_name, item, context) for item, context in zip(remaining, contexts)]
+    keys = [completion_key(request) for request in requests]
+    
+    async def answer(idx):
+        if response_cache is not None and (cached := response_cache.get(keys[idx])) is not None:
+            return cached
         
-        # Track format
-        if answer_format not in format_breakdown:
-            format_breakdown[answer_format] = {'correct': 0, 'total': 0}
-        format_breakdown[answer_format]['total'] += 1
+        # Call LLM directly (same as DC). Backoff sleeps keep the semaphore
+        # slot, so retries never push concurrency past the budget
+        response = await create_completion(client, requests[idx])
+        answer_text = response.choices[0].message.content.strip()
+        if response_cache is not None:
+            response_cache.set(keys[idx], answer_text)
+        return answer_text
+    
+    async def answer_all(progress, checkpoint):
+        semaphore = asyncio.Semaphore(DEFAULT_MAX_CONCURRENT)
+        answered = {}
         
-        try:
-            # Retrieve context
-            context = retriever.retrieve(doc_id, question, top_k=5)
-            
-            # Create prompt
-            prompt = create_simple_baseline_prompt(context, question, answer_format)
-            
-            # Call LLM directly (same as DC)
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,
-                max_tokens=512
-            )
-            
-            pred = response.choices[0].message.content.strip()
+        def record(idx, pred):
+            answered[idx] = answer_record(remaining[idx], pred)
+            progress.update(1)
             
-            # Evaluate
-            answer_score = eval_score(gt, pred, answer_format)
-            is_correct = (answer_score >= 0.5)
-            
-            if is_correct:
-                correct += 1
-                format_breakdown[answer_format]['correct'] += 1
-            
-            predictions.append({
-                'question': question,
-                'doc_id': doc_id,
-                'answer_format': answer_format,
-                'ground_truth': gt,
-                'predicted': pred,
-                'correct': is_correct,
-                'score': answer_score
-            })
-            
-        except Exception as e:
-            print(f"\n⚠️  Error on question {i+1}: {e}")
-            predictions.append({
-                'question': question,
-                'doc_id': doc_id,
-                'answer_format': answer_format,
-                'ground_truth': gt,
-                'predicted': f'ERROR: {str(e)}',
-                'correct': False,
-                'score': 0.0
-            })
+            # Hand records to the checkpoint in question order
+            while len(predictions) - start_idx in answered:
+                rec = answered.pop(len(predictions) - start_idx)
+                predictions.append(rec)
+                checkpoint.append(rec)
+        
+        async def answer_and_record(idx):
+            async with semaphore:
+                try:
+                    pred = await answer(idx)
+                except Exception as e:
+                    pred = e
+            record(idx, pred)
+        
+        async def batch_answer_and_record():
+            answers = [response_cache.get(key) if response_cache is not None else None for key in keys]
+            misses = [idx for idx, pred in enumerate(answers) if pred is None]
+            if misses:
+                batch_answers = await batch_completions(client, [requests[idx] for idx in misses])
+                for idx, pred in zip(misses, batch_answers):
+                    answers[idx] = pred
+                    if response_cache is not None and not isinstance(pred, Exception):
+                        response_cache.set(keys[idx], pred)
+            for idx, pred in enumerate(answers):
+                record(idx, pred)
+        
+        try:
+            if use_batch:
+                await batch_answer_and_record()
+            else:
+                await asyncio.gather(*(answer_and_record(idx) for idx in range(len(remaining))))
+        finally:
+            await client.close()
+            if response_cache is not None:
+                response_cache.close()
+    
+    with progress_bar(desc="Evaluating", initial=start_idx, total=len(eval_set)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        asyncio.run(answer_all(progress, checkpoint))
+    
+    # Score once all answers are in (checkpointed and resumed records are
+    # unscored): eval_score is independent CPU work per question, so it runs
+    # in parallel worker processes instead of competing with the event loop
+    print(f"\n📏 Scoring {len(predictions)} answers...")
+    # spawn: by now this process has an event loop, DB pool and tqdm
+    # threads (and may be the long-lived eval_server) - forking it can deadlock
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        predictions = list(pool.map(score_record, predictions, chunksize=64))
+    
+    correct = sum(1 for record in predictions if record['correct'])
     
     # Calculate accuracy
     accuracy = correct / len(eval_set)
+    breakdown = format_breakdown([p['answer_format'] for p in predictions], [p['correct'] for p in predictions])
     
     # Print results
     print("\n" + "="*70)
@@ -168,9 +367,9 @@ def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1',
     print(f"Accuracy: {accuracy:.1%} ({correct}/{len(eval_set)})")
     print("\nFormat Breakdown:")
     
-    valid_formats = [k for k in format_breakdown.keys() if k is not None]
+    valid_formats = [k for k in breakdown.keys() if k is not None]
     for fmt in sorted(valid_formats):
-        stats = format_breakdown[fmt]
+        stats = breakdown[fmt]
         fmt_acc = (stats['correct'] / stats['total'] * 100) if stats['total'] > 0 else 0
         print(f"  {fmt}: {fmt_acc:.1f}% ({stats['correct']}/{stats['total']})")
     
@@ -186,16 +385,20 @@ def evaluate_simple_baseline_raw(dataset_name='dev', model_name='deepseek-v3.1',
         'total': len(eval_set),
         'correct': correct,
         'accuracy': accuracy,
-        'format_breakdown': format_breakdown,
+        'format_breakdown': breakdown,
         'predictions': predictions,
         'timestamp': timestamp
     }
     
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    # Per-question records are streamed one line each after the summary
+    summary = {k: v for k, v in results.items() if k != 'predictions'}
+    write_results_json(output_file, summary, predictions)
     
     print(f"\n💾 Results saved to: {output_file}")
     
+    # Results are saved - the checkpoint is no longer needed
+    os.remove(checkpoint_file)
+    
     return results
 
 
@@ -206,12 +409,16 @@ if __name__ == "__main__":
     parser.add_argument('--dataset', default='dev', choices=['dev', 'test'], help='Dataset to evaluate')
     parser.add_argument('--model', default='deepseek-v3.1', help='DeepSeek model name')
     parser.add_argument('--max-questions', type=int, default=None, help='Limit number of questions')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the API (skip the response cache)')
+    parser.add_argument('--batch', action='store_true', help='Submit prompts via the Batch API (offline, lower cost)')
     
     args = parser.parse_args()
     
     evaluate_simple_baseline_raw(
         dataset_name=args.dataset,
         model_name=args.model,
-        max_questions=args.max_questions
+        max_questions=args.max_questions,
+        use_cache=not args.no_cache,
+        use_batch=args.batch
     )
 
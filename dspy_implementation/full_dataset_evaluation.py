@@ -8,15 +8,23 @@ Evaluates 3 approaches on full 933-question dataset:
 3. Optimized RAG (MIPROv2 light mode)
 
 Expected runtime: ~3-4 hours total (933 questions)
+
+The approaches share questions and often contexts, so LM calls go through a
+persistent response cache: an identical prompt (e.g. on a resumed run) reuses
+its earlier completion.
+
+To scale past one API key's rate limit, run K processes with
+--shards K --shard-id I (each uses DASHSCOPE_API_KEY_I if set) and combine
+their results with merge_full_dataset_shards.py.
 """
 
 import sys
-import json
 import os
 from pathlib import Path
 from datetime import datetime
 from tqdm import tqdm
 import dspy
+import orjson
 
 # Add parent directory to path
 project_root = Path(__file__).parent.parent
@@ -24,9 +32,17 @@ sys.path.insert(0, str(project_root))
 os.chdir(project_root)
 
 from dspy_implementation.dspy_setup import setup_dspy_qwen
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
+from dspy_implementation.dspy_dataset import get_dataset
 from dspy_implementation.dspy_rag_enhanced import EnhancedMMESGBenchRAG, BaselineMMESGBenchRAG
-from dspy_implementation.dspy_metrics_enhanced import evaluate_predictions_enhanced
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+from dspy_implementation.dspy_metrics_enhanced import aggregate_detailed_metrics, detailed_metric_rows
+from dspy_implementation.dspy_metrics import write_results_json
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, progress_bar
+from dspy_implementation.dspy_checkpoint import CheckpointWriter, load_checkpoint, checkpoint_record
+
+CHECKPOINT_EVERY = 10
+# Retrieval metrics need the context, answer metrics the answer
+CHECKPOINT_FIELDS = ('answer', 'context')
 
 
 def load_optimized_module(checkpoint_path: str):
@@ -47,8 +63,19 @@ def load_optimized_module(checkpoint_path: str):
     return optimized_rag
 
 
-def evaluate_approach(rag_module, dataset, approach_name: str, output_file: str):
-    """Evaluate a RAG approach on full dataset."""
+def question_key(example):
+    """Examples with the same key get the same prediction"""
+    return (example.doc_id, example.question, example.answer_format)
+
+
+def evaluate_approach(rag_module, dataset, approach_name: str, output_file: str, checkpoint_file: str):
+    """
+    Evaluate a RAG approach on full dataset.
+
+    Predictions (answer + retrieved context, all the metrics need) are
+    appended to a msgpack checkpoint as chunks complete, so an interrupted
+    run resumes where it stopped.
+    """
 
     print(f"\n{'='*80}")
     print(f"EVALUATING: {approach_name}")
@@ -56,22 +83,37 @@ def evaluate_approach(rag_module, dataset, approach_name: str, output_file: str)
     print(f"Dataset size: {len(dataset)} questions")
     print(f"Output file: {output_file}")
 
-    # Run predictions
-    predictions = []
-    for example in tqdm(dataset, desc=f"{approach_name}"):
-        try:
-            pred = rag_module(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-            predictions.append(pred)
-        except Exception as e:
-            print(f"\n⚠️  Error on question {example.question[:50]}: {e}")
-            predictions.append(dspy.Prediction(answer="ERROR"))
-
-    # Evaluate
-    results = evaluate_predictions_enhanced(predictions, dataset)
+    # Duplicate questions (same doc, question and format) are run once and
+    # their prediction shared
+    unique = list({question_key(ex): ex for ex in dataset}.values())
+    if len(unique) < len(dataset):
+        print(f"Unique questions: {len(unique)} ({len(dataset) - len(unique)} duplicates reuse predictions)")
+
+    predictions = [dspy.Prediction(**p) for p in load_checkpoint(checkpoint_file)]
+    start_idx = len(predictions)
+    if predictions:
+        print(f"📂 Resuming from question {start_idx + 1}/{len(unique)} ({checkpoint_file})")
+
+    # Run predictions concurrently (results aligned with unique)
+    with progress_bar(desc=approach_name, initial=start_idx, total=len(unique)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        for chunk_start in range(start_idx, len(unique), CHECKPOINT_EVERY):
+            chunk = unique[chunk_start:chunk_start + CHECKPOINT_EVERY]
+            for example, pred in zip(chunk, run_rag_concurrently(rag_module, chunk, progress=progress)):
+                if isinstance(pred, Exception):
+                    tqdm.write(f"\n⚠️  Error on question {example.question[:50]}: {pred}")
+                    pred = dspy.Prediction(answer="ERROR", context="")
+                predictions.append(pred)
+                checkpoint.append(checkpoint_record(pred, CHECKPOINT_FIELDS))
+
+    # Expand back to one prediction per dataset question
+    by_key = {question_key(ex): pred for ex, pred in zip(unique, predictions)}
+    predictions = [by_key[question_key(ex)] for ex in dataset]
+
+    # Evaluate (per-question metrics are saved with the predictions so
+    # sharded runs can be merged without re-scoring)
+    rows = detailed_metric_rows(predictions, dataset)
+    results = aggregate_detailed_metrics(rows, [ex.answer_format for ex in dataset])
 
     # Save results
     detailed_results = {
@@ -86,14 +128,19 @@ def evaluate_approach(rag_module, dataset, approach_name: str, output_file: str)
                 'ground_truth': ex.answer,
                 'doc_id': ex.doc_id,
                 'answer_format': ex.answer_format,
-                'evidence_pages': ex.evidence_pages
+                'evidence_pages': ex.evidence_pages,
+                **row
             }
-            for ex, pred in zip(dataset, predictions)
+            for ex, pred, row in zip(dataset, predictions, rows)
         ]
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(detailed_results, f, indent=2)
+    # Per-question records are streamed one line each after the summary
+    summary = {k: v for k, v in detailed_results.items() if k != 'predictions'}
+    write_results_json(output_file, summary, detailed_results['predictions'])
+
+    # Results are saved - the checkpoint is no longer needed
+    os.remove(checkpoint_file)
 
     print(f"\n✅ {approach_name} Evaluation Complete!")
     print(f"\n📊 Overall Results:")
@@ -109,8 +156,10 @@ def evaluate_approach(rag_module, dataset, approach_name: str, output_file: str)
     return results
 
 
-def main():
+def main(shards: int = 1, shard_id: int = 0):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Sharded runs write (and resume) their own files
+    suffix = f"_shard{shard_id}of{shards}" if shards > 1 else ""
 
     print("="*80)
     print("FULL DATASET EVALUATION - Phase 1a Validation")
@@ -119,13 +168,24 @@ def main():
 
     # Setup
     print("\n📋 Setting up DSPy environment...")
-    setup_dspy_qwen()
+    # Each shard can use its own API key (separate per-key rate limits)
+    setup_dspy_qwen(persistent_cache=True,
+                    api_key=os.getenv(f"DASHSCOPE_API_KEY_{shard_id}") if shards > 1 else None)
 
     print("\n📊 Loading full dataset...")
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
     full_dataset = dataset.train_set + dataset.dev_set + dataset.test_set  # All 933 questions
     print(f"✅ Loaded {len(full_dataset)} questions")
 
+    if shards > 1:
+        full_dataset = full_dataset[shard_id::shards]
+        print(f"🔀 Shard {shard_id + 1}/{shards}: {len(full_dataset)} questions")
+
+    # Raw-question retrieval is approach-independent: fetch every context once
+    # in batched queries; approaches then read them from the retriever's
+    # persistent context cache (also across re-runs)
+    get_shared_retriever().precompute_contexts(full_dataset)
+
     # Create output directory
     results_dir = Path("dspy_implementation/full_dataset_results")
     results_dir.mkdir(exist_ok=True)
@@ -140,7 +200,8 @@ def main():
         baseline_rag,
         full_dataset,
         "Baseline RAG (No Query Opt)",
-        results_dir / f"baseline_results_{timestamp}.json"
+        results_dir / f"baseline_results_{timestamp}{suffix}.json",
+        results_dir / f"baseline_checkpoint{suffix}.msgpack"
     )
 
     # Approach 2: Enhanced RAG (default prompts)
@@ -153,7 +214,8 @@ def main():
         enhanced_rag,
         full_dataset,
         "Enhanced RAG (Default Prompts)",
-        results_dir / f"enhanced_results_{timestamp}.json"
+        results_dir / f"enhanced_results_{timestamp}{suffix}.json",
+        results_dir / f"enhanced_checkpoint{suffix}.msgpack"
     )
 
     # Approach 3: Optimized RAG (light mode)
@@ -174,24 +236,27 @@ def main():
         optimized_rag,
         full_dataset,
         "Optimized RAG (Light Mode)",
-        results_dir / f"optimized_results_{timestamp}.json"
+        results_dir / f"optimized_results_{timestamp}{suffix}.json",
+        results_dir / f"optimized_checkpoint{suffix}.msgpack"
     )
 
     # Final Comparison
     print("\n" + "="*80)
-    print("FINAL COMPARISON - Full Dataset (933 questions)")
+    print(f"FINAL COMPARISON - Full Dataset ({len(full_dataset)} questions)")
     print("="*80)
 
+    # Aggregate metrics only; per-question predictions are referenced by file
     comparison = {
-        'baseline': baseline_results,
-        'enhanced': enhanced_results,
-        'optimized': optimized_results
+        name: {**results, 'results_file': str(results_dir / f"{name}_results_{timestamp}{suffix}.json")}
+        for name, results in (('baseline', baseline_results),
+                              ('enhanced', enhanced_results),
+                              ('optimized', optimized_results))
     }
 
     print("\n📊 End-to-End Accuracy:")
-    print(f"   Baseline:  {baseline_results['end_to_end_accuracy']:.1%} ({baseline_results['end_to_end_correct']}/933)")
-    print(f"   Enhanced:  {enhanced_results['end_to_end_accuracy']:.1%} ({enhanced_results['end_to_end_correct']}/933)")
-    print(f"   Optimized: {optimized_results['end_to_end_accuracy']:.1%} ({optimized_results['end_to_end_correct']}/933)")
+    print(f"   Baseline:  {baseline_results['end_to_end_accuracy']:.1%} ({baseline_results['end_to_end_correct']}/{len(full_dataset)})")
+    print(f"   Enhanced:  {enhanced_results['end_to_end_accuracy']:.1%} ({enhanced_results['end_to_end_correct']}/{len(full_dataset)})")
+    print(f"   Optimized: {optimized_results['end_to_end_accuracy']:.1%} ({optimized_results['end_to_end_correct']}/{len(full_dataset)})")
 
     improvement_enhanced = enhanced_results['end_to_end_accuracy'] - baseline_results['end_to_end_accuracy']
     improvement_optimized = optimized_results['end_to_end_accuracy'] - baseline_results['end_to_end_accuracy']
@@ -201,9 +266,10 @@ def main():
     print(f"   Optimized vs Baseline: {improvement_optimized:+.1%}")
 
     # Save comparison
-    comparison_file = results_dir / f"comparison_{timestamp}.json"
-    with open(comparison_file, 'w') as f:
-        json.dump(comparison, f, indent=2)
+    comparison_file = results_dir / f"comparison_{timestamp}{suffix}.json"
+    with open(comparison_file, 'wb') as f:
+        # by_format has a None key (unanswerable questions)
+        f.write(orjson.dumps(comparison, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     print(f"\n💾 All results saved to: {results_dir}/")
     print(f"\nCompleted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -211,4 +277,14 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Full dataset evaluation of baseline/enhanced/optimized RAG")
+    parser.add_argument('--shards', type=int, default=1, help='Number of processes splitting the dataset')
+    parser.add_argument('--shard-id', type=int, default=0, help='This process\'s shard (0..shards-1)')
+
+    args = parser.parse_args()
+    if not 0 <= args.shard_id < args.shards:
+        parser.error("--shard-id must be in [0, --shards)")
+
+    main(shards=args.shards, shard_id=args.shard_id)
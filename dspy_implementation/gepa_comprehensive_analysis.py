@@ -20,13 +20,15 @@ from collections import defaultdict
 from datetime import datetime
 
 import dspy
+import numpy as np
 from tqdm import tqdm
 
 # Add project root
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
+from dspy_implementation.dspy_dataset import get_dataset
 from dspy_implementation.dspy_rag_enhanced import BaselineMMESGBenchRAG
+from dspy_implementation.dspy_cached_lm import CachedLM
 from dspy_implementation.dspy_metrics_enhanced import evaluate_predictions_enhanced
 from src.evaluation import eval_score
 
@@ -41,8 +43,10 @@ def load_programs():
 
     # 1. Baseline (no optimization - will create on-the-fly)
     print("\n📦 Baseline: Creating fresh BaselineMMESGBenchRAG...")
+    baseline_module = BaselineMMESGBenchRAG()
     programs['baseline'] = {
-        'module': BaselineMMESGBenchRAG(),
+        'module': baseline_module,
+        'prompts': extract_prompts(baseline_module),
         'source': 'fresh_initialization',
         'description': 'Baseline with default DSPy prompts (no optimization)'
     }
@@ -77,17 +81,7 @@ def load_programs():
         gepa_module = BaselineMMESGBenchRAG()
         gepa_module.load(gepa_path)
 
-        # Extract prompts from loaded module
-        gepa_prompts = {}
-        if hasattr(gepa_module, 'reasoning') and hasattr(gepa_module.reasoning, 'predict'):
-            sig = gepa_module.reasoning.predict.signature
-            if hasattr(sig, 'instructions'):
-                gepa_prompts['reasoning'] = sig.instructions
-
-        if hasattr(gepa_module, 'extraction') and hasattr(gepa_module.extraction, 'signature'):
-            sig = gepa_module.extraction.signature
-            if hasattr(sig, 'instructions'):
-                gepa_prompts['extraction'] = sig.instructions
+        gepa_prompts = extract_prompts(gepa_module)
 
         print(f"   ✅ Loaded GEPA module")
         print(f"      Extracted {len(gepa_prompts)} prompts")
@@ -102,33 +96,17 @@ def load_programs():
     return programs
 
 
-def extract_baseline_prompts(baseline_module):
-    """Extract prompts from baseline module."""
-    prompts = {}
-
-    # Reasoning stage
-    if hasattr(baseline_module, 'reasoning'):
-        if hasattr(baseline_module.reasoning, 'signature'):
-            sig = baseline_module.reasoning.signature
-            if hasattr(sig, 'instructions'):
-                prompts['reasoning'] = sig.instructions
-            elif hasattr(sig, '__doc__'):
-                prompts['reasoning'] = sig.__doc__ or "No instructions"
-            else:
-                prompts['reasoning'] = "Default DSPy ChainOfThought prompt"
-
-    # Extraction stage
-    if hasattr(baseline_module, 'extraction'):
-        if hasattr(baseline_module.extraction, 'signature'):
-            sig = baseline_module.extraction.signature
-            if hasattr(sig, 'instructions'):
-                prompts['extraction'] = sig.instructions
-            elif hasattr(sig, '__doc__'):
-                prompts['extraction'] = sig.__doc__ or "No instructions"
-            else:
-                prompts['extraction'] = "Default DSPy Predict prompt"
+def extract_prompts(module):
+    """
+    Instructions of every predictor in a module, keyed by stage.
 
-    return prompts
+    ChainOfThought stages are named after the module attribute
+    ('reasoning.predict' -> 'reasoning').
+    """
+    return {
+        name.removesuffix('.predict'): predictor.signature.instructions
+        for name, predictor in module.named_predictors()
+    }
 
 
 def compare_prompts(programs):
@@ -137,11 +115,8 @@ def compare_prompts(programs):
     print("PROMPT COMPARISON")
     print("="*80)
 
-    # Extract baseline prompts
-    print("\n📝 Extracting baseline prompts...")
-    baseline_prompts = extract_baseline_prompts(programs['baseline']['module'])
-
-    # GEPA prompts already extracted
+    # Prompts were extracted once at load time
+    baseline_prompts = programs['baseline']['prompts']
     gepa_prompts = programs['gepa']['prompts'] if programs['gepa'] else {}
 
     # Compare reasoning prompts
@@ -236,23 +211,18 @@ def analyze_transitions(baseline_results, gepa_results):
     print("PREDICTION TRANSITION ANALYSIS")
     print("="*80)
 
-    right_to_wrong = []
-    wrong_to_right = []
-    both_right = []
-    both_wrong = []
+    # Classify all questions at once with boolean masks
+    n = min(len(baseline_results), len(gepa_results))
+    baseline_correct = np.fromiter((r['correct'] for r in baseline_results[:n]), dtype=bool, count=n)
+    gepa_correct = np.fromiter((r['correct'] for r in gepa_results[:n]), dtype=bool, count=n)
 
-    for i, (b, g) in enumerate(zip(baseline_results, gepa_results)):
-        baseline_correct = b['correct']
-        gepa_correct = g['correct']
+    def cases(mask):
+        return [(int(i), baseline_results[i], gepa_results[i]) for i in np.flatnonzero(mask)]
 
-        if baseline_correct and not gepa_correct:
-            right_to_wrong.append((i, b, g))
-        elif not baseline_correct and gepa_correct:
-            wrong_to_right.append((i, b, g))
-        elif baseline_correct and gepa_correct:
-            both_right.append((i, b, g))
-        else:
-            both_wrong.append((i, b, g))
+    right_to_wrong = cases(baseline_correct & ~gepa_correct)
+    wrong_to_right = cases(~baseline_correct & gepa_correct)
+    both_right = cases(baseline_correct & gepa_correct)
+    both_wrong = cases(~baseline_correct & ~gepa_correct)
 
     print(f"\n📊 Transition Summary:")
     print(f"   ✅→✅ Both Correct: {len(both_right)}")
@@ -308,13 +278,15 @@ def main():
 
     # Load dataset
     print("\n📊 Loading dataset...")
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
     dev_set = dataset.dev_set
     print(f"   Dev set: {len(dev_set)} examples")
 
     # Configure DSPy
     print("\n🔧 Configuring DSPy with qwen2.5-7b-instruct...")
-    student_lm = dspy.LM(
+    # Persistent response cache: re-running the analysis replays the T=0
+    # baseline/GEPA evaluations from disk instead of calling the API
+    student_lm = CachedLM(
         model='openai/qwen2.5-7b-instruct',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
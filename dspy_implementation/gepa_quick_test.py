@@ -18,10 +18,18 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
 from dspy_implementation.dspy_rag_enhanced import BaselineMMESGBenchRAG
 from dspy_implementation.dspy_metrics_gepa_fixed import mmesgbench_answer_only_gepa_metric
+from dspy_implementation.dspy_gepa_patches import (
+    REFLECTION_MAX_TOKENS, cap_reflective_dataset, reflection_kwargs,
+    gepa_strategy, parallel_reflection
+)
+from dspy_implementation.dspy_rate_limit import RateLimitedLM
 
 # Load environment
 load_dotenv()
 
+GEPA_STRATEGY = gepa_strategy()
+PARALLEL_REFLECTION = parallel_reflection()
+
 def main():
     print("\n" + "="*80)
     print("GEPA QUICK TEST - Skip Baseline, Test Optimization")
@@ -37,14 +45,17 @@ def main():
 
     # Configure student model (qwen2.5-7b)
     print(f"\n🎓 Configuring student model: qwen2.5-7b-instruct...")
-    student_lm = dspy.LM(
+    student_lm = RateLimitedLM(dspy.LM(
         model='openai/qwen2.5-7b-instruct',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
         temperature=0.0,
         max_tokens=1024
-    )
-    dspy.configure(lm=student_lm)
+    ))
+    # Usage tracking breaks GEPA: bootstrap traces return tuples and
+    # Module.__call__ calls set_lm_usage on them. Pin it off explicitly so
+    # env defaults or MLflow autologging can't enable it mid-run
+    dspy.configure(lm=student_lm, track_usage=False)
     print(f"✅ Student model configured")
 
     # Initialize RAG module
@@ -54,13 +65,13 @@ def main():
 
     # Configure reflection model (qwen-max)
     print(f"\n🧬 Configuring reflection model: qwen-max...")
-    reflection_lm = dspy.LM(
+    reflection_lm = RateLimitedLM(dspy.LM(
         model='openai/qwen-max',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
         temperature=1.0,
-        max_tokens=4096
-    )
+        max_tokens=REFLECTION_MAX_TOKENS
+    ))
     print(f"✅ Reflection model configured")
 
     # Create GEPA optimizer
@@ -70,13 +81,18 @@ def main():
         reflection_lm=reflection_lm,
         auto='light',
         reflection_minibatch_size=3,
-        candidate_selection_strategy='pareto',
+        candidate_selection_strategy=GEPA_STRATEGY,
+        **reflection_kwargs(reflection_lm, PARALLEL_REFLECTION),
         use_merge=True,
         track_stats=True,
         seed=42
     )
     print(f"✅ GEPA optimizer created")
 
+    # DSPy's adapter reflects on every trajectory in the batch - hold it to
+    # reflection_minibatch_size so qwen-max prompts stay bounded
+    cap_reflective_dataset(optimizer)
+
     # Test GEPA.compile() - this is where it usually fails
     print(f"\n🚀 Testing GEPA.compile()...")
     print(f"   If this works, GEPA optimization can run successfully!")
@@ -14,13 +14,14 @@ Key differences from MIPROv2:
 """
 
 import sys
-import json
 import os
 from pathlib import Path
 from datetime import datetime
-from tqdm import tqdm
+from typing import Optional
 import dspy
+import orjson
 from dspy.teleprompt import GEPA
+from dspy.utils.saving import get_dependency_versions
 import mlflow
 
 # Add parent directory to path
@@ -30,33 +31,62 @@ os.chdir(project_root)
 
 from dspy_implementation.dspy_setup import setup_dspy_qwen
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
-from dspy_implementation.dspy_rag_enhanced import BaselineMMESGBenchRAG
+from dspy_implementation.dspy_rag_enhanced import BaselineMMESGBenchRAG, BatchedBaselineRAG
 from dspy_implementation.dspy_metrics_gepa import mmesgbench_answer_only_gepa_metric
 from dspy_implementation.dspy_metrics_enhanced import evaluate_predictions_enhanced
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, run_rag_batched, with_failed_placeholders
 from dspy_implementation.mlflow_tracking import DSPyMLFlowTracker, create_run_name
+from dspy_implementation.dspy_gepa_patches import (
+    REFLECTION_MAX_TOKENS, cap_reflective_dataset, reflection_kwargs,
+    parallel_reflection
+)
+from dspy_implementation.dspy_rate_limit import RateLimitedLM
+from dspy_implementation.dspy_baseline_cache import baseline_cache_file, load_baseline, save_baseline
 
+PARALLEL_REFLECTION = parallel_reflection()
 
-def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation"):
-    """Evaluate RAG module with enhanced metrics."""
-    predictions = []
 
-    for example in tqdm(examples, desc=desc):
-        try:
-            pred = rag_module(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-            predictions.append(pred)
-        except Exception as e:
-            print(f"\n⚠️  Error on question: {e}")
-            predictions.append(dspy.Prediction(answer="Failed"))
+def evaluate_rag_with_metrics(rag_module, examples, desc: str = "Evaluation",
+                              batch_size: Optional[int] = None):
+    """
+    Evaluate RAG module with enhanced metrics (questions run concurrently).
+
+    Args:
+        rag_module: BaselineMMESGBenchRAG (fresh or optimized)
+        examples: Examples to evaluate
+        desc: Progress bar label
+        batch_size: Opt-in: extract up to this many same-document answers per
+                    LM call. None (default) runs one extraction call per
+                    question - the setup GEPA optimizes for, so reported
+                    scores stay comparable
+    """
+    if batch_size:
+        results = run_rag_batched(BatchedBaselineRAG(rag_module, batch_size), examples, desc=desc)
+    else:
+        results = run_rag_concurrently(rag_module, examples, desc=desc)
+    predictions = with_failed_placeholders(results)
 
     results = evaluate_predictions_enhanced(predictions, examples)
     return results, predictions
 
 
-def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
+def save_module_json(module, path: str):
+    """
+    Save a module's state like dspy.Module.save(path) for .json paths,
+    serialized with orjson (loadable with module.load(path)).
+
+    Args:
+        module: DSPy module to save
+        path: Output .json path
+    """
+    state = module.dump_state()
+    state["metadata"] = {"dependency_versions": get_dependency_versions()}
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+
+
+def optimize_with_gepa(train_set, dev_set, mlflow_tracker, refresh_baseline: bool = False,
+                       extraction_batch_size: Optional[int] = None):
     """
     Run GEPA optimization with qwen2.5-7b student and qwen-max reflection LM.
 
@@ -80,21 +110,39 @@ def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
     print(f"\n📊 Step 1: Evaluating STUDENT BASELINE (qwen2.5-7b-instruct)...")
 
     # Configure student model (task execution)
-    student_lm = dspy.LM(
+    student_lm = RateLimitedLM(dspy.LM(
         model='openai/qwen2.5-7b-instruct',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
         temperature=0.0,  # Deterministic for evaluation
         max_tokens=1024
-    )
+    ))
 
-    dspy.configure(lm=student_lm)
+    # Usage tracking breaks GEPA: bootstrap traces return tuples and
+    # Module.__call__ calls set_lm_usage on them. Pin it off explicitly so
+    # env defaults or MLflow autologging can't enable it mid-run
+    dspy.configure(lm=student_lm, track_usage=False)
     print(f"✅ Configured student model: qwen2.5-7b-instruct")
 
     rag_student = BaselineMMESGBenchRAG()
-    baseline_results, baseline_preds = evaluate_rag_with_metrics(
-        rag_student, dev_set, "Baseline eval (student)"
-    )
+
+    # Retrieval is prompt-independent: fetch train/dev contexts once so the
+    # baseline eval and every GEPA candidate/minibatch read them from the cache
+    rag_student.retriever.precompute_contexts(train_set + dev_set)
+
+    # The student baseline only changes with the model, program, questions or
+    # evaluation setup - reuse the stored result unless asked to refresh
+    cache_file = baseline_cache_file('qwen2.5-7b-instruct', dev_set, rag_student,
+                                     extraction_batch_size=extraction_batch_size)
+    cached = None if refresh_baseline else load_baseline(cache_file)
+    if cached is not None:
+        baseline_results, baseline_preds = cached
+        print(f"📂 Reusing baseline results from {cache_file} (--refresh-baseline to re-run)")
+    else:
+        baseline_results, baseline_preds = evaluate_rag_with_metrics(
+            rag_student, dev_set, "Baseline eval (student)", batch_size=extraction_batch_size
+        )
+        save_baseline(cache_file, baseline_results, baseline_preds)
 
     print(f"\n📈 Student Baseline Results:")
     print(f"   Retrieval: {baseline_results['retrieval_accuracy']:.1%}")
@@ -112,17 +160,17 @@ def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
     # ==================================================
     print(f"\n🔧 Step 2: Configuring REFLECTION LM (qwen-max)...")
 
-    reflection_lm = dspy.LM(
+    reflection_lm = RateLimitedLM(dspy.LM(
         model='openai/qwen-max',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
         temperature=1.0,  # Higher temp for creative reflection
-        max_tokens=4096   # Longer for detailed analysis
-    )
+        max_tokens=REFLECTION_MAX_TOKENS
+    ))
 
     print(f"✅ Configured reflection model: qwen-max")
     print(f"   Temperature: 1.0 (creative prompt proposals)")
-    print(f"   Max tokens: 4096 (detailed failure analysis)")
+    print(f"   Max tokens: {REFLECTION_MAX_TOKENS} (proposed instructions)")
 
     # ==================================================
     # Step 3: Run GEPA Optimization
@@ -140,7 +188,9 @@ def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
         'auto_mode': 'light',
         'train_size': len(train_set),
         'dev_size': len(dev_set),
-        'metric_type': 'answer_only_with_feedback'
+        'metric_type': 'answer_only_with_feedback',
+        'extraction_batch_size': extraction_batch_size,
+        'parallel_reflection': PARALLEL_REFLECTION
     })
 
     print(f"\n💡 Key Insight:")
@@ -157,13 +207,18 @@ def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
         auto='light',  # Light mode for initial test
         reflection_minibatch_size=3,  # 3 examples per reflection
         candidate_selection_strategy='pareto',  # Pareto frontier selection
+        **reflection_kwargs(reflection_lm, PARALLEL_REFLECTION),
         use_merge=True,  # Enable merge-based optimization
         track_stats=True,  # Return detailed statistics
         seed=42  # Reproducibility
     )
 
+    # DSPy's adapter reflects on every trajectory in the batch - hold it to
+    # reflection_minibatch_size so qwen-max prompts stay bounded
+    cap_reflective_dataset(optimizer)
+
     print(f"✅ GEPA optimizer configured")
-    print(f"   Reflection minibatch size: 3 examples")
+    print(f"   Reflection minibatch size: {optimizer.reflection_minibatch_size} examples")
     print(f"   Selection strategy: Pareto (non-dominated candidates)")
     print(f"   Merge enabled: Yes (combines good components)")
 
@@ -195,10 +250,10 @@ def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
     print(f"\n📊 Step 4: Evaluating OPTIMIZED STUDENT...")
 
     # Ensure student model is configured for evaluation
-    dspy.configure(lm=student_lm)
+    dspy.configure(lm=student_lm, track_usage=False)
 
     opt_results, opt_preds = evaluate_rag_with_metrics(
-        optimized_rag, dev_set, "Optimized eval (student)"
+        optimized_rag, dev_set, "Optimized eval (student)", batch_size=extraction_batch_size
     )
 
     print(f"\n📈 Optimized Student Results:")
@@ -246,7 +301,7 @@ def optimize_with_gepa(train_set, dev_set, mlflow_tracker):
     return optimized_rag, opt_results, baseline_results
 
 
-def main():
+def main(refresh_baseline: bool = False, extraction_batch_size: Optional[int] = None):
     """Main execution function."""
     print("\n" + "=" * 80)
     print("GEPA OPTIMIZATION - Qwen 2.5 7B with Qwen-Max Reflection")
@@ -278,7 +333,8 @@ def main():
 
     # Run GEPA optimization
     optimized_rag, opt_results, baseline_results = optimize_with_gepa(
-        train_set, dev_set, mlflow_tracker
+        train_set, dev_set, mlflow_tracker, refresh_baseline=refresh_baseline,
+        extraction_batch_size=extraction_batch_size
     )
 
     # ==================================================
@@ -308,15 +364,16 @@ def main():
         }
     }
 
-    with open(results_file, 'w') as f:
-        json.dump(results_data, f, indent=2)
+    with open(results_file, 'wb') as f:
+        # OPT_NON_STR_KEYS: by_format breakdowns are keyed by None for unanswerable questions
+        f.write(orjson.dumps(results_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     print(f"   Saved to: {results_file}")
 
     # Save optimized module
     module_file = f"dspy_implementation/optimized_modules/gepa_qwen7b_{timestamp}.json"
     os.makedirs("dspy_implementation/optimized_modules", exist_ok=True)
-    optimized_rag.save(module_file)
+    save_module_json(optimized_rag, module_file)
     print(f"   Optimized module: {module_file}")
 
     # Final summary
@@ -333,4 +390,14 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="GEPA optimization with qwen2.5-7b student")
+    parser.add_argument('--refresh-baseline', action='store_true',
+                        help='Re-run the student baseline instead of reusing the stored result')
+    parser.add_argument('--extraction-batch-size', type=int, default=None,
+                        help='Extract up to N same-document answers per LM call in the dev '
+                             'evaluations (default: one call per question)')
+
+    args = parser.parse_args()
+    main(refresh_baseline=args.refresh_baseline, extraction_batch_size=args.extraction_batch_size)
@@ -25,10 +25,19 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dspy_implementation.dspy_dataset import MMESGBenchDataset
 from dspy_implementation.dspy_rag_enhanced import BaselineMMESGBenchRAG
 from dspy_implementation.dspy_metrics_gepa_fixed import mmesgbench_answer_only_gepa_metric
+from dspy_implementation.dspy_gepa_patches import (
+    REFLECTION_MAX_TOKENS, cap_reflective_dataset, reflection_kwargs,
+    gepa_strategy, parallel_reflection
+)
+from dspy_implementation.dspy_rate_limit import RateLimitedLM
+from dspy_implementation.dspy_batch_lm import OfflineBatchLM
 
 # Load environment
 load_dotenv()
 
+GEPA_STRATEGY = gepa_strategy()
+PARALLEL_REFLECTION = parallel_reflection()
+
 def main():
     print("\n" + "="*80)
     print("GEPA OPTIMIZATION - SKIP BASELINE (Fast Development Mode)")
@@ -54,21 +63,19 @@ def main():
     print(f"   Train: {len(train_set)} examples")
     print(f"   Dev: {len(dev_set)} examples")
 
-    # Log dataset info
-    mlflow.log_param("train_size", len(train_set))
-    mlflow.log_param("dev_size", len(dev_set))
-    mlflow.log_param("skip_baseline", True)
-
     # Configure student model (qwen2.5-7b)
     print(f"\n🎓 Configuring student model: qwen2.5-7b-instruct...")
-    student_lm = dspy.LM(
+    student_lm = RateLimitedLM(dspy.LM(
         model='openai/qwen2.5-7b-instruct',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
         temperature=0.0,
         max_tokens=1024
-    )
-    dspy.configure(lm=student_lm)
+    ))
+    # Usage tracking breaks GEPA: bootstrap traces return tuples and
+    # Module.__call__ calls set_lm_usage on them. Pin it off explicitly so
+    # env defaults or MLflow autologging can't enable it mid-run
+    dspy.configure(lm=student_lm, track_usage=False)
     print(f"✅ Student model configured")
 
     # Initialize RAG module
@@ -76,15 +83,19 @@ def main():
     rag_student = BaselineMMESGBenchRAG()
     print(f"✅ RAG module initialized")
 
+    # Retrieval is prompt-independent: fetch train/dev contexts once so
+    # every GEPA candidate/minibatch reads them from the cache
+    rag_student.retriever.precompute_contexts(train_set + dev_set)
+
     # Configure reflection model (qwen-max)
     print(f"\n🧬 Configuring reflection model: qwen-max...")
-    reflection_lm = dspy.LM(
+    reflection_lm = RateLimitedLM(dspy.LM(
         model='openai/qwen-max',
         api_key=os.getenv("DASHSCOPE_API_KEY"),
         api_base='https://dashscope.aliyuncs.com/compatible-mode/v1',
         temperature=1.0,  # Higher temp for creative reflection
-        max_tokens=4096   # Longer for detailed analysis
-    )
+        max_tokens=REFLECTION_MAX_TOKENS
+    ))
     print(f"✅ Reflection model configured")
 
     # Create GEPA optimizer
@@ -94,20 +105,31 @@ def main():
         reflection_lm=reflection_lm,
         auto='light',  # Light mode: ~10-20 candidates, faster
         reflection_minibatch_size=3,
-        candidate_selection_strategy='pareto',
+        candidate_selection_strategy=GEPA_STRATEGY,
+        **reflection_kwargs(reflection_lm, PARALLEL_REFLECTION),
         use_merge=True,
         track_stats=True,
         seed=42
     )
     print(f"✅ GEPA optimizer created")
 
-    # Log GEPA parameters
-    mlflow.log_param("optimizer", "GEPA")
-    mlflow.log_param("gepa_mode", "light")
-    mlflow.log_param("reflection_lm", "qwen-max")
-    mlflow.log_param("student_lm", "qwen2.5-7b-instruct")
-    mlflow.log_param("reflection_minibatch_size", 3)
-    mlflow.log_param("selection_strategy", "pareto")
+    # DSPy's adapter reflects on every trajectory in the batch - hold it to
+    # reflection_minibatch_size so qwen-max prompts stay bounded
+    cap_reflective_dataset(optimizer)
+
+    # Log dataset info + GEPA parameters (one tracking-store request)
+    mlflow.log_params({
+        "train_size": len(train_set),
+        "dev_size": len(dev_set),
+        "skip_baseline": True,
+        "optimizer": "GEPA",
+        "gepa_mode": "light",
+        "reflection_lm": "qwen-max",
+        "student_lm": "qwen2.5-7b-instruct",
+        "reflection_minibatch_size": optimizer.reflection_minibatch_size,
+        "selection_strategy": GEPA_STRATEGY,
+        "parallel_reflection": PARALLEL_REFLECTION
+    })
 
     # Run GEPA optimization (NO BASELINE STEP!)
     print(f"\n" + "="*80)
@@ -137,15 +159,22 @@ def main():
         mlflow.log_artifact(output_file)
 
         # Evaluate optimized model
-        print(f"\n📊 Evaluating optimized model on dev set...")
+        print(f"\n📊 Evaluating optimized model on dev set (DashScope Batch API)...")
         from dspy.evaluate import Evaluate
         evaluator = Evaluate(
             devset=dev_set,
             metric=lambda gold, pred, trace=None: mmesgbench_answer_only_gepa_metric(gold, pred, trace, pred_name=None),
-            num_threads=1,
+            # One thread per question: each stage's requests for the whole
+            # dev set queue up together and go out as a single batch job
+            num_threads=len(dev_set),
             display_progress=True
         )
-        optimized_score = evaluator(optimized_rag)
+        # Latency doesn't matter here - batch jobs are billed at a discount
+        # and are not subject to the per-minute rate limit
+        batch_lm = OfflineBatchLM('qwen2.5-7b-instruct', batch_size=len(dev_set),
+                                  temperature=0.0, max_tokens=1024)
+        with dspy.context(lm=batch_lm):
+            optimized_score = evaluator(optimized_rag)
 
         print(f"\n📈 RESULTS:")
         print(f"   Baseline (known): 58.1%")
@@ -153,9 +182,11 @@ def main():
         print(f"   Improvement: {(optimized_score - 0.581)*100:+.1f}%")
 
         # Log final metrics
-        mlflow.log_metric("baseline_accuracy", 0.581)
-        mlflow.log_metric("optimized_accuracy", optimized_score)
-        mlflow.log_metric("improvement", optimized_score - 0.581)
+        mlflow.log_metrics({
+            "baseline_accuracy": 0.581,
+            "optimized_accuracy": optimized_score,
+            "improvement": optimized_score - 0.581
+        })
 
         mlflow.end_run()
         return optimized_rag, optimized_score
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Merge Sharded Full Dataset Results
+
+Combines the per-shard results files of one approach written by
+`full_dataset_evaluation.py --shards K --shard-id I` and recomputes the
+aggregate metrics from the saved per-question metric columns.
+
+Usage:
+    python dspy_implementation/merge_full_dataset_shards.py \
+        dspy_implementation/full_dataset_results/baseline_results_*_shard*of4.json \
+        --output dspy_implementation/full_dataset_results/baseline_results_merged.json
+"""
+
+import sys
+from pathlib import Path
+from datetime import datetime
+import orjson
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dspy_implementation.dspy_metrics_enhanced import aggregate_detailed_metrics
+from dspy_implementation.dspy_metrics import write_results_json
+
+
+def merge_shards(shard_files, output_file):
+    """
+    Concatenate shard predictions and recompute overall metrics.
+
+    Args:
+        shard_files: Results JSON paths, one per shard
+        output_file: Merged results JSON path
+
+    Returns:
+        dict: Merged overall metrics (evaluate_predictions_enhanced format)
+    """
+    summaries = []
+    predictions = []
+    for shard_file in shard_files:
+        with open(shard_file, 'rb') as f:
+            shard = orjson.loads(f.read())
+        predictions.extend(shard.pop('predictions'))
+        summaries.append(shard)
+        print(f"   {shard_file}: {shard['dataset_size']} questions")
+
+    approaches = {s['approach'] for s in summaries}
+    if len(approaches) > 1:
+        raise ValueError(f"Shard files mix approaches: {sorted(approaches)}")
+
+    results = aggregate_detailed_metrics(predictions, [p['answer_format'] for p in predictions])
+
+    merged = {
+        'approach': summaries[0]['approach'],
+        'timestamp': datetime.now().isoformat(),
+        'dataset_size': len(predictions),
+        'overall_metrics': results,
+        'shard_files': [str(path) for path in shard_files]
+    }
+    write_results_json(output_file, merged, predictions)
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge sharded full dataset evaluation results")
+    parser.add_argument('shard_files', nargs='+', help='Per-shard results JSON files (one approach)')
+    parser.add_argument('--output', required=True, help='Merged results JSON path')
+
+    args = parser.parse_args()
+
+    print(f"🔀 Merging {len(args.shard_files)} shard files...")
+    results = merge_shards(args.shard_files, args.output)
+
+    print(f"\n📊 Merged Results ({results['total']} questions):")
+    print(f"   Retrieval: {results['retrieval_accuracy']:.1%} ({results['retrieval_correct']}/{results['total']})")
+    print(f"   Answer:    {results['answer_accuracy']:.1%} ({results['answer_correct']}/{results['total']})")
+    print(f"   E2E:       {results['end_to_end_accuracy']:.1%} ({results['end_to_end_correct']}/{results['total']})")
+    print(f"\n💾 Merged results saved to: {args.output}")
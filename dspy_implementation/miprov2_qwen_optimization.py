@@ -20,13 +20,12 @@ Optimization Strategy:
 """
 
 import sys
-import json
 import os
 from pathlib import Path
 from datetime import datetime
 import dspy
+import orjson
 from dspy.teleprompt import MIPROv2
-from tqdm import tqdm
 
 # Add parent directory to path
 project_root = Path(__file__).parent.parent
@@ -36,15 +35,52 @@ sys.path.insert(0, str(project_root))
 os.chdir(project_root)
 
 from dspy_implementation.dspy_setup import setup_dspy_qwen
-from dspy_implementation.dspy_dataset import MMESGBenchDataset
+from dspy_implementation.dspy_dataset import get_dataset
 from dspy_implementation.dspy_rag_module import MMESGBenchRAG
 from dspy_implementation.dspy_metrics import mmesgbench_accuracy, evaluate_predictions
+from dspy_implementation.dspy_async_eval import run_rag_concurrently, with_failed_placeholders, progress_bar
+from dspy_implementation.dspy_checkpoint import CheckpointWriter
+
+# Dev predictions are appended to the checkpoint every this many questions
+CHECKPOINT_EVERY = 10
 
 
 # ============================================================================
 # MIPROv2 Optimization
 # ============================================================================
 
+def predict_with_checkpoint(rag_module, examples, checkpoint_file: str, desc: str):
+    """
+    Predictions for examples (in order), appending each one to a msgpack
+    checkpoint as its chunk completes, so a crash late in a long run keeps
+    the predictions made so far.
+
+    Args:
+        rag_module: RAG module to evaluate
+        examples: DSPy examples
+        checkpoint_file: msgpack checkpoint path (read with load_checkpoint)
+        desc: Progress bar description
+
+    Returns:
+        List of predictions aligned with examples (failures as "Failed")
+    """
+    predictions = []
+    with progress_bar(desc=desc, total=len(examples)) as progress, \
+            CheckpointWriter(checkpoint_file) as checkpoint:
+        for chunk_start in range(0, len(examples), CHECKPOINT_EVERY):
+            chunk = examples[chunk_start:chunk_start + CHECKPOINT_EVERY]
+            chunk_preds = with_failed_placeholders(run_rag_concurrently(rag_module, chunk, progress=progress))
+            for idx, (example, pred) in enumerate(zip(chunk, chunk_preds), start=chunk_start):
+                predictions.append(pred)
+                checkpoint.append({
+                    'idx': idx,
+                    'question': example.question,
+                    'answer': pred.get('answer'),
+                    'ground_truth': example.answer
+                })
+    return predictions
+
+
 def optimize_with_miprov2(train_set, dev_set, num_candidates: int = 10,
                           init_temperature: float = 1.0, verbose: bool = True):
     """
@@ -73,23 +109,16 @@ def optimize_with_miprov2(train_set, dev_set, num_candidates: int = 10,
     baseline_rag = MMESGBenchRAG()
     print("✅ MMESGBenchRAG module initialized")
 
+    # Retrieval is prompt-independent: fetch train/dev contexts once (batched)
+    # so every MIPROv2 trial and the dev evaluation read them from the cache
+    baseline_rag.retriever.precompute_contexts(train_set + dev_set)
+
     # Evaluate baseline on small train sample
     print("\n📊 Evaluating baseline on training sample (10 questions)...")
-    baseline_train_preds = []
     sample_size = min(10, len(train_set))
-
-    for example in tqdm(train_set[:sample_size], desc="Baseline eval"):
-        try:
-            pred = baseline_rag(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-            baseline_train_preds.append(pred)
-        except Exception as e:
-            print(f"\n⚠️  Error on question: {e}")
-            # Create empty prediction for failed questions
-            baseline_train_preds.append(dspy.Prediction(answer="Failed"))
+    baseline_train_preds = with_failed_placeholders(
+        run_rag_concurrently(baseline_rag, train_set[:sample_size], desc="Baseline eval")
+    )
 
     baseline_train_results = evaluate_predictions(
         baseline_train_preds,
@@ -140,19 +169,9 @@ def optimize_with_miprov2(train_set, dev_set, num_candidates: int = 10,
 
     # Evaluate optimized model on dev set
     print("\n📊 Evaluating optimized model on dev set (93 questions)...")
-    dev_preds = []
-
-    for example in tqdm(dev_set, desc="Dev evaluation"):
-        try:
-            pred = optimized_rag(
-                question=example.question,
-                doc_id=example.doc_id,
-                answer_format=example.answer_format
-            )
-            dev_preds.append(pred)
-        except Exception as e:
-            print(f"\n⚠️  Error on dev question: {e}")
-            dev_preds.append(dspy.Prediction(answer="Failed"))
+    dev_checkpoint = f"checkpoints/miprov2_qwen_dev_{datetime.now().strftime('%Y%m%d_%H%M%S')}.msgpack"
+    dev_preds = predict_with_checkpoint(optimized_rag, dev_set, dev_checkpoint, "Dev evaluation")
+    print(f"   Dev predictions checkpointed to: {dev_checkpoint}")
 
     dev_results = evaluate_predictions(dev_preds, dev_set)
 
@@ -179,25 +198,22 @@ def optimize_with_miprov2(train_set, dev_set, num_candidates: int = 10,
 # Main Execution
 # ============================================================================
 
-def main():
-    """
-    Main execution flow for MIPROv2 optimization.
+def init():
     """
-    print("=" * 80)
-    print("MIPROv2 Optimization for MMESGBench (Qwen Baseline)")
-    print("=" * 80)
-    print(f"\nStarted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"\nBaseline: TBD (PostgreSQL + Qwen embeddings on 20% train split)")
-    print(f"Target: Baseline + 1-2% improvement")
+    One-time setup shared by every optimization run in this process.
 
+    Returns:
+        Tuple of (train_set, dev_set, test_set)
+    """
     # Initialize DSPy
     print(f"\n📋 Setting up DSPy environment...")
-    setup_dspy_qwen()
+    # Trials re-send identical prompts (temperature 0) - serve repeats from disk
+    setup_dspy_qwen(persistent_cache=True)
     print(f"✅ DSPy configured with Qwen Max")
 
-    # Load dataset
+    # Load dataset (process-wide instance, splits cached on disk)
     print(f"\n📊 Loading MMESGBench dataset with corrections...")
-    dataset = MMESGBenchDataset()
+    dataset = get_dataset()
 
     train_set = dataset.train_set
     dev_set = dataset.dev_set
@@ -210,12 +226,35 @@ def main():
     print(f"   Documents: 45/45 (100% coverage)")
     print(f"   Total chunks: 54,608")
 
+    return train_set, dev_set, test_set
+
+
+def run(train_set, dev_set, num_candidates: int = 10, init_temperature: float = 1.0):
+    """
+    Optimize, save the module and results, and print the summary.
+
+    Args:
+        train_set: Training examples
+        dev_set: Development examples
+        num_candidates: Number of instruction candidates to generate
+        init_temperature: Initial temperature for candidate generation
+
+    Returns:
+        Tuple of (optimized RAG module, dev results dict)
+    """
+    print("=" * 80)
+    print("MIPROv2 Optimization for MMESGBench (Qwen Baseline)")
+    print("=" * 80)
+    print(f"\nStarted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\nBaseline: TBD (PostgreSQL + Qwen embeddings on 20% train split)")
+    print(f"Target: Baseline + 1-2% improvement")
+
     # Run MIPROv2 optimization
     optimized_rag, dev_results = optimize_with_miprov2(
         train_set=train_set,
         dev_set=dev_set,
-        num_candidates=10,
-        init_temperature=1.0,
+        num_candidates=num_candidates,
+        init_temperature=init_temperature,
         verbose=True
     )
 
@@ -244,8 +283,8 @@ def main():
             "train_size": len(train_set),
             "optimization_subset": min(100, len(train_set)),
             "dev_size": len(dev_set),
-            "num_candidates": 10,
-            "init_temperature": 1.0
+            "num_candidates": num_candidates,
+            "init_temperature": init_temperature
         },
         "dev_results": {
             "accuracy": dev_results['accuracy'],
@@ -260,8 +299,8 @@ def main():
         }
     }
 
-    with open(results_file, 'w') as f:
-        json.dump(detailed_results, f, indent=2)
+    # OPT_NON_STR_KEYS: format_breakdown is keyed by None for unanswerable questions
+    Path(results_file).write_bytes(orjson.dumps(detailed_results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
 
     print(f"\n💾 Detailed results saved to: {results_file}")
 
@@ -292,6 +331,29 @@ def main():
     return optimized_rag, dev_results
 
 
+def main(num_candidates: int = 10, init_temperature: float = 1.0):
+    """
+    Main execution flow for MIPROv2 optimization.
+    """
+    train_set, dev_set, _ = init()
+    return run(train_set, dev_set, num_candidates=num_candidates, init_temperature=init_temperature)
+
+
+def sweep(configs):
+    """
+    Run several optimizations in one process, setting up DSPy and loading
+    the dataset once (retrieval and LM caches stay warm between runs).
+
+    Args:
+        configs: List of run() keyword dicts, e.g. [{'num_candidates': 5}, {'num_candidates': 10}]
+
+    Returns:
+        List of (optimized RAG module, dev results dict), one per config
+    """
+    train_set, dev_set, _ = init()
+    return [run(train_set, dev_set, **cfg) for cfg in configs]
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -299,8 +361,10 @@ if __name__ == "__main__":
     parser.add_argument(
         "--num-candidates",
         type=int,
-        default=10,
-        help="Number of instruction candidates to generate (default: 10)"
+        nargs='+',
+        default=[10],
+        help="Number of instruction candidates to generate (default: 10); "
+             "several values run a sweep in one process"
     )
     parser.add_argument(
         "--temperature",
@@ -311,9 +375,13 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    # Run optimization
-    optimized_module, results = main()
+    # Run optimization (one run per --num-candidates value)
+    runs = sweep([
+        {'num_candidates': num_candidates, 'init_temperature': args.temperature}
+        for num_candidates in args.num_candidates
+    ])
 
     print("\n✅ MIPROv2 optimization pipeline complete!")
-    print(f"   Dev accuracy: {results['accuracy']:.1%}")
+    for num_candidates, (optimized_module, results) in zip(args.num_candidates, runs):
+        print(f"   Dev accuracy ({num_candidates} candidates): {results['accuracy']:.1%}")
     print("   Ready for test set evaluation")
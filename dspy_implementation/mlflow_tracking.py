@@ -5,7 +5,7 @@ Tracks metrics, parameters, and artifacts for RAG optimization
 """
 
 import mlflow
-import json
+import orjson
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional
@@ -41,6 +41,9 @@ class DSPyMLFlowTracker:
             mlruns_dir.mkdir(exist_ok=True)
             mlflow.set_tracking_uri(f"file://{mlruns_dir}")
 
+        # Only explicit log_* calls are recorded (no autolog hooks on DSPy/LiteLLM calls)
+        mlflow.autolog(disable=True)
+
         # Create or get experiment
         try:
             self.experiment = mlflow.set_experiment(experiment_name)
@@ -72,7 +75,7 @@ class DSPyMLFlowTracker:
             print(f"⚠️  Ending previous run {self.run_id}")
             self.end_run()
 
-        self.run = mlflow.start_run(run_name=run_name, tags=tags or {})
+        self.run = mlflow.start_run(run_name=run_name, tags=tags or {}, log_system_metrics=False)
         self.run_id = self.run.info.run_id
 
         print(f"\n🚀 Started MLFlow run: {run_name}")
@@ -91,11 +94,16 @@ class DSPyMLFlowTracker:
             print("⚠️  No active run. Call start_run() first.")
             return
 
-        for key, value in params.items():
-            try:
-                mlflow.log_param(key, value)
-            except Exception as e:
-                print(f"⚠️  Could not log param {key}: {e}")
+        try:
+            # One batched request instead of one per parameter
+            mlflow.log_params(params)
+        except Exception:
+            # Fall back per key so one bad value doesn't drop the rest
+            for key, value in params.items():
+                try:
+                    mlflow.log_param(key, value)
+                except Exception as e:
+                    print(f"⚠️  Could not log param {key}: {e}")
 
         print(f"📝 Logged {len(params)} parameters")
 
@@ -115,9 +123,11 @@ class DSPyMLFlowTracker:
         self.log_params(config)
 
         # Log baseline metrics (skip nested dicts)
-        for key, value in metrics.items():
-            if isinstance(value, (int, float)):
-                mlflow.log_metric(f"baseline_{key}", value)
+        mlflow.log_metrics({
+            f"baseline_{key}": value
+            for key, value in metrics.items()
+            if isinstance(value, (int, float))
+        })
 
         print(f"📊 Logged baseline metrics:")
         for key, value in metrics.items():
@@ -136,11 +146,16 @@ class DSPyMLFlowTracker:
             print("⚠️  No active run. Call start_run() first.")
             return
 
-        for key, value in metrics.items():
-            try:
-                mlflow.log_metric(key, value, step=step)
-            except Exception as e:
-                print(f"⚠️  Could not log metric {key}: {e}")
+        try:
+            # One batched request; skip nested dicts (e.g., by_format), which
+            # would fail the whole batch
+            mlflow.log_metrics({
+                key: value
+                for key, value in metrics.items()
+                if isinstance(value, (int, float))
+            }, step=step)
+        except Exception as e:
+            print(f"⚠️  Could not log metrics for step {step}: {e}")
 
     def log_final_results(self, metrics: Dict[str, float], artifacts: Optional[Dict[str, str]] = None):
         """
@@ -155,9 +170,11 @@ class DSPyMLFlowTracker:
             return
 
         # Log final metrics (skip nested dicts)
-        for key, value in metrics.items():
-            if isinstance(value, (int, float)):
-                mlflow.log_metric(f"final_{key}", value)
+        mlflow.log_metrics({
+            f"final_{key}": value
+            for key, value in metrics.items()
+            if isinstance(value, (int, float))
+        })
 
         print(f"\n📊 Final Results:")
         for key, value in metrics.items():
@@ -185,14 +202,15 @@ class DSPyMLFlowTracker:
             print("⚠️  No active run. Call start_run() first.")
             return
 
-        # Save to temporary JSON file
-        temp_path = Path(f"/tmp/{artifact_name}_{self.run_id}.json")
-        with open(temp_path, 'w') as f:
-            json.dump(model_data, f, indent=2)
+        # Log straight to the artifact store (no temp file of our own);
+        # orjson keeps None-keyed format breakdowns and numpy values
+        text = orjson.dumps(
+            model_data,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode('utf-8')
 
-        # Log artifact
         try:
-            mlflow.log_artifact(str(temp_path), "model")
+            mlflow.log_text(text, f"model/{artifact_name}.json")
             print(f"📦 Logged model artifact: {artifact_name}")
         except Exception as e:
             print(f"⚠️  Could not log model artifact: {e}")
@@ -211,13 +229,16 @@ class DSPyMLFlowTracker:
 
         print(f"\n📊 Baseline vs Optimized:")
 
+        improvements = {}
         for key in baseline_metrics:
             if key in optimized_metrics:
                 baseline = baseline_metrics[key]
                 optimized = optimized_metrics[key]
-                improvement = optimized - baseline
+                if not isinstance(baseline, (int, float)) or not isinstance(optimized, (int, float)):
+                    continue  # Skip nested dicts (e.g., by_format)
 
-                mlflow.log_metric(f"improvement_{key}", improvement)
+                improvement = optimized - baseline
+                improvements[f"improvement_{key}"] = improvement
 
                 if isinstance(baseline, float) and isinstance(optimized, float):
                     print(f"   {key}:")
@@ -225,6 +246,8 @@ class DSPyMLFlowTracker:
                     print(f"      Optimized: {optimized:.1%}")
                     print(f"      Improvement: {improvement:+.1%}")
 
+        mlflow.log_metrics(improvements)
+
     def end_run(self):
         """End current MLFlow run."""
         if self.run:
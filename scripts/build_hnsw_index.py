@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Build an HNSW index over the LangChain PGVector embeddings table.
+
+The retriever queries langchain_pg_embedding with cosine distance (<=>),
+which without an ANN index is a sequential scan over all 54,608 chunks.
+This script:
+1. Pins the untyped `embedding` column to vector(1024) (HNSW needs a
+   fixed dimension). This rewrites the table under an ACCESS EXCLUSIVE
+   lock - retrieval blocks until it finishes, so run it while no
+   evaluation is active. It is skipped once the column is pinned.
+2. Builds an HNSW index with vector_cosine_ops (matches LangChain's
+   default COSINE distance strategy), CONCURRENTLY so retrieval keeps
+   working during the (long) index build
+
+Requires pgvector >= 0.8: every query filters on one document, and with
+ef_search=40 a filtered HNSW scan returns far fewer than top_k chunks
+unless hnsw.iterative_scan keeps it going. DSPyPostgresRetriever turns
+iterative_scan on (PG_HNSW_ITERATIVE_SCAN, default relaxed_order) whenever
+it finds this index, and applies hnsw.ef_search from PG_HNSW_EF_SEARCH.
+
+With --halfvec, the index is built on an fp16 expression instead,
+(embedding::halfvec(dims)) with halfvec_cosine_ops (pgvector >= 0.7). The
+column itself stays vector(dims): LangChain's similarity_search compares
+against it, so only DSPyPostgresRetriever's batched query (PG_HALFVEC=true)
+searches the halfvec index; LangChain fallbacks scan at full precision.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.config import config
+
+TABLE_NAME = "langchain_pg_embedding"
+INDEX_NAME = "langchain_pg_embedding_hnsw_idx"
+HALFVEC_INDEX_NAME = "langchain_pg_embedding_halfvec_hnsw_idx"
+
+
+# Filtered HNSW searches need hnsw.iterative_scan (pgvector 0.8); halfvec
+# needs 0.7, so this covers both indexes
+MIN_PGVECTOR_VERSION = (0, 8)
+
+
+def check_pgvector_version(conn) -> str:
+    """Return installed pgvector version, failing if it is below MIN_PGVECTOR_VERSION"""
+    version = conn.execute(
+        text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    ).scalar()
+    if not version:
+        raise RuntimeError("pgvector extension is not installed")
+    major, minor = (int(part) for part in version.split('.')[:2])
+    if (major, minor) < MIN_PGVECTOR_VERSION:
+        raise RuntimeError(
+            f"pgvector {version} lacks hnsw.iterative_scan: doc_id-filtered HNSW queries would "
+            f"return fewer than top_k chunks. Upgrade to pgvector >= "
+            f"{'.'.join(map(str, MIN_PGVECTOR_VERSION))} before building the index"
+        )
+    return version
+
+
+def pin_embedding_dimension(conn, dims: int):
+    """
+    Convert `embedding` from untyped vector to vector(dims).
+
+    ALTER COLUMN TYPE rewrites the table under an ACCESS EXCLUSIVE lock, so
+    it only runs if the column isn't pinned yet.
+    """
+    column_type = conn.execute(text(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        f"WHERE attrelid = '{TABLE_NAME}'::regclass AND attname = 'embedding'"
+    )).scalar()
+    if column_type == f"vector({dims})":
+        print(f"✅ {TABLE_NAME}.embedding already vector({dims})")
+        return
+
+    found_dims = conn.execute(
+        text(f"SELECT DISTINCT vector_dims(embedding) FROM {TABLE_NAME}")
+    ).scalars().all()
+
+    if found_dims != [dims]:
+        raise RuntimeError(f"Expected all embeddings to have {dims} dims, found {found_dims}")
+
+    conn.execute(text(
+        f"ALTER TABLE {TABLE_NAME} ALTER COLUMN embedding TYPE vector({dims})"
+    ))
+    print(f"✅ Pinned {TABLE_NAME}.embedding to vector({dims})")
+
+
+def build_hnsw_index(conn, m: int, ef_construction: int, maintenance_work_mem: str):
+    """Create HNSW cosine index (CONCURRENTLY, so retrieval keeps working)"""
+    conn.execute(text(f"SET maintenance_work_mem = '{maintenance_work_mem}'"))
+    conn.execute(text(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} "
+        f"ON {TABLE_NAME} USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = {m}, ef_construction = {ef_construction})"
+    ))
+    conn.execute(text(f"ANALYZE {TABLE_NAME}"))
+    print(f"✅ HNSW index ready: {INDEX_NAME} (m={m}, ef_construction={ef_construction})")
+
+
+def build_halfvec_index(conn, dims: int, m: int, ef_construction: int, maintenance_work_mem: str):
+    """Create HNSW cosine index over fp16 embeddings (halfvec expression)"""
+    conn.execute(text(f"SET maintenance_work_mem = '{maintenance_work_mem}'"))
+    conn.execute(text(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {HALFVEC_INDEX_NAME} "
+        f"ON {TABLE_NAME} USING hnsw ((embedding::halfvec({dims})) halfvec_cosine_ops) "
+        f"WITH (m = {m}, ef_construction = {ef_construction})"
+    ))
+    conn.execute(text(f"ANALYZE {TABLE_NAME}"))
+    print(f"✅ halfvec HNSW index ready: {HALFVEC_INDEX_NAME} (m={m}, ef_construction={ef_construction})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build HNSW index for pgvector retrieval")
+    parser.add_argument("--dims", type=int, default=1024,
+                        help="Embedding dimension (default: 1024, Qwen text-embedding-v4)")
+    parser.add_argument("--m", type=int, default=16,
+                        help="HNSW graph degree (default: 16)")
+    parser.add_argument("--ef-construction", type=int, default=200,
+                        help="HNSW build candidate list size (default: 200)")
+    parser.add_argument("--maintenance-work-mem", type=str, default="1GB",
+                        help="Memory for index build (default: 1GB)")
+    parser.add_argument("--halfvec", action="store_true",
+                        help="Build the fp16 (halfvec) index used with PG_HALFVEC=true")
+    parser.add_argument("--drop", action="store_true",
+                        help="Drop the HNSW index instead of building it")
+    args = parser.parse_args()
+
+    engine = create_engine(config.database.url)
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        index_name = HALFVEC_INDEX_NAME if args.halfvec else INDEX_NAME
+        if args.drop:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+            print(f"✅ Dropped {index_name}")
+            return
+
+        # Before pinning: don't rewrite the table for an index we can't use
+        version = check_pgvector_version(conn)
+        print(f"🔍 pgvector version: {version}")
+
+        pin_embedding_dimension(conn, args.dims)
+        if args.halfvec:
+            build_halfvec_index(conn, args.dims, args.m, args.ef_construction, args.maintenance_work_mem)
+        else:
+            build_hnsw_index(conn, args.m, args.ef_construction, args.maintenance_work_mem)
+
+    print(f"\n💡 Search settings: hnsw.ef_search={config.database.hnsw_ef_search}, "
+          f"hnsw.iterative_scan={config.database.hnsw_iterative_scan}, "
+          f"halfvec={config.database.halfvec}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Embed every MMESGBench question once, ahead of any evaluation run.
+
+The question set is fixed (933 questions across train/dev/test), so all
+query vectors are fetched in batched DashScope requests and written to the
+retriever's persistent query-embedding cache. Every later retrieval
+(single or batched, any script) then reads its vector from the cache
+instead of calling the embedding API.
+
+With --contexts, the top-k contexts are also retrieved in batched pgvector
+queries and stored in the retriever's context cache.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dspy_implementation.dspy_dataset import get_dataset
+from dspy_implementation.dspy_postgres_retriever import get_shared_retriever
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute query embeddings for all MMESGBench questions")
+    parser.add_argument("--contexts", action="store_true",
+                        help="Also retrieve and cache the top-k contexts")
+    parser.add_argument("--top-k", type=int, default=5,
+                        help="Chunks per context, must match the evaluated modules (default: 5)")
+    args = parser.parse_args()
+
+    dataset = get_dataset()
+    examples = dataset.train_set + dataset.dev_set + dataset.test_set
+    print(f"📊 {len(examples)} questions")
+
+    retriever = get_shared_retriever()
+    retriever.precompute_query_embeddings(ex.question for ex in examples)
+
+    if args.contexts:
+        retriever.precompute_contexts(examples, top_k=args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -41,12 +41,18 @@ class DatabaseConfig:
     """Database configuration"""
     url: str
     collection_name: str
+    hnsw_ef_search: int
+    hnsw_iterative_scan: str
+    halfvec: bool
 
     @classmethod
     def from_env(cls) -> 'DatabaseConfig':
         return cls(
             url=os.getenv("PG_URL", ""),
-            collection_name=os.getenv("ESG_COLLECTION_NAME", "mmesgbench_esg_reasoning")
+            collection_name=os.getenv("ESG_COLLECTION_NAME", "mmesgbench_esg_reasoning"),
+            hnsw_ef_search=int(os.getenv("PG_HNSW_EF_SEARCH", "40")),
+            hnsw_iterative_scan=os.getenv("PG_HNSW_ITERATIVE_SCAN", "relaxed_order"),
+            halfvec=os.getenv("PG_HALFVEC", "false").lower() == "true"
         )
 
 